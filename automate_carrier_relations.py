@@ -1,115 +1,227 @@
 # Copyright (c) 2023 Ameed Jamous - TelecomsXChange.com
 # This script is also compatiable with NeuTrafix Market Place API
 
-import requests
-from requests.auth import HTTPDigestAuth
+import argparse
 import logging
-
-# Set up logging
+from tcxc_client import TCXCAPIError, fan_out, get_client, iter_market_rates
+from tcxc_metrics import metrics
+from tcxc_logging import log_body, setup_logging, truncate
+from market_scan import load_prefixes, scan_prefixes
+from reference_cache import seller_names
+from interconnect_ledger import InterconnectLedger, reconcile, reconcile_days
+
+# Root logger, handlers are added by setup_logging() in tcxc_logging.py
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-# Log to file
-file_handler = logging.FileHandler('automate_cr.log')
-file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
 
-# Also log to console
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+# Shared TCXC/NeuTrafix client, credentials and base URL are configured in tcxc_client.py (set by main)
+client = None
 
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# API endpoints
+interconnect_endpoint = '/buyers/interconnect'
 
-# Start message
-logger.info('🚀 TelecomsXChange (TCXC) Carrier Relations Automation Script started')
+# Your Telecomsxchange Buyer account used for provisioning
+i_account = '{ENTER I_account}'
 
-# Your Telecomsxchange Buyer username and password
-username = '{Enter API login}'
-password = '{Enter API key}'
+# Interconnect with carriers that match target rates of 0.22 or lower
+target_rate = 0.22
 
-# TCXC API endpoints
-search_url = 'https://apiv2.telecomsxchange.com/marketview/search'
-interconnect_url = 'https://apiv2.telecomsxchange.com/buyers/interconnect'
+# Log file and level of this script (None uses TCXC_LOG_LEVEL, see tcxc_logging.py)
+log_file = 'automate_cr.log'
+log_level = None
 
-# NeuTrafix API endpoints
-# search_url = 'https://apiv2.neutrafix.telin.net/marketview/search'
-# interconnect_url = 'https://apiv2.neutrafix.telin.net/buyers/interconnect'
+# Provisioning mode: 'concurrent' sends interconnect requests in parallel, 'serial' one at a time
+provisioning_mode = 'concurrent'
 
-# Headers for the requests
-headers = {
-    'Content-Type': 'application/x-www-form-urlencoded',
-}
+# Maximum number of interconnect requests in flight when provisioning_mode is 'concurrent'
+max_in_flight = 8
 
 # Data for the search API request
 search_data = {
     'prefix': '22797', # Replace with the dial code you're targeting
     'searchform': '1',
     'type': 'ANY',
-    'pager': '100',
-    'off': '0',
 }
 
-# Make the POST request for search
-logger.info('🔍 Searching TCXC market view API for Niger Mobile (Dial Code: +22797) ...\n')
-search_response = requests.post(search_url, headers=headers, data=search_data,
-                                auth=HTTPDigestAuth(username, password))
+# Number of routes per market view page, 'off' is moved forward until all pages are read
+page_size = 100
+
+# Ledger of the connections already provisioned for i_account, checked before interconnecting (see
+# interconnect_ledger.py)
+ledger_file = 'interconnect_ledger.tsv'
+
+# Paged endpoint listing the interconnections of i_account. When set, the ledger is refreshed from it
+# every reconcile_days days, or on --reconcile. Off by default, as the API does not document one
+reconcile_endpoint = None
+
+# Batch scan mode: set to a file with one dial code per line to scan many prefixes in one run
+# (see market_scan.py), searches run in parallel with max_in_flight requests in flight
+prefixes_file = None
+
+
+# i_connection -> seller name, from the cached sellers list, used to make the logs readable (set by main)
+sellers = {}
+
+# Interconnect ledger (set by main)
+ledger = None
+
 
-# Check if the search request was successful
-if search_response.status_code == 200:
+def describe(i_connection):
+    seller_name = sellers.get(str(i_connection))
+    return f"{i_connection} ({seller_name})" if seller_name else str(i_connection)
+
+
+def interconnect(i_connection):
+    """Send one interconnect request and return (success, details) for the i_connection."""
+    # Data for the interconnect API request
+    interconnect_data = {
+        'add': '1',
+        'i_account': i_account,
+        'agree': 'yes',
+        'id': str(i_connection)
+    }
+
+    # Make the POST request for interconnect
+    interconnect_response = client.post(interconnect_endpoint, data=interconnect_data)
+
+    # Log the status code, and a truncated sample of the response bodies for debugging purposes
+    logging.debug(f"Interconnect Response Status Code: {interconnect_response.status_code}",
+                  extra={'i_connection': i_connection, 'status': interconnect_response.status_code})
+    log_body(logging.getLogger(), "Interconnect Response Text", interconnect_response,
+             i_connection=i_connection, status=interconnect_response.status_code)
+
+    # Check if the interconnect request was successful
+    if interconnect_response.status_code != 200:
+        return False, f"HTTP {interconnect_response.status_code}"
     try:
-        search_info = search_response.json()
-        if search_info.get('status') == 'success':
-            rates = search_info.get('rates')
-            logger.info('✅ Found some routes \n')
-
-            # Interconnect process
-            logger.info('⚙️ Running Interconnection and Provisioning process. Please wait...\n')
-            for rate in rates:
+        interconnect_info = interconnect_response.json()
+    except ValueError:
+        return False, "Error decoding the interconnect response as JSON"
+    return interconnect_info.get('status') == 'success', interconnect_info
+
+
+def record_result(i_connection, price, success, details):
+    """Log the outcome of an interconnect, and write a success to the ledger file right away."""
+    if success:
+        # Flushed per success, so an interrupted run does not send these interconnects again
+        ledger.add(i_account, i_connection, price)
+        ledger.flush()
+        logging.info(f"Successfully interconnect with i_connection: {describe(i_connection)}. "
+                     f"Details: {truncate(str(details))}. All details have also been emailed to relevant departments in your organization.",
+                     extra={'i_connection': i_connection})
+    else:
+        logging.error(f"Interconnect request failed for i_connection: {describe(i_connection)}. Details: {truncate(str(details))}",
+                      extra={'i_connection': i_connection})
+
+
+def provision(i_connections):
+    """Interconnect every i_connection and return a dict of i_connection -> (success, details).
+
+    Successful interconnects are recorded in the ledger with their price (i_connections maps i_connection -> price)
+    as each one completes.
+    """
+    results = {}
+    if provisioning_mode == 'concurrent':
+        for i_connection, result, error in fan_out(interconnect, i_connections, max_in_flight):
+            results[i_connection] = (False, f"Exception: {error}") if error else result
+            record_result(i_connection, i_connections[i_connection], *results[i_connection])
+    else:
+        for i_connection in i_connections:
+            # One failed request must not lose the interconnects already made in this batch
+            try:
+                results[i_connection] = interconnect(i_connection)
+            except Exception as e:
+                results[i_connection] = (False, f"Exception: {e}")
+            record_result(i_connection, i_connections[i_connection], *results[i_connection])
+    return results
+
+
+def iter_candidate_rates():
+    """Yield the market view rates to consider, for one dial code or for every prefix in prefixes_file."""
+    if prefixes_file is None:
+        logger.info('🔍 Searching TCXC market view API for Niger Mobile (Dial Code: +22797) ...\n')
+        yield from iter_market_rates(client, search_data, page_size)
+        return
+    prefixes = load_prefixes(prefixes_file)
+    logger.info(f'🔍 Scanning TCXC market view API for {len(prefixes)} dial codes from {prefixes_file} ...\n')
+    for prefix, covered_by, rates, error in scan_prefixes(client, prefixes, search_data, max_in_flight, page_size):
+        if error:
+            logging.error(f"Search request failed for prefix +{prefix}. Details: {error}", extra={'prefix': prefix})
+        elif covered_by is None:
+            # Child prefixes only repeat routes of their parent, which is already listed
+            yield from rates
+
+
+def main(argv=None):
+    global client, sellers, ledger, prefixes_file, target_rate, i_account
+    parser = argparse.ArgumentParser(description='Interconnect with the market view routes under a target rate')
+    parser.add_argument('--prefixes-file', default=prefixes_file, help='file with one dial code per line to scan')
+    parser.add_argument('--target-rate', type=float, default=target_rate, help='interconnect with routes cheaper than this')
+    parser.add_argument('--i-account', default=i_account, help='buyer i_account used for provisioning')
+    parser.add_argument('--reconcile', action='store_true', help='only refresh the interconnect ledger from the API')
+    args = parser.parse_args(argv)
+    prefixes_file, target_rate, i_account = args.prefixes_file, args.target_rate, args.i_account
+
+    setup_logging('carrier-relations', log_file, log_level)
+    # Start message
+    logger.info('🚀 TelecomsXChange (TCXC) Carrier Relations Automation Script started')
+    client = get_client()
+    sellers = seller_names(client)
+
+    ledger = InterconnectLedger(ledger_file)
+    if args.reconcile and not reconcile_endpoint:
+        logging.error("Interconnect ledger reconcile is off. Set reconcile_endpoint to the interconnections list endpoint.")
+        return
+    if reconcile_endpoint and (args.reconcile or ledger.needs_reconcile(i_account, reconcile_days)):
+        try:
+            with metrics.stage('reconcile'):
+                count = reconcile(client, ledger, i_account, reconcile_endpoint)
+            logger.info(f'📒 Interconnect ledger refreshed from the API: {count} connections provisioned for i_account {i_account}')
+        except TCXCAPIError as e:
+            # The next run tries again, until then the local ledger is used as it is
+            logging.error("Interconnect ledger reconcile failed. Details: %s", e)
+    if args.reconcile:
+        return
+
+    # Search the market view API, page by page
+    try:
+        # Interconnect process
+        logger.info(f'🔍 Interconnect with carriers that match target rates of {target_rate} or lower \n')
+        # i_connection -> price of the routes to interconnect
+        i_connections = {}
+        provisioned = 0
+        seen = set()
+        with metrics.stage('search'):
+            for rate in iter_candidate_rates():
                 price_1 = float(rate.get('price_1', '0'))
                 i_connection = rate.get('i_connection')
-
-                # If the price_1 is below 0.19, interconnect
-                logger.info('🔍 Interconnect with carriers that match target rates of 0.22 or lower \n')
-                if price_1 < 0.22:
-                    logging.info(f"Attempting to interconnect with i_connection: {i_connection}")
-                    
-                    # Data for the interconnect API request
-                    interconnect_data = {
-                        'add': '1',
-                        'i_account': '{ENTER I_account}',
-                        'agree': 'yes',
-                        'id': str(i_connection)
-                    }
-
-                    # Make the POST request for interconnect
-                    interconnect_response = requests.post(interconnect_url, headers=headers, 
-                                                          data=interconnect_data,
-                                                          auth=HTTPDigestAuth(username, password))
-
-                    # Print the status code and the response text for debugging purposes
-                    logging.info(f"Interconnect Response Status Code: {interconnect_response.status_code}")
-                    logging.info(f"Interconnect Response Text: {interconnect_response.text}")
-
-                    # Check if the interconnect request was successful
-                    if interconnect_response.status_code == 200:
-                        try:
-                            interconnect_info = interconnect_response.json()
-                            if interconnect_info.get('status') == 'success':
-                             logging.info(f"Successfully interconnect with i_connection: {i_connection}. "
-                                 f"Details: {interconnect_info}. All details have also been emailed to relevant departments in your organization.")
-
-                            else:
-                                logging.error(f"Interconnect request returned an error for i_connection: {i_connection}. "
-                                              f"Details: {interconnect_info}")
-                        except ValueError:
-                            logging.error("Error decoding the interconnect response as JSON")
-                    else:
-                        logging.error(f"Interconnect request failed for i_connection: {i_connection}")
+                # The same route can be listed under several scanned prefixes
+                if i_connection in seen:
+                    continue
+                seen.add(i_connection)
+                fields = {'i_connection': i_connection, 'i_vendor': rate.get('i_vendor'), 'price': price_1}
+                if price_1 < target_rate and (i_account, i_connection) in ledger:
+                    logging.debug(f"Already interconnected with i_connection: {describe(i_connection)}. Skipping interconnect.", extra=fields)
+                    provisioned += 1
+                elif price_1 < target_rate:
+                    logging.info(f"Attempting to interconnect with i_connection: {describe(i_connection)}", extra=fields)
+                    i_connections[i_connection] = price_1
                 else:
-                    logging.info(f"Price too high for i_connection: {i_connection}. Skipping interconnect.")
-        else:
-            logging.error("Search request returned an error. Details: %s", search_info)
-    except ValueError:
-        logging.error("Error decoding the search response as JSON")
-else:
-    logging.error("Search request failed")
+                    logging.debug(f"Price too high for i_connection: {describe(i_connection)}. Skipping interconnect.", extra=fields)
+    except TCXCAPIError as e:
+        logging.error("Search request failed. Details: %s", e)
+    else:
+        logger.info(f'✅ Found {len(i_connections) + provisioned} routes under the target rate, '
+                    f'{provisioned} of them already interconnected \n')
+        logger.info('⚙️ Running Interconnection and Provisioning process. Please wait...\n')
+        with metrics.stage('provision'):
+            results = provision(i_connections)
+        succeeded = [i_connection for i_connection, (success, _) in results.items() if success]
+        failed = [i_connection for i_connection, (success, _) in results.items() if not success]
+        logger.info(f"📋 Provisioning summary: {len(succeeded)} succeeded, {len(failed)} failed "
+                    f"out of {len(results)} interconnect requests.")
+        if failed:
+            logger.info(f"Failed i_connections: {', '.join(str(i) for i in failed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,23 +13,22 @@
     and moves on to the next one. 
 """
 
-import requests
-from requests.auth import HTTPDigestAuth
+import argparse
+import heapq
 import logging
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from tcxc_client import TCXCAPIError, get_client, paginate
+from tcxc_metrics import metrics
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, 
-                    handlers=[logging.FileHandler("automate_buying.log"), 
-                              logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger()
 
-# TelecomsXChange API Credentials
-username = "{Buyer Username}"
-password = "{API Key}"
+# Shared TelecomsXChange client, credentials and base URL are configured in tcxc_client.py (set by main)
+client = None
 
-# API endpoint
-search_url = "https://apiv2.telecomsxchange.com/number/market"
+# API endpoints
+search_endpoint = "/number/market"
+purchase_endpoint = "/number/purchase"
 
 # Data to be sent to API
 search_data = {
@@ -46,34 +45,153 @@ search_data = {
     'off': "1"
 }
 
-# Send the request
-search_response = requests.post(search_url, data=search_data, auth=HTTPDigestAuth(username, password))
-
-# Check if the request was successful
-if search_response.status_code == 200:
-    dids = search_response.json().get('dids', [])
-    for did in dids:
-        # Check if the monthly_fee and setup_fee are below 2.00
-        if float(did.get('monthly_fee', 0)) < 2.00 and float(did.get('setup_fee', 0)) < 2.00: # Setup Target rate for number you want to purchase. if higher than set value will be skipped. 
-            # Purchase the number
-            purchase_url = "https://apiv2.telecomsxchange.com/number/purchase"
-            purchase_data = {
-                'i_did': did['i_did'],
-                'billing_i_account': "{Enter here}", # Enter Billing Account ID 
-                'contact': f"sip:{did['number']}@sip01.telecomsxchange.com:5060",  # Configure SIP route
-                'smpp_contact': f"smpp:did:did:{did['number']}@smpp01.telecomsxchange.com:2776" # Configure SMS/SMPP Route
-            }
-
-            # Send the request
-            purchase_response = requests.post(purchase_url, data=purchase_data, auth=HTTPDigestAuth(username, password))
-
-            # Check if the request was successful and purchase was confirmed
-            if purchase_response.status_code == 200 and purchase_response.json().get('status') == 'success':
-                logger.info(f"🟢 Successfully purchased number: {did['number']}")
+# Billing Account ID used for purchases
+billing_i_account = "{Enter here}"
+
+# Target rates for numbers you want to purchase. Numbers with higher fees are skipped.
+max_monthly_fee = 2.00
+max_setup_fee = 2.00
+
+# Buying mode: 'single' buys the first affordable number of search_data['prefix'],
+# 'bulk' buys numbers_wanted numbers across bulk_prefixes, cheapest total cost first
+buying_mode = 'single'
+
+# Bulk mode settings
+bulk_prefixes = ["1954240"]   # Number prefixes to search
+numbers_wanted = 100          # Numbers to buy in total
+cost_horizon_months = 12      # Total cost = setup_fee + monthly_fee * cost_horizon_months
+max_in_flight = 8             # Concurrent purchase requests
+page_size = 100               # Numbers per /number/market page
+
+
+def purchase(did):
+    """Purchase one number and return (success, reason)."""
+    purchase_data = {
+        'i_did': did['i_did'],
+        'billing_i_account': billing_i_account,
+        'contact': f"sip:{did['number']}@sip01.telecomsxchange.com:5060",  # Configure SIP route
+        'smpp_contact': f"smpp:did:did:{did['number']}@smpp01.telecomsxchange.com:2776" # Configure SMS/SMPP Route
+    }
+
+    # Send the request
+    purchase_response = client.post(purchase_endpoint, data=purchase_data)
+
+    # Check if the request was successful and purchase was confirmed
+    if purchase_response.status_code != 200:
+        return False, f"HTTP {purchase_response.status_code}"
+    try:
+        purchase_info = purchase_response.json()
+    except ValueError:
+        return False, "Error decoding the purchase response as JSON"
+    return purchase_info.get('status') == 'success', purchase_info.get('message')
+
+
+def is_affordable(did):
+    return float(did.get('monthly_fee', 0)) < max_monthly_fee and float(did.get('setup_fee', 0)) < max_setup_fee
+
+
+def total_cost(did):
+    return float(did.get('setup_fee', 0)) + float(did.get('monthly_fee', 0)) * cost_horizon_months
+
+
+def rank_candidates(prefixes):
+    """Page through /number/market for every prefix and return a heap of (total cost, i_did, did)."""
+    candidates = []
+    seen = set()
+    for prefix in prefixes:
+        for did in paginate(client, search_endpoint, dict(search_data, prefix=prefix), 'dids', page_size=page_size):
+            # Overlapping prefixes can list the same number more than once
+            if did['i_did'] in seen or not is_affordable(did):
+                continue
+            seen.add(did['i_did'])
+            candidates.append((total_cost(did), str(did['i_did']), did))
+    heapq.heapify(candidates)
+    return candidates
+
+
+def buy_numbers(candidates, wanted):
+    """Buy up to wanted numbers from the candidate heap, cheapest first, with at most max_in_flight purchases pending.
+
+    A failed purchase is replaced by the next candidate. Returns (purchased, failed) lists of dids.
+    """
+    purchased, failed = [], []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = {}
+        while True:
+            # Never have more purchases in flight than numbers still needed
+            while candidates and len(pending) < max_in_flight and len(purchased) + len(pending) < wanted:
+                cost, _, did = heapq.heappop(candidates)
+                pending[executor.submit(purchase, did)] = did
+            if not pending:
                 break
-            else:
-                logger.warning(f"⚠️ Failed to purchase number: {did['number']}. Reason: {purchase_response.json().get('message')}. Trying the next number.")
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                did = pending.pop(future)
+                if future.exception():
+                    success, reason = False, f"Exception: {future.exception()}"
+                else:
+                    success, reason = future.result()
+                if success:
+                    purchased.append(did)
+                    logger.info(f"🟢 Successfully purchased number: {did['number']} (total cost {total_cost(did):.2f})")
+                else:
+                    failed.append(did)
+                    logger.warning(f"⚠️ Failed to purchase number: {did['number']}. Reason: {reason}. Trying the next number.")
+    return purchased, failed
+
+
+def main(argv=None):
+    global client, buying_mode, numbers_wanted, bulk_prefixes, billing_i_account
+    parser = argparse.ArgumentParser(description='Buy DID numbers under the target fees')
+    parser.add_argument('--mode', choices=['single', 'bulk'], default=buying_mode, help='buying mode')
+    parser.add_argument('--prefix', action='append', dest='prefixes', help='number prefix to search (bulk mode, repeatable)')
+    parser.add_argument('--wanted', type=int, default=numbers_wanted, help='numbers to buy in bulk mode')
+    parser.add_argument('--billing-i-account', default=billing_i_account, help='billing account used for purchases')
+    args = parser.parse_args(argv)
+    buying_mode, numbers_wanted, billing_i_account = args.mode, args.wanted, args.billing_i_account
+    bulk_prefixes = args.prefixes or bulk_prefixes
+
+    # Set up logging
+    logging.basicConfig(level=logging.INFO,
+                        handlers=[logging.FileHandler("automate_buying.log"),
+                                  logging.StreamHandler(sys.stdout)])
+    client = get_client()
+
+    if buying_mode == 'bulk':
+        try:
+            with metrics.stage('search'):
+                candidates = rank_candidates(bulk_prefixes)
+        except TCXCAPIError as e:
+            logger.error(f"🔴 Number market search failed. Details: {e}")
         else:
-            logger.info(f"⚠️ Skipped number: {did['number']} due to high cost. Trying the next number.")
+            logger.info(f"Found {len(candidates)} affordable numbers for {numbers_wanted} wanted across {len(bulk_prefixes)} prefixes.")
+            with metrics.stage('purchase'):
+                purchased, failed = buy_numbers(candidates, numbers_wanted)
+            logger.info(f"📋 Bulk purchase summary: {len(purchased)} of {numbers_wanted} numbers purchased, {len(failed)} attempts failed.")
+            if len(purchased) < numbers_wanted:
+                logger.error(f"🔴 Only {len(purchased)} of {numbers_wanted} numbers could be purchased: not enough available numbers, they are too costly, or attempts failed.")
     else:
-        logger.error("🔴 Failed to purchase any number: No available numbers, they are too costly, or all attempts failed.")
+        # Send the request
+        search_response = client.post(search_endpoint, data=search_data)
+
+        # Check if the request was successful
+        if search_response.status_code == 200:
+            dids = search_response.json().get('dids', [])
+            for did in dids:
+                # Check if the monthly_fee and setup_fee are below the target rates
+                if is_affordable(did):
+                    # Purchase the number
+                    success, reason = purchase(did)
+                    if success:
+                        logger.info(f"🟢 Successfully purchased number: {did['number']}")
+                        break
+                    else:
+                        logger.warning(f"⚠️ Failed to purchase number: {did['number']}. Reason: {reason}. Trying the next number.")
+                else:
+                    logger.info(f"⚠️ Skipped number: {did['number']} due to high cost. Trying the next number.")
+            else:
+                logger.error("🔴 Failed to purchase any number: No available numbers, they are too costly, or all attempts failed.")
+
+
+if __name__ == '__main__':
+    main()
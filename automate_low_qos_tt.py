@@ -15,89 +15,187 @@ service providers can efficiently manage and enhance their network performance.
 
 """
 
-import requests
-from requests.auth import HTTPDigestAuth
+import argparse
+import atexit
 import json
 from datetime import datetime, timedelta
-import os
 import random
 import string
+from tcxc_metrics import metrics
+from tcxc_client import get_client
+from sent_messages_store import SentMessageStore, make_message_id
+from call_history_poller import Watermark, poll, run_incremental
+from json_stream import iter_response_array
+from trouble_tickets import aggregate_failures, format_ticket, send_error
 
 # Function to generate random ticket ID
 def get_random_ticket_id(length):
     letters = string.ascii_uppercase + string.digits
     return ''.join(random.choice(letters) for i in range(length))
 
+# Sent messages are kept in an indexed store, loaded once per run by main and flushed on exit
+sent_messages_file = 'sent_messages.txt'
+sent_messages = None
+
 # Functions to handle sent messages
 def check_if_message_sent(call_id, destination_number, vendor_id):
-    message_id = f'{call_id}-{destination_number}-{vendor_id}'
-    if not os.path.exists('sent_messages.txt'):
-        return False
-    with open('sent_messages.txt', 'r') as f:
-        for line in f.readlines():
-            if line.strip() == message_id:
-                return True
-    return False
+    return make_message_id(call_id, destination_number, vendor_id) in sent_messages
 
 def record_message_sent(call_id, destination_number, vendor_id):
-    message_id = f'{call_id}-{destination_number}-{vendor_id}'
-    with open('sent_messages.txt', 'a') as f:
-        f.write(message_id + '\n')
+    sent_messages.add(make_message_id(call_id, destination_number, vendor_id))
 
-# Telecomsxchange Buyer Credentials
-username = '{API Login}'
-password = '{API key}'
+# Shared Telecomsxchange client, credentials and base URL are configured in tcxc_client.py (set by main)
+client = None
 
 # API Endpoints
-call_history_url = 'https://apiv2.telecomsxchange.com/buyers/callhistory/'
-message_send_url = 'https://apiv2.telecomsxchange.com/buyers/message/send'
+call_history_endpoint = '/buyers/callhistory/'
+message_send_endpoint = '/buyers/message/send'
+
+# Polling mode:
+#   'window'      - query the last window_minutes once (original behaviour)
+#   'incremental' - query only the CDRs since the persisted watermark, minus overlap_minutes for late CDRs
+#   'daemon'      - keep running in incremental mode every poll_interval seconds
+polling_mode = 'window'
+window_minutes = 30
+overlap_minutes = 5
+poll_interval = 60
+watermark = Watermark('callhistory_watermark.txt')
 
-# Headers for the requests
-headers = {
-    'Content-Type': 'application/x-www-form-urlencoded',
-}
+# Disconnect reasons to filter out
+disconnect_reasons = ["Service or option not available", "unspecified", "timeout", "Internetworking, unspecified", "Bearer capability not authorized"]
 
-# Time settings for the call history API request
-end_time = datetime.utcnow()
-start_time = end_time - timedelta(minutes=30)
 
-# Data for the call history API request
-call_history_data = {
-    'show': 'bad',
-    'date_from': start_time.strftime('%Y-%m-%d %H:%M:%S'),
-    'date_to': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+# QoS mode: 'threshold' fetches all calls and reports failures only on routes (vendor, route, destination prefix)
+# crossing qos_thresholds, see qos_analytics.py; 'per_call' reports every failed call with a listed disconnect reason
+qos_mode = 'threshold'
+qos_thresholds = {
+    'min_attempts': 10,
+    'max_failure_rate': 0.3,
+    'min_asr': 0.0,
 }
 
-# Disconnect reasons to filter out
-disconnect_reasons = ["Service or option not available", "unspecified", "timeout", "Internetworking, unspecified", "Bearer capability not authorized"]
-
-# Send GET request for call history
-call_history_response = requests.post(call_history_url, headers=headers, data=call_history_data,
-                                      auth=HTTPDigestAuth(username, password))
-
-# Check if the call history request was successful
-if call_history_response.status_code == 200:
-    try:
-        call_history_info = call_history_response.json()
-        if call_history_info.get('status') == 'success':
-            cdrs = call_history_info.get('cdrs')
-            for cdr in cdrs:
-                disconnect_reason = cdr.get('disconnect_reason')
-                if disconnect_reason in disconnect_reasons and not check_if_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor']):
-                    message_data = {
-                        'id': cdr['i_vendor'],
-                        'subject': f"Trouble Ticket #{get_random_ticket_id(10)}: Call Failure to Destination: {cdr['CLD']}",
-                        'message': f"Dear Vendor,\n\nWe are writing to inform you of a detected issue concerning the quality of service on your route {cdr['connection_name']}."
-                                    f"Our monitoring systems have identified that the call to destination number {cdr['CLD']} has failed.\n\nError Details:\n- Disconnect Reason: {disconnect_reason}"
-                                    f"\n- Timestamp of Occurrence: {cdr['connect_time']}\n\nWe request your immediate attention and action to resolve this issue as it is affecting our service delivery."
-                                    f"We appreciate your prompt response and solution to this matter.\n\nThank you for your cooperation."
-                    }
-                    message_response = requests.post(message_send_url, headers=headers, data=message_data,
-                                                      auth=HTTPDigestAuth(username, password))
-                    record_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
-        else:
-            print("Call history request returned an error. Details: ", call_history_info)
-    except ValueError:
-        print("Error decoding the call history response as JSON")
-else:
-    print("Call history request failed")
+# Ticket mode: 'aggregated' sends one ticket per vendor covering all its failed calls in the window,
+# grouped by route and disconnect reason, 'per_call' sends one ticket per failed call
+ticket_mode = 'aggregated'
+
+
+def send_aggregated_tickets(failed_cdrs):
+    """Send one trouble ticket per vendor and mark every grouped call as handled."""
+    for i_vendor, groups in aggregate_failures(failed_cdrs).items():
+        subject, message = format_ticket(get_random_ticket_id(10), groups)
+        with metrics.stage('send'):
+            message_response = client.post(message_send_endpoint, data={'id': i_vendor, 'subject': subject, 'message': message})
+        error = send_error(message_response)
+        if error:
+            print(f"Trouble ticket for vendor {i_vendor} failed: {error}")
+            continue
+        for group in groups.values():
+            for cdr in group.cdrs:
+                record_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
+
+
+def process_call_history(start_time, end_time):
+    """Raise trouble tickets for the failed calls between start_time and end_time. Returns True on success."""
+    # Data for the call history API request
+    call_history_data = {
+        'show': 'all' if qos_mode == 'threshold' else 'bad',
+        'date_from': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'date_to': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    with metrics.stage('fetch'):
+        # Send the call history request, the body is read below while it downloads
+        call_history_response = client.post(call_history_endpoint, data=call_history_data, stream=True)
+
+        # Check if the call history request was successful
+        if call_history_response.status_code != 200:
+            call_history_response.close()
+            print("Call history request failed")
+            return False
+
+    # CDRs are decoded one at a time from the 'cdrs' array and filtered on disconnect_reason right away,
+    # only the failed ones are kept; the other members of the response (status) are collected in fields
+    fields = {}
+    with call_history_response, metrics.stage('filter'):
+        if qos_mode == 'threshold':
+            # numpy is only loaded when the route statistics are needed
+            from qos_analytics import StreamingCDRSelector
+            selector = StreamingCDRSelector(disconnect_reasons)
+        failed_cdrs = []
+
+        def not_sent(cdr):
+            return not check_if_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
+
+        try:
+            for cdr in iter_response_array(call_history_response, 'cdrs', fields):
+                if qos_mode == 'threshold':
+                    # Every call counts towards the route statistics, failed calls already ticketed are not kept
+                    selector.add(cdr, keep=not_sent)
+                elif cdr.get('disconnect_reason') in disconnect_reasons and not_sent(cdr):
+                    failed_cdrs.append(cdr)
+        # Only decoding errors, a CDR with unexpected values is counted by the selector as it is
+        except json.JSONDecodeError:
+            print("Error decoding the call history response as JSON")
+            return False
+        if fields.get('status') != 'success':
+            print("Call history request returned an error. Details: ", fields)
+            return False
+        if qos_mode == 'threshold':
+            # Only failures on routes whose failure rate or ASR crosses qos_thresholds are reported
+            failed_cdrs, route_stats = selector.select(**qos_thresholds)
+            for route in route_stats.rows(route_stats.flagged(**qos_thresholds)):
+                print(f"Low QoS route: vendor {route['i_vendor']}, route {route['connection_name']}, prefix {route['prefix']}, "
+                      f"{route['failures']}/{route['attempts']} failed, ASR {route['asr']:.2f}, ACD {route['acd']:.0f}s")
+
+    if ticket_mode == 'aggregated':
+        send_aggregated_tickets(failed_cdrs)
+    else:
+        for cdr in failed_cdrs:
+            disconnect_reason = cdr.get('disconnect_reason')
+            message_data = {
+                'id': cdr['i_vendor'],
+                'subject': f"Trouble Ticket #{get_random_ticket_id(10)}: Call Failure to Destination: {cdr['CLD']}",
+                'message': f"Dear Vendor,\n\nWe are writing to inform you of a detected issue concerning the quality of service on your route {cdr['connection_name']}."
+                            f"Our monitoring systems have identified that the call to destination number {cdr['CLD']} has failed.\n\nError Details:\n- Disconnect Reason: {disconnect_reason}"
+                            f"\n- Timestamp of Occurrence: {cdr['connect_time']}\n\nWe request your immediate attention and action to resolve this issue as it is affecting our service delivery."
+                            f"We appreciate your prompt response and solution to this matter.\n\nThank you for your cooperation."
+            }
+            with metrics.stage('send'):
+                message_response = client.post(message_send_endpoint, data=message_data)
+            # Only a delivered ticket is recorded, a failed one is sent again for the next window
+            error = send_error(message_response)
+            if error:
+                print(f"Trouble ticket for call id {cdr['call_id']} failed: {error}")
+                continue
+            record_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
+    sent_messages.flush()
+    return True
+
+
+def main(argv=None):
+    global client, sent_messages, polling_mode, window_minutes, qos_mode, ticket_mode
+    parser = argparse.ArgumentParser(description='Raise trouble tickets for failed calls in the call history')
+    parser.add_argument('--mode', choices=['window', 'incremental', 'daemon'], default=polling_mode, help='polling mode')
+    parser.add_argument('--window-minutes', type=int, default=window_minutes, help='call history window of the first query')
+    parser.add_argument('--qos-mode', choices=['threshold', 'per_call'], default=qos_mode)
+    parser.add_argument('--ticket-mode', choices=['aggregated', 'per_call'], default=ticket_mode)
+    args = parser.parse_args(argv)
+    polling_mode, window_minutes, qos_mode, ticket_mode = args.mode, args.window_minutes, args.qos_mode, args.ticket_mode
+
+    client = get_client()
+    sent_messages = SentMessageStore(sent_messages_file)
+    atexit.register(sent_messages.close)
+
+    if polling_mode == 'daemon':
+        poll(process_call_history, watermark, window_minutes, overlap_minutes, poll_interval)
+    elif polling_mode == 'incremental':
+        run_incremental(process_call_history, watermark, window_minutes, overlap_minutes)
+    else:
+        # Time settings for the call history API request
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(minutes=window_minutes)
+        process_call_history(start_time, end_time)
+
+
+if __name__ == '__main__':
+    main()
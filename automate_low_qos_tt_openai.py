@@ -19,117 +19,246 @@ script.
 
 
 
-import requests
-from requests.auth import HTTPDigestAuth
+import argparse
+import atexit
 import json
 from datetime import datetime, timedelta
-import os
 import random
 import string
-import openai
-from openai.api_resources.completion import Completion
+from tcxc_metrics import metrics
+from tcxc_client import get_client
+from sent_messages_store import SentMessageStore, make_message_id
+from call_history_poller import Watermark, poll, run_incremental
+from json_stream import iter_response_array
+from trouble_tickets import aggregate_failures, describe_groups, send_error
+from ticket_generator import LocalGenerator, OpenAIGenerator, TicketTemplateCache
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s %(levelname)-8s %(message)s',
-                    datefmt='%Y-%m-%d %H:%M:%S',
-                    handlers=[logging.FileHandler("debug.log"),
-                              logging.StreamHandler()])
-
-logging.info('Script started.')
-
 # Function to generate random ticket ID
 def get_random_ticket_id(length):
     letters = string.ascii_uppercase + string.digits
     return ''.join(random.choice(letters) for i in range(length))
 
+# Sent messages are kept in an indexed store, loaded once per run by main and flushed on exit
+sent_messages_file = 'sent_messages.txt'
+sent_messages = None
+
 # Functions to handle sent messages
 def check_if_message_sent(call_id, destination_number, vendor_id):
-    message_id = f'{call_id}-{destination_number}-{vendor_id}'
-    if not os.path.exists('sent_messages.txt'):
-        return False
-    with open('sent_messages.txt', 'r') as f:
-        for line in f.readlines():
-            if line.strip() == message_id:
-                return True
-    return False
+    return make_message_id(call_id, destination_number, vendor_id) in sent_messages
 
 def record_message_sent(call_id, destination_number, vendor_id):
-    message_id = f'{call_id}-{destination_number}-{vendor_id}'
-    with open('sent_messages.txt', 'a') as f:
-        f.write(message_id + '\n')
+    sent_messages.add(make_message_id(call_id, destination_number, vendor_id))
 
 # Set your OpenAI key
-openai.api_key = 'openapi-key'
+openai_api_key = 'openapi-key'
+
+# Message generator: 'openai' uses the completion API, 'local' is an offline stand-in for tests and benchmarks
+message_generator = 'openai'
+
+# Generated messages are cached as templates per (route, disconnect reason), and aggregated summaries per vendor and
+# set of (route, disconnect reason) pairs; misses use up to llm_workers threads
+llm_workers = 4
+
+# Generator and template cache, created by main
+generator = None
+ticket_templates = None
 
 # Function to generate message with OpenAI
 def generate_message(cdr):
-    prompt = f"We need to inform a vendor/seller about a call failure in professional written way. The call to destination number {cdr['CLD']} on route {cdr['connection_name']} failed. The disconnect reason was: {cdr['disconnect_reason']}. The timestamp of occurrence was: {cdr['connect_time']}, Ask them to confirm when the issue has been fixed and do NOT end the message with Best Regards, name etc.."
-    message_completion = Completion.create(model="text-davinci-002", prompt=prompt, max_tokens=500)
-    return message_completion.choices[0].text.strip()
+    return ticket_templates.render(cdr)
 
-# Telecomsxchange or NeuTrafix Buyer Credentials
-username = '{Username}'
-password = '{API-Key}'
+# Function to generate one message for all failures of a vendor with OpenAI
+def generate_aggregated_message(i_vendor, groups):
+    return ticket_templates.render_summaries({i_vendor: groups}, describe_groups)[i_vendor]
 
-# API Endpoints (TCXC)
-call_history_url = 'https://apiv2.telecomsxchange.com/buyers/callhistory/'
-message_send_url = 'https://apiv2.telecomsxchange.com/buyers/message/send'
+# Shared Telecomsxchange/NeuTrafix client, credentials and base URL are configured in tcxc_client.py (set by main)
+client = None
 
-# API Endpoints (NeuTrafix)
-# call_history_url = 'https://apiv2.neutrafix.telin.net/buyers/callhistory/'
-# message_send_url = 'https://apiv2.neutrafix.telin.net/buyers/message/send'
+# API Endpoints
+call_history_endpoint = '/buyers/callhistory/'
+message_send_endpoint = '/buyers/message/send'
 
+# Polling mode:
+#   'window'      - query the last window_minutes once (original behaviour)
+#   'incremental' - query only the CDRs since the persisted watermark, minus overlap_minutes for late CDRs
+#   'daemon'      - keep running in incremental mode every poll_interval seconds
+polling_mode = 'window'
+window_minutes = 5440
+overlap_minutes = 5
+poll_interval = 60
+watermark = Watermark('callhistory_openai_watermark.txt')
 
-# Headers for the requests
-headers = {
-    'Content-Type': 'application/x-www-form-urlencoded',
-}
+# Disconnect reasons to filter out
+disconnect_reasons = ["Service or option not available", "Call rejected", "timeout", "Internetworking, unspecified", "Bearer capability not authorized", "unspecified"]
 
-# Time settings for the call history API request
-end_time = datetime.utcnow()
-start_time = end_time - timedelta(minutes=5440)
 
-# Data for the call history API request
-call_history_data = {
-    'show': 'bad',
-    'date_from': start_time.strftime('%Y-%m-%d %H:%M:%S'),
-    'date_to': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+# QoS mode: 'threshold' fetches all calls and reports failures only on routes (vendor, route, destination prefix)
+# crossing qos_thresholds, see qos_analytics.py; 'per_call' reports every failed call with a listed disconnect reason
+qos_mode = 'threshold'
+qos_thresholds = {
+    'min_attempts': 10,
+    'max_failure_rate': 0.3,
+    'min_asr': 0.0,
 }
 
-# Disconnect reasons to filter out
-disconnect_reasons = ["Service or option not available", "Call rejected", "timeout", "Internetworking, unspecified", "Bearer capability not authorized", "unspecified"]
+# Ticket mode: 'aggregated' sends one ticket per vendor covering all its failed calls in the window,
+# grouped by route and disconnect reason, 'per_call' sends one ticket per failed call
+ticket_mode = 'aggregated'
+
+
+def send_aggregated_tickets(failed_cdrs):
+    """Send one generated trouble ticket per vendor and mark every grouped call as handled."""
+    vendors = aggregate_failures(failed_cdrs)
+    # Cached summaries are reused, the missing ones are generated concurrently
+    generated_messages = ticket_templates.render_summaries(vendors, describe_groups)
+    for i_vendor, groups in vendors.items():
+        generated_message = generated_messages[i_vendor]
+        if generated_message is None:
+            continue
+        total = sum(group.count for group in groups.values())
+        logging.info(f'{total} call failures detected for vendor {i_vendor} on {len(groups)} route/reason groups.')
+        message_data = {
+            'id': i_vendor,
+            'subject': f"Trouble Ticket #{get_random_ticket_id(10)}: Noted {total} Call Failures",
+            'message': generated_message
+        }
+        with metrics.stage('send'):
+            message_response = client.post(message_send_endpoint, data=message_data)
+        error = send_error(message_response)
+        if error:
+            logging.error(f'Trouble ticket for vendor {i_vendor} failed: {error}')
+            continue
+        for group in groups.values():
+            for cdr in group.cdrs:
+                record_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
+
+
+def process_call_history(start_time, end_time):
+    """Send a generated trouble ticket for each failed call between start_time and end_time. Returns True on success."""
+    # Data for the call history API request
+    call_history_data = {
+        'show': 'all' if qos_mode == 'threshold' else 'bad',
+        'date_from': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'date_to': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    with metrics.stage('fetch'):
+        # Send the call history request, the body is read below while it downloads
+        call_history_response = client.post(call_history_endpoint, data=call_history_data, stream=True)
+
+        # Check if the call history request was successful
+        if call_history_response.status_code != 200:
+            call_history_response.close()
+            logging.error("Call history request failed")
+            return False
+
+    # CDRs are decoded one at a time from the 'cdrs' array and filtered on disconnect_reason right away,
+    # only the failed ones are kept; the other members of the response (status) are collected in fields
+    fields = {}
+    with call_history_response, metrics.stage('filter'):
+        if qos_mode == 'threshold':
+            # numpy is only loaded when the route statistics are needed
+            from qos_analytics import StreamingCDRSelector
+            selector = StreamingCDRSelector(disconnect_reasons)
+        failed_cdrs = []
+
+        def not_sent(cdr):
+            return not check_if_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
+
+        try:
+            for cdr in iter_response_array(call_history_response, 'cdrs', fields):
+                if qos_mode == 'threshold':
+                    # Every call counts towards the route statistics, failed calls already ticketed are not kept
+                    selector.add(cdr, keep=not_sent)
+                elif cdr.get('disconnect_reason') in disconnect_reasons and not_sent(cdr):
+                    failed_cdrs.append(cdr)
+        # Only decoding errors, a CDR with unexpected values is counted by the selector as it is
+        except json.JSONDecodeError:
+            logging.error("Error decoding the call history response as JSON")
+            return False
+        if fields.get('status') != 'success':
+            logging.error("Call history request returned an error. Details: %s", fields)
+            return False
+        if qos_mode == 'threshold':
+            # Only failures on routes whose failure rate or ASR crosses qos_thresholds are reported
+            failed_cdrs, route_stats = selector.select(**qos_thresholds)
+            for route in route_stats.rows(route_stats.flagged(**qos_thresholds)):
+                logging.info(f"Low QoS route: vendor {route['i_vendor']}, route {route['connection_name']}, prefix {route['prefix']}, "
+                             f"{route['failures']}/{route['attempts']} failed, ASR {route['asr']:.2f}, ACD {route['acd']:.0f}s")
+
+    logging.info('Call history request was successful.')
+    if ticket_mode == 'aggregated':
+        send_aggregated_tickets(failed_cdrs)
+    else:
+        generated_messages = ticket_templates.render_many(failed_cdrs)
+        for cdr, generated_message in zip(failed_cdrs, generated_messages):
+            logging.info(f'Call failure detected for call id {cdr["call_id"]}, destination {cdr["CLD"]}, vendor {cdr["i_vendor"]}.')
+            if generated_message is None:
+                continue
+            message_data = {
+                'id': cdr['i_vendor'],
+                'subject': f"Trouble Ticket #{get_random_ticket_id(10)}: Noted Call Failure to {cdr['CLD']}",
+                'message': generated_message
+            }
+            with metrics.stage('send'):
+                message_response = client.post(message_send_endpoint, data=message_data)
+            # Only a delivered ticket is recorded, a failed one is sent again for the next window
+            error = send_error(message_response)
+            if error:
+                logging.error(f'Trouble ticket for call id {cdr["call_id"]} failed: {error}')
+                continue
+            record_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
+    sent_messages.flush()
+    return True
+
+
+def main(argv=None):
+    global client, sent_messages, generator, ticket_templates
+    global polling_mode, window_minutes, qos_mode, ticket_mode, message_generator
+    parser = argparse.ArgumentParser(description='Raise OpenAI-written trouble tickets for failed calls in the call history')
+    parser.add_argument('--mode', choices=['window', 'incremental', 'daemon'], default=polling_mode, help='polling mode')
+    parser.add_argument('--window-minutes', type=int, default=window_minutes, help='call history window of the first query')
+    parser.add_argument('--qos-mode', choices=['threshold', 'per_call'], default=qos_mode)
+    parser.add_argument('--ticket-mode', choices=['aggregated', 'per_call'], default=ticket_mode)
+    parser.add_argument('--generator', choices=['openai', 'local'], default=message_generator, help='message generator')
+    args = parser.parse_args(argv)
+    polling_mode, window_minutes, qos_mode, ticket_mode = args.mode, args.window_minutes, args.qos_mode, args.ticket_mode
+    message_generator = args.generator
+
+    # Set up logging
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S',
+                        handlers=[logging.FileHandler("debug.log"),
+                                  logging.StreamHandler()])
+
+    logging.info('Script started.')
+
+    if message_generator == 'openai':
+        import openai
+        openai.api_key = openai_api_key
+        generator = OpenAIGenerator(model="text-davinci-002", max_tokens=500)
+    else:
+        generator = LocalGenerator()
+    ticket_templates = TicketTemplateCache(generator, 'ticket_templates.json', max_workers=llm_workers)
+
+    client = get_client()
+    sent_messages = SentMessageStore(sent_messages_file)
+    atexit.register(sent_messages.close)
+
+    if polling_mode == 'daemon':
+        poll(process_call_history, watermark, window_minutes, overlap_minutes, poll_interval)
+    elif polling_mode == 'incremental':
+        run_incremental(process_call_history, watermark, window_minutes, overlap_minutes)
+    else:
+        # Time settings for the call history API request
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(minutes=window_minutes)
+        process_call_history(start_time, end_time)
+
+    logging.info('Script finished.')
+
 
-# Send GET request for call history
-call_history_response = requests.post(call_history_url, headers=headers, data=call_history_data,
-                                      auth=HTTPDigestAuth(username, password))
-
-# Check if the call history request was successful
-if call_history_response.status_code == 200:
-    try:
-        call_history_info = call_history_response.json()
-        if call_history_info.get('status') == 'success':
-            logging.info('Call history request was successful.')
-            cdrs = call_history_info.get('cdrs')
-            for cdr in cdrs:
-                disconnect_reason = cdr.get('disconnect_reason')
-                if disconnect_reason in disconnect_reasons and not check_if_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor']):
-                    logging.info(f'Call failure detected for call id {cdr["call_id"]}, destination {cdr["CLD"]}, vendor {cdr["i_vendor"]}.')
-                    generated_message = generate_message(cdr)
-                    message_data = {
-                        'id': cdr['i_vendor'],
-                        'subject': f"Trouble Ticket #{get_random_ticket_id(10)}: Noted Call Failure to {cdr['CLD']}",
-                        'message': generated_message
-                    }
-                    message_response = requests.post(message_send_url, headers=headers, data=message_data,
-                                                      auth=HTTPDigestAuth(username, password))
-                    record_message_sent(cdr['call_id'], cdr['CLD'], cdr['i_vendor'])
-        else:
-            logging.error("Call history request returned an error. Details: ", call_history_info)
-    except ValueError:
-        logging.error("Error decoding the call history response as JSON")
-else:
-    logging.error("Call history request failed")
-
-logging.info('Script finished.')
+if __name__ == '__main__':
+    main()
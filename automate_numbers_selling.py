@@ -9,89 +9,250 @@
     and then sends a message to the subscribed buyers informing them of the new numbers listed for sale.
 """
 
-from requests.auth import HTTPDigestAuth
-import requests
+import argparse
+import csv
 import logging
 import json
+import os
+from datetime import datetime
+from tcxc_client import TCXCAPIError, fan_out, get_client, paginate
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, filename='did_log.log', filemode='w', format='%(asctime)s - %(message)s')
+# Shared TelecomsXChange client, credentials and base URL are configured in tcxc_client.py (set by main)
+client = None
 
-# TelecomsXChange API Credentials
-username = "{API Login}"
-password = "{API Key}"
+# API endpoints
+did_add_endpoint = "/sellers/did/add"
+buyers_list_endpoint = "/sellers/buyers/list"
+message_send_endpoint = "/sellers/message/send"
 
 # List of numbers to sell
 did_numbers = ["19542405440", "19542405441", "19542405442", "19542405443"]
 
+# Listing data used for every number, inventory file rows override these fields per number
+default_did_data = {
+    'price_1': "0.02",
+    'interval_1': "60",
+    'monthly_fee': "10",
+    'setup_fee': "10.00",
+    'did_type': "mobile",
+    'voice': "1",
+    'sms': "1",
+    'smpp_price': "0.01",
+    'capacity': "5",
+    'status': "idle",
+    'parent': 'international'
+}
+
+# Bulk listing: set to a .csv (header row with 'number' and any did_data fields) or .jsonl inventory file
+# to stream numbers and per-number pricing from it instead of did_numbers
+inventory_file = None
+
+# Result ledger, also used as checkpoint: numbers already listed in it are skipped when the run is resumed
+ledger_file = 'did_listing_ledger.csv'
+
+# Concurrent listing requests and request budget (requests per second)
+max_in_flight = 8
+requests_per_second = 10
+
 # This will be used to store the messages for each number
 did_messages = []
 
-# Iterate through each number
-for number in did_numbers:
-    # API endpoint
-    url = "https://apiv2.telecomsxchange.com/sellers/did/add"
-
-    # Data to be sent to API
-    did_data = {
-        'number': number,
-        'price_1': "0.02",
-        'interval_1': "60",
-        'monthly_fee': "10",
-        'setup_fee': "10.00",
-        'did_type': "mobile",
-        'voice': "1",
-        'sms': "1",
-        'smpp_price': "0.01",
-        'capacity': "5",
-        'status': "idle",
-        'parent': 'international'
-    }
-
-    # Send the request
-    response = requests.post(url, data=did_data, auth=HTTPDigestAuth(username, password))
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        result = response.json()
-        if 'status' in result and result['status'] == 'success':
-            logging.info(f"DID Number {did_data['number']} was successfully listed for sale. 🎉")
-            if did_data['status'] != 'blocked':
-                # Add the did data to the messages list
-                did_messages.append(did_data)
+
+def read_inventory(path):
+    """Stream did_data dicts from a CSV or JSON lines inventory file."""
+    with open(path, 'r', newline='') as f:
+        if path.endswith('.jsonl') or path.endswith('.json'):
+            rows = (json.loads(line) for line in f if line.strip())
         else:
-            logging.error(f"There was an error listing the DID Number {did_data['number']} for sale. Response: {response.content} 😕")
+            rows = csv.DictReader(f)
+        for row in rows:
+            row = {key: str(value).strip() for key, value in row.items() if value not in (None, '')}
+            if row.get('number'):
+                yield dict(default_did_data, **row)
+
+
+def read_listed_numbers(path):
+    """Return the numbers already listed according to the ledger."""
+    listed = set()
+    if os.path.exists(path):
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                if row.get('status') == 'listed':
+                    listed.add(row['number'])
+    return listed
+
+
+def list_did(did_data):
+    """List one number for sale and return (success, response text)."""
+    response = client.post(did_add_endpoint, data=did_data)
+    if response.status_code != 200:
+        return False, response.text
+    try:
+        result = response.json()
+    except ValueError:
+        return False, response.text
+    return result.get('status') == 'success', response.text
+
+
+def list_numbers():
+    """List the numbers of inventory_file (or did_numbers) for sale, collecting the ones to announce in did_messages."""
+    if inventory_file:
+        listed = read_listed_numbers(ledger_file)
+        pending = (did_data for did_data in read_inventory(inventory_file) if did_data['number'] not in listed)
+        new_ledger = not os.path.exists(ledger_file)
+        succeeded = failed = 0
+        with open(ledger_file, 'a', newline='') as ledger:
+            writer = csv.writer(ledger)
+            if new_ledger:
+                writer.writerow(['number', 'status', 'detail', 'timestamp'])
+            for did_data, result, error in fan_out(list_did, pending, max_in_flight):
+                success, detail = (False, f"Exception: {error}") if error else result
+                writer.writerow([did_data['number'], 'listed' if success else 'failed', '' if success else detail,
+                                 datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')])
+                # Every result is flushed so an interrupted run resumes from the last listed number
+                ledger.flush()
+                if success:
+                    succeeded += 1
+                    logging.info(f"DID Number {did_data['number']} was successfully listed for sale. 🎉")
+                    if did_data['status'] != 'blocked':
+                        did_messages.append(did_data)
+                else:
+                    failed += 1
+                    logging.error(f"There was an error listing the DID Number {did_data['number']} for sale. Response: {detail} 😕")
+        logging.info(f"Bulk listing finished: {succeeded} listed, {failed} failed, {len(listed)} skipped as already listed.")
     else:
-        logging.error(f"There was an error processing the request. Response: {response.content} 😕")
-
-# If there are any messages, send them to the buyers
-if did_messages:
-    # Send message to buyers about new DID number
-    buyers_url = "https://apiv2.telecomsxchange.com/sellers/buyers/list"
-    buyers_response = requests.post(buyers_url, auth=HTTPDigestAuth(username, password))
-
-    if buyers_response.status_code == 200:
-        buyers = buyers_response.json()['buyers']
-        for buyer in buyers:
-            message_send_url = "https://apiv2.telecomsxchange.com/sellers/message/send"
-            message_text = "Dear " + buyer['login'] + ",\n\nWe have recently listed new DID numbers on the marketplace for sale. Here are the details:\n\n"
-            for did in did_messages:
-                message_text += f"Number: {did['number']}\nPrice: {did['price_1']}\nInterval: {did['interval_1']}\nMonthly Fee: {did['monthly_fee']}\nSetup Fee: {did['setup_fee']}\nDID Type: {did['did_type']}\nVoice: {did['voice']}\nSMS: {did['sms']}\nSMPP Price: {did['smpp_price']}\nCapacity: {did['capacity']}\nStatus: {did['status']}\n\n"
-            message_text += "Best Regards,\n"
-
-            message_data = {
-                'id': buyer['i_customer'],
-                'subject': "New DID Numbers Listed for sale",
-                'message': message_text
-            }
-
-            message_response = requests.post(message_send_url, data=message_data, auth=HTTPDigestAuth(username, password))
-
-            if message_response.status_code == 200:
-                message_result = message_response.json()
-                if 'status' in message_result and message_result['status'] == 'success':
-                    logging.info(f"Message {message_result['i_message']} was successfully sent to buyer {buyer['login']}. 🎉")
+        # Iterate through each number
+        for number in did_numbers:
+            # Data to be sent to API
+            did_data = dict(default_did_data, number=number)
+
+            # Send the request
+            response = client.post(did_add_endpoint, data=did_data)
+
+            # Check if the request was successful
+            if response.status_code == 200:
+                result = response.json()
+                if 'status' in result and result['status'] == 'success':
+                    logging.info(f"DID Number {did_data['number']} was successfully listed for sale. 🎉")
+                    if did_data['status'] != 'blocked':
+                        # Add the did data to the messages list
+                        did_messages.append(did_data)
                 else:
-                    logging.error(f"Failed to send message to buyer {buyer['login']}. Response: {message_response.content} 😕")
+                    logging.error(f"There was an error listing the DID Number {did_data['number']} for sale. Response: {response.content} 😕")
             else:
-                logging.error(f"There was an error processing the request. Response: {message_response.content} 😕")
+                logging.error(f"There was an error processing the request. Response: {response.content} 😕")
+
+
+# Buyer notification settings: numbers per message, concurrent messages and per-buyer status file
+dids_per_message = 200
+notify_in_flight = 8
+notification_status_file = 'buyer_notifications.csv'
+
+message_intro = ",\n\nWe have recently listed new DID numbers on the marketplace for sale. Here are the details:\n\n"
+
+# Message blocks of the announced numbers, rendered once by notify_buyers
+did_blocks = []
+
+
+def render_did_chunks(dids, chunk_size):
+    """Render the DID listing text once, split into blocks of at most chunk_size numbers."""
+    entries = [f"Number: {did['number']}\nPrice: {did['price_1']}\nInterval: {did['interval_1']}\nMonthly Fee: {did['monthly_fee']}\nSetup Fee: {did['setup_fee']}\nDID Type: {did['did_type']}\nVoice: {did['voice']}\nSMS: {did['sms']}\nSMPP Price: {did['smpp_price']}\nCapacity: {did['capacity']}\nStatus: {did['status']}\n\n"
+               for did in dids]
+    return ["".join(entries[i:i + chunk_size]) for i in range(0, len(entries), chunk_size)]
+
+
+def notify_buyer(buyer):
+    """Send every DID block to one buyer and return the list of (part, success, detail)."""
+    statuses = []
+    for part, did_block in enumerate(did_blocks, start=1):
+        subject = "New DID Numbers Listed for sale"
+        if len(did_blocks) > 1:
+            subject += f" (part {part}/{len(did_blocks)})"
+        message_data = {
+            'id': buyer['i_customer'],
+            'subject': subject,
+            'message': "Dear " + buyer['login'] + message_intro + did_block + "Best Regards,\n"
+        }
+
+        # A failed part is recorded on its own, so parts already sent are never reported as failed
+        try:
+            message_response = client.post(message_send_endpoint, data=message_data)
+        except Exception as e:
+            statuses.append((part, False, f"Exception: {e}"))
+            continue
+
+        if message_response.status_code == 200:
+            try:
+                message_result = message_response.json()
+            except ValueError:
+                statuses.append((part, False, f"Error decoding the message response as JSON: {message_response.text}"))
+                continue
+            if 'status' in message_result and message_result['status'] == 'success':
+                statuses.append((part, True, message_result.get('i_message')))
+            else:
+                statuses.append((part, False, message_response.text))
+        else:
+            statuses.append((part, False, f"HTTP {message_response.status_code}: {message_response.text}"))
+    return statuses
+
+
+def notify_buyers():
+    """Send the numbers in did_messages to every buyer, appending one status row per buyer and message part."""
+    global did_blocks
+    # The DID listing is the same for every buyer, so it is rendered once
+    did_blocks = render_did_chunks(did_messages, dids_per_message)
+
+    # Send message to buyers about new DID number, reading the buyers list page by page
+    buyers = paginate(client, buyers_list_endpoint, {}, 'buyers', page_size=500)
+    notified = failed = 0
+    # Rows of every run are kept, told apart by the time the run started
+    run = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    new_status_file = not os.path.exists(notification_status_file)
+    try:
+        with open(notification_status_file, 'a', newline='') as status_file:
+            writer = csv.writer(status_file)
+            if new_status_file:
+                writer.writerow(['run', 'i_customer', 'login', 'part', 'status', 'detail'])
+            for buyer, statuses, error in fan_out(notify_buyer, buyers, notify_in_flight):
+                if error:
+                    statuses = [(part, False, f"Exception: {error}") for part in range(1, len(did_blocks) + 1)]
+                # A malformed buyer row fails on its own instead of stopping the notification loop
+                i_customer, login = buyer.get('i_customer'), buyer.get('login')
+                for part, success, detail in statuses:
+                    writer.writerow([run, i_customer, login, part, 'sent' if success else 'failed', detail])
+                    if success:
+                        logging.info(f"Message {detail} was successfully sent to buyer {login}. 🎉")
+                    else:
+                        logging.error(f"Failed to send message to buyer {login}. Response: {detail} 😕")
+                if all(success for _, success, _ in statuses):
+                    notified += 1
+                else:
+                    failed += 1
+    except TCXCAPIError as e:
+        logging.error(f"There was an error processing the request. Response: {e} 😕")
+    logging.info(f"Buyer notification finished: {notified} buyers notified, {failed} with failed messages, "
+                 f"{len(did_messages)} numbers in {len(did_blocks)} message(s) each.")
+
+
+def main(argv=None):
+    global client, inventory_file
+    parser = argparse.ArgumentParser(description='List DID numbers for sale and announce them to the buyers')
+    parser.add_argument('--inventory', default=inventory_file, help='CSV or JSON lines inventory of numbers to list')
+    args = parser.parse_args(argv)
+    inventory_file = args.inventory
+
+    # Setup logging
+    logging.basicConfig(level=logging.INFO, filename='did_log.log', filemode='w', format='%(asctime)s - %(message)s')
+
+    client = get_client()
+    # The request budget is enforced by the client's governor, shared with any other caller of the endpoint
+    client.governor.set_rate(did_add_endpoint, requests_per_second)
+
+    list_numbers()
+    # If there are any messages, send them to the buyers
+    if did_messages:
+        notify_buyers()
+
+
+if __name__ == '__main__':
+    main()
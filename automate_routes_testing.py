@@ -6,112 +6,246 @@ This script automates the process of testing SIP trunks on the TelecomsXChange/N
 It fetches a list of all SIP providers, lets the user choose a provider for testing, 
 fetches test numbers based on the user's selected country and network, and then initiates 
 a test call to the chosen numbers through the selected provider.
-"""
 
-import requests
-from requests.auth import HTTPDigestAuth
-import getpass
-import inquirer
-import tabulate
-import re
+Batch mode runs a whole test matrix without prompts, e.g. from cron:
 
-# Your TCXC credentials
-username = input("Please enter your username: ")
-password = getpass.getpass("
+    python3 automate_routes_testing.py --batch matrix.csv --i-account 12345 --cli 15551234567
 
+The matrix is a CSV file with the columns i_connection, country and description, and optionally
+cld1, cld2, cli1 and cli2. Test numbers missing from a row are fetched from /buyers/tools/getnumbers.
+Tests run concurrently with a per-connection cap, every status_text is appended to the results
+table, and combinations tested within the last --retest-after hours are skipped.
+Credentials for batch mode are configured in tcxc_client.py.
+"""
 
-# TCXC Base API URL
-base_url = "https://apiv2.telecomsxchange.com"
-                           
-# NeuTrafix (NTX) Base API URL
-# base_url = "https://apiv2.neutrafix.telin.net"
+import argparse
+import csv
+import getpass
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import zip_longest
+from tcxc_client import fan_out, get_client
+import reference_cache
 
 # API endpoints
 sellers_list_endpoint = "/sellers/list"
 get_numbers_endpoint = "/buyers/tools/getnumbers"
 route_test_endpoint = "/buyers/routetest"
 
-# TCXC/NTX API Credentials
-username = ''
-password = ''
-
-
-# Getting sellers list
-sellers_list_response = requests.post(
-    base_url + sellers_list_endpoint,
-    data={"pager": 300, "off": 0},
-    auth=HTTPDigestAuth(username, password))
-
-
-sellers_list = sellers_list_response.json()['routes']
-
-# Displaying the sellers' list as a table
-print("📋 Here is the list of available sellers with their i_connections and routes:")
-headers = ["Seller Name", "i_Connection", "Route Name"]
-table = [[seller['seller_name'], seller['i_connection'], seller['route_name']] for seller in sellers_list]
-print(tabulate(table, headers, tablefmt="pretty"))
-
-# User input for i_connection
-i_connection = input("💼 Please select the i_connection of the seller you'd like to test the call through: ")
-
-# Validate user input
-while not i_connection.isnumeric():
-    print("🔴 Error: Invalid input. Please enter a numeric value.")
+RESULT_FIELDS = ["tested_at", "i_connection", "cld1", "cld2", "cli1", "cli2", "status_text"]
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# Reference data (sellers list, test numbers) is cached on disk, set to True to refresh it on every run
+refresh_cache = False
+
+
+def print_table(table, headers):
+    # tabulate is only loaded when a table is printed
+    from tabulate import tabulate
+    print(tabulate(table, headers, tablefmt="pretty"))
+
+
+def get_test_numbers(client, country, description):
+    return reference_cache.get_test_numbers(client, country, description, refresh=refresh_cache)
+
+
+def route_test(client, i_account, i_connection, cld1, cli1, cld2, cli2):
+    """Initiate a test call through i_connection and return the status_text."""
+    initiate_test_data = {
+        "i_account": i_account,
+        "cld1": cld1,
+        "cli1": cli1,
+        "i_connection1": i_connection,
+        "cld2": cld2,
+        "cli2": cli2,
+        "i_connection2": i_connection
+    }
+    initiate_test_response = client.post(
+        route_test_endpoint,
+        data=initiate_test_data)
+    return initiate_test_response.json()['status_text']
+
+
+def read_recent_tests(results_file, retest_after_hours):
+    """Return the (i_connection, cld1, cld2) combinations with a test result within the last retest_after_hours."""
+    recent = set()
+    if not os.path.exists(results_file):
+        return recent
+    cutoff = (datetime.utcnow() - timedelta(hours=retest_after_hours)).strftime(DATE_FORMAT)
+    with open(results_file, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            # Rows of failed requests (timeouts, connection errors) are retried on the next run
+            status_text = row.get('status_text') or ''
+            if row['tested_at'] >= cutoff and status_text and not status_text.startswith('Error:'):
+                recent.add((row['i_connection'], row['cld1'], row['cld2']))
+    return recent
+
+
+def build_tests(client, matrix_file, cli, tests_per_row):
+    """Expand the matrix rows into test dicts, fetching test numbers once per (country, description)."""
+    numbers_cache = {}
+    tests = []
+    with open(matrix_file, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            row = {key: (value or '').strip() for key, value in row.items()}
+            cli1 = row.get('cli1') or cli
+            cli2 = row.get('cli2') or cli1
+            if row.get('cld1'):
+                pairs = [(row['cld1'], row.get('cld2') or row['cld1'])]
+            else:
+                key = (row.get('country', ''), row.get('description', ''))
+                if key not in numbers_cache:
+                    numbers_cache[key] = [number['CLD'] for number in get_test_numbers(client, *key)]
+                numbers = numbers_cache[key][:2 * tests_per_row]
+                pairs = [(cld1, cld2 or cld1) for cld1, cld2 in zip_longest(numbers[0::2], numbers[1::2])]
+            for cld1, cld2 in pairs:
+                tests.append({'i_connection': row['i_connection'], 'cld1': str(cld1), 'cld2': str(cld2),
+                              'cli1': cli1, 'cli2': cli2})
+    return tests
+
+
+def interleave_by_connection(tests):
+    """Order tests round-robin across connections so the per-connection cap rarely blocks a worker."""
+    by_connection = defaultdict(list)
+    for test in tests:
+        by_connection[test['i_connection']].append(test)
+    for batch in zip_longest(*by_connection.values()):
+        for test in batch:
+            if test is not None:
+                yield test
+
+
+def run_batch(client, matrix_file, i_account, cli, results_file='route_test_results.csv', max_in_flight=16,
+              per_connection=2, retest_after_hours=24, tests_per_row=1):
+    """Run every test of the matrix and append the results. Returns the list of result rows."""
+    recent = read_recent_tests(results_file, retest_after_hours)
+    tests = [test for test in build_tests(client, matrix_file, cli, tests_per_row)
+             if (test['i_connection'], test['cld1'], test['cld2']) not in recent]
+    print(f"🧪 Running {len(tests)} route tests ({len(recent)} recently tested combinations skipped).")
+
+    connection_slots = defaultdict(lambda: threading.Semaphore(per_connection))
+    slots_lock = threading.Lock()
+
+    def run_test(test):
+        with slots_lock:
+            slot = connection_slots[test['i_connection']]
+        with slot:
+            return route_test(client, i_account, test['i_connection'], test['cld1'], test['cli1'],
+                              test['cld2'], test['cli2'])
+
+    new_file = not os.path.exists(results_file)
+    results = []
+    with open(results_file, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        for test, status_text, error in fan_out(run_test, interleave_by_connection(tests), max_in_flight):
+            row = dict(test, tested_at=datetime.utcnow().strftime(DATE_FORMAT),
+                       status_text=status_text if error is None else f"Error: {error}")
+            writer.writerow(row)
+            f.flush()
+            results.append(row)
+
+    headers = ["i_Connection", "CLD1", "CLD2", "Status"]
+    table = [[row['i_connection'], row['cld1'], row['cld2'], row['status_text']] for row in results]
+    print_table(table, headers)
+    return results
+
+
+def run_interactive():
+    # Your TCXC/NTX credentials
+    username = input("Please enter your username: ")
+    password = getpass.getpass("Please enter your password: ")
+
+    # Shared TCXC/NTX client, base URL is configured in tcxc_client.py
+    client = get_client(username, password)
+
+    # Getting sellers list
+    sellers_list = reference_cache.get_sellers_list(client, refresh=refresh_cache)
+
+    # Displaying the sellers' list as a table
+    print("📋 Here is the list of available sellers with their i_connections and routes:")
+    headers = ["Seller Name", "i_Connection", "Route Name"]
+    table = [[seller['seller_name'], seller['i_connection'], seller['route_name']] for seller in sellers_list]
+    print_table(table, headers)
+
+    # User input for i_connection
     i_connection = input("💼 Please select the i_connection of the seller you'd like to test the call through: ")
 
-# Getting test numbers
-country = input("🌍 Please enter the country you'd like to fetch the test number from: ")
-description = input("📄 Please enter the network (description) you'd like to fetch the test number from: ")
-
-get_numbers_response = requests.get(
-    base_url + get_numbers_endpoint,
-    params={"country": country, "description": description},
-    auth=HTTPDigestAuth(username, password))
+    # Validate user input
+    while not i_connection.isnumeric():
+        print("🔴 Error: Invalid input. Please enter a numeric value.")
+        i_connection = input("💼 Please select the i_connection of the seller you'd like to test the call through: ")
 
-numbers = get_numbers_response.json()['cdrs']
+    # Getting test numbers
+    country = input("🌍 Please enter the country you'd like to fetch the test number from: ")
+    description = input("📄 Please enter the network (description) you'd like to fetch the test number from: ")
 
-# Displaying the numbers' list as a table
-print("📋 Here is the list of available test numbers:")
-headers = ["Number", "Description", "Country"]
-table = [[number['CLD'], number['description'], number['country_name']] for number in numbers]
-print(tabulate(table, headers, tablefmt="pretty"))
+    numbers = get_test_numbers(client, country, description)
 
-# User input for cld1 and cld2
-cld1 = input("🎯 Please enter the test number for the first leg of the call (cld1): ")
-cld2 = input("🎯 Please enter the test number for the second leg of the call (cld2): ")
+    # Displaying the numbers' list as a table
+    print("📋 Here is the list of available test numbers:")
+    headers = ["Number", "Description", "Country"]
+    table = [[number['CLD'], number['description'], number['country_name']] for number in numbers]
+    print_table(table, headers)
 
-# User input for i_account
-i_account = input("🔑 Please enter your i_account value which can be found in TCXC portal under account settings: ")
+    # User input for cld1 and cld2
+    cld1 = input("🎯 Please enter the test number for the first leg of the call (cld1): ")
+    cld2 = input("🎯 Please enter the test number for the second leg of the call (cld2): ")
 
-# Validate user input
-while not i_account.isnumeric():
-    print("🔴 Error: Invalid input. Please enter a numeric value.")
+    # User input for i_account
     i_account = input("🔑 Please enter your i_account value which can be found in TCXC portal under account settings: ")
 
-# User input for cli1 and cli2
-cli1 = input("📞 Please enter the caller id to be shown for the first leg of the call (cli1): ")
-cli2 = input("📞 Please enter the caller id to be shown for the second leg of the call (cli2): ")
+    # Validate user input
+    while not i_account.isnumeric():
+        print("🔴 Error: Invalid input. Please enter a numeric value.")
+        i_account = input("🔑 Please enter your i_account value which can be found in TCXC portal under account settings: ")
 
-# Validate user input
-while not cli1.isnumeric() or not cli2.isnumeric():
-    print("🔴 Error: Invalid input. Please enter numeric values.")
+    # User input for cli1 and cli2
     cli1 = input("📞 Please enter the caller id to be shown for the first leg of the call (cli1): ")
     cli2 = input("📞 Please enter the caller id to be shown for the second leg of the call (cli2): ")
 
-# Initiate the test call
-initiate_test_data = {
-    "i_account": i_account,
-    "cld1": cld1,
-    "cli1": cli1,
-    "i_connection1": i_connection,
-    "cld2": cld2,
-    "cli2": cli2,
-    "i_connection2": i_connection
-}
-
-initiate_test_response = requests.post(
-    base_url + route_test_endpoint,
-    data=initiate_test_data,
-    auth=HTTPDigestAuth(username, password))
-
-print("📞 " + initiate_test_response.json()['status_text'])
+    # Validate user input
+    while not cli1.isnumeric() or not cli2.isnumeric():
+        print("🔴 Error: Invalid input. Please enter numeric values.")
+        cli1 = input("📞 Please enter the caller id to be shown for the first leg of the call (cli1): ")
+        cli2 = input("📞 Please enter the caller id to be shown for the second leg of the call (cli2): ")
+
+    # Initiate the test call
+    print("📞 " + route_test(client, i_account, i_connection, cld1, cli1, cld2, cli2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TelecomsXChange SIP trunk testing')
+    parser.add_argument('--batch', metavar='MATRIX_CSV', help='run the test matrix without prompts')
+    parser.add_argument('--i-account', help='i_account used for the test calls (batch mode)')
+    parser.add_argument('--cli', default='', help='default caller id for rows without cli1/cli2 (batch mode)')
+    parser.add_argument('--results', default='route_test_results.csv', help='results table (CSV), appended to')
+    parser.add_argument('--max-in-flight', type=int, default=16, help='concurrent test calls')
+    parser.add_argument('--per-connection', type=int, default=2, help='concurrent test calls per i_connection')
+    parser.add_argument('--retest-after', type=float, default=24, help='hours before a combination is tested again')
+    parser.add_argument('--tests-per-row', type=int, default=1, help='test number pairs per matrix row')
+    parser.add_argument('--refresh-cache', action='store_true', help='refresh the cached sellers list and test numbers')
+    parser.add_argument('--clear-cache', action='store_true', help='remove all cached reference data and exit')
+    args = parser.parse_args(argv)
+
+    global refresh_cache
+    refresh_cache = args.refresh_cache
+    if args.clear_cache:
+        reference_cache.default_cache.invalidate()
+        return
+
+    if args.batch:
+        if not args.i_account or not args.i_account.isnumeric():
+            parser.error('--i-account must be a numeric value in batch mode')
+        run_batch(get_client(), args.batch, args.i_account, args.cli, args.results, args.max_in_flight,
+                  args.per_connection, args.retest_after, args.tests_per_row)
+    else:
+        run_interactive()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+TelecomsXChange Automation Benchmark
+
+Runs the automation scripts end to end against the local mock API (mock_tcxc_server.py) and
+reports, per workflow: wall time, API requests and throughput, error responses, p50/p99 request
+latency (measured by the mock server) and the peak resident memory of the script process. The
+saved JSON also holds the client-side endpoint latencies and stage durations of each script,
+exported by tcxc_metrics.
+
+Every workflow runs as its own process in a fresh working directory, the way cron runs the
+scripts, with TCXC_BASE_URL pointing at the mock and OpenAI requests sent to the mock's
+/v1 endpoints. Results can be saved as JSON and compared with a saved baseline; a workflow
+whose wall time, p99 latency or peak memory grew by more than the tolerance is reported as a
+regression and the exit code is 1.
+
+Usage:
+    python3 benchmark.py --size 5000 --latency 0.01 --save baseline.json
+    python3 benchmark.py --size 5000 --latency 0.01 --baseline baseline.json --tolerance 0.25
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from mock_tcxc_server import mock_password, mock_username, start_server
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_route_test_matrix(workdir, size):
+    with open(os.path.join(workdir, 'matrix.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['i_connection', 'country', 'description'])
+        for i in range(min(size, 500)):
+            writer.writerow([1000 + i, 'United Kingdom', f"Network {i % 5}"])
+
+
+# Workflow name -> (script, arguments, function preparing the working directory)
+workflows = {
+    'carrier-relations': ('automate_carrier_relations.py', [], None),
+    'low-qos': ('automate_low_qos_tt.py', [], None),
+    'low-qos-openai': ('automate_low_qos_tt_openai.py', [], None),
+    'did-buy': ('automate_did_buying.py', [], None),
+    'did-sell': ('automate_numbers_selling.py', [], None),
+    'route-test': ('automate_routes_testing.py', ['--batch', 'matrix.csv', '--i-account', '1', '--cli', '15550000000'],
+                   write_route_test_matrix),
+    'routing-strategy': ('generate_ai_routing_strategy.py', [], None),
+    'payhistory-summary': ('seller_payhistory_ai_summary.py', [], None),
+}
+
+# Metrics compared with the baseline, a higher value is worse for all of them
+regression_metrics = ('wall_seconds', 'p99_ms', 'peak_rss_mb')
+
+
+def mock_call(server, endpoint):
+    request = urllib.request.Request(server.url + endpoint, data=b'' if endpoint == '/_reset' else None)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def run_workflow(server, name, size, timeout):
+    """Run one workflow in a fresh directory and return its metrics."""
+    script, arguments, prepare = workflows[name]
+    workdir = tempfile.mkdtemp(prefix=f"tcxc-bench-{name}-")
+    try:
+        if prepare:
+            prepare(workdir, size)
+        env = dict(os.environ,
+                   TCXC_BASE_URL=server.url,
+                   TCXC_USERNAME=mock_username,
+                   TCXC_PASSWORD=mock_password,
+                   TCXC_CACHE_DIR=os.path.join(workdir, 'cache'),
+                   OPENAI_API_BASE=server.url + '/v1',
+                   OPENAI_API_KEY='mock',
+                   OPENAI_KEY='mock',
+                   TCXC_METRICS_JSON=os.path.join(workdir, 'metrics.json'),
+                   PYTHONPATH=repo_dir + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        mock_call(server, '/_reset')
+        output_path = os.path.join(workdir, 'output.log')
+        with open(output_path, 'w') as output:
+            started = time.perf_counter()
+            process = subprocess.Popen([sys.executable, os.path.join(repo_dir, script)] + arguments,
+                                       cwd=workdir, env=env, stdin=subprocess.DEVNULL, stdout=output, stderr=output)
+            timed_out = False
+            while True:
+                pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    break
+                if time.perf_counter() - started > timeout:
+                    os.kill(process.pid, signal.SIGKILL)
+                    timed_out = True
+                time.sleep(0.01)
+            wall_seconds = time.perf_counter() - started
+            # Exit code as subprocess reports it, negative for a signal (os.waitstatus_to_exitcode needs Python 3.9)
+            process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        stats = mock_call(server, '/_stats')
+        with open(output_path, 'r', errors='replace') as f:
+            tail = f.read()[-500:]
+        try:
+            with open(os.path.join(workdir, 'metrics.json'), 'r') as f:
+                client_metrics = json.load(f)
+        except (OSError, ValueError):
+            client_metrics = {}
+        return {
+            'workflow': name,
+            'exit_code': process.returncode,
+            'timed_out': timed_out,
+            'wall_seconds': round(wall_seconds, 3),
+            'requests': stats['requests'],
+            'throughput_rps': round(stats['requests'] / wall_seconds, 1) if wall_seconds else 0.0,
+            'errors': stats['errors'],
+            'p50_ms': stats['p50_ms'],
+            'p99_ms': stats['p99_ms'],
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+            'endpoints': stats['endpoints'],
+            # Latency seen by the script (including retries and network) and its stage durations, from tcxc_metrics
+            'client_endpoints': client_metrics.get('endpoints', {}),
+            'stages': client_metrics.get('stages', {}),
+            'output_tail': tail if process.returncode else '',
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """Return the (workflow, metric, baseline, current) regressions beyond tolerance."""
+    previous = {result['workflow']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(result['workflow'])
+        if not before or result['exit_code'] or before['exit_code']:
+            continue
+        for metric in regression_metrics:
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append((result['workflow'], metric, before[metric], result[metric]))
+    return regressions
+
+
+def print_results(results):
+    columns = ['workflow', 'exit_code', 'wall_seconds', 'requests', 'throughput_rps', 'errors', 'p50_ms', 'p99_ms', 'peak_rss_mb']
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        if result['exit_code']:
+            print(f"\n{result['workflow']} exited with {result['exit_code']}"
+                  f"{' (timed out)' if result['timed_out'] else ''}:\n{result['output_tail']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the automation scripts against the local mock API')
+    parser.add_argument('workflows', nargs='*', help=f"workflows to run (default: all of {', '.join(workflows)})")
+    parser.add_argument('--size', type=int, default=1000, help='items per mock list endpoint')
+    parser.add_argument('--latency', type=float, default=0.01, help='mean mock API latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of mock requests answered with 503')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='mock answers 429 above this many requests in flight')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='latency of the mock OpenAI completions')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds before a workflow is killed')
+    parser.add_argument('--save', metavar='JSON', help='write the results to a JSON file')
+    parser.add_argument('--baseline', metavar='JSON', help='compare with results saved by --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth before a regression is reported')
+    args = parser.parse_args()
+
+    names = args.workflows or list(workflows)
+    unknown = [name for name in names if name not in workflows]
+    if unknown:
+        parser.error(f"unknown workflows: {', '.join(unknown)}")
+
+    server = start_server(size=args.size, latency=args.latency, error_rate=args.error_rate,
+                          max_concurrency=args.max_concurrency, llm_latency=args.llm_latency)
+    try:
+        results = []
+        for name in names:
+            print(f"Running {name}...", file=sys.stderr)
+            results.append(run_workflow(server, name, args.size, args.timeout))
+    finally:
+        server.shutdown()
+
+    print_results(results)
+    settings = {'size': args.size, 'latency': args.latency, 'error_rate': args.error_rate,
+                'max_concurrency': args.max_concurrency, 'llm_latency': args.llm_latency}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != settings:
+            print(f"\nWarning: baseline was recorded with different settings: {baseline.get('settings')}")
+        regressions = compare(results, baseline, args.tolerance)
+        for workflow, metric, before, after in regressions:
+            print(f"Regression: {workflow} {metric} {before} -> {after}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Incremental Call History Poller
+
+Watermark-based polling for the trouble ticket scripts. Instead of re-querying a fixed window
+of /buyers/callhistory/ on every run, the end of the last successfully processed window is
+persisted as a high-water mark. The next run only asks for the interval since the watermark,
+plus a small overlap so CDRs that arrive late are not missed. Duplicates from the overlap are
+dropped by the sent messages store.
+
+poll() runs the same step as a long-lived daemon on a fixed interval.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class Watermark:
+    """High-water mark (UTC datetime) persisted in a small text file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            value = f.read().strip()
+        try:
+            return datetime.strptime(value, DATE_FORMAT)
+        except ValueError:
+            logging.warning(f"Ignoring unreadable watermark in {self.path}: {value!r}")
+            return None
+
+    def save(self, value):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(value.strftime(DATE_FORMAT) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+def next_window(watermark, initial_minutes, overlap_minutes=5, now=None):
+    """Return the (start_time, end_time) to query after the watermark.
+
+    Without a watermark the first window covers the last initial_minutes.
+    """
+    end_time = now or datetime.utcnow()
+    last = watermark.load()
+    if last is None:
+        start_time = end_time - timedelta(minutes=initial_minutes)
+    else:
+        start_time = min(last, end_time) - timedelta(minutes=overlap_minutes)
+    return start_time, end_time
+
+
+def run_incremental(process_window, watermark, initial_minutes, overlap_minutes=5):
+    """Process the window after the watermark and advance it when process_window returns True."""
+    start_time, end_time = next_window(watermark, initial_minutes, overlap_minutes)
+    logging.info(f"Fetching call history from {start_time.strftime(DATE_FORMAT)} to {end_time.strftime(DATE_FORMAT)}.")
+    if process_window(start_time, end_time):
+        watermark.save(end_time)
+        return True
+    logging.error("Call history window was not processed, the watermark was not advanced.")
+    return False
+
+
+def poll(process_window, watermark, initial_minutes, overlap_minutes=5, interval_seconds=60):
+    """Run run_incremental every interval_seconds until interrupted."""
+    logging.info(f"Polling call history every {interval_seconds} seconds. Press Ctrl+C to stop.")
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                run_incremental(process_window, watermark, initial_minutes, overlap_minutes)
+            except Exception as e:
+                logging.exception(f"Polling cycle failed: {e}")
+            time.sleep(max(0.0, interval_seconds - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        logging.info("Polling stopped.")
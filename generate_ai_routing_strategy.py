@@ -13,101 +13,129 @@ Credentials, API endpoints, and other configurations can be adjusted in the resp
 script.
 """
 
-import requests
+import argparse
 import os
-from requests.auth import HTTPDigestAuth
 import logging
-from collections import Counter
-import numpy as np
-import openai
+from tcxc_client import TCXCAPIError, get_client, iter_market_rates
+from tcxc_metrics import metrics
+from tcxc_logging import setup_logging
 
-# Set up logging
+# Root logger, handlers are added by setup_logging() in tcxc_logging.py
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-# Log to file
-file_handler = logging.FileHandler('automate_cr.log')
-file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+# Shared TCXC/NeutrafiX client, base URL is configured in tcxc_client.py (set by main)
+client = None
 
-# Also log to console
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
-
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# Data for the search API request
+search_data = {
+    'prefix': '2279',  # Replace with the dial code you're targeting
+    'searchform': '1',
+    'seller': '',
+    'type': 'CLI',  # Trunk Type - you can pass string values {cli, nocli, tdm, any}
+}
 
+# Number of routes per market view page, all pages are read
+page_size = 100
 
+# LCR table written from the rates: the lcr_top_k cheapest routes of every dial code, see rate_index.py
+lcr_table_file = 'lcr_table.csv'
+lcr_top_k = 3
 
-# OpenAI API credentials
-openai.api_key = os.environ.get('OPENAI_API_KEY')
+# Route scoring weights (see route_scoring.py) and number of ranked routes reported and sent to OpenAI
+score_weights = {'price': 0.6, 'interval': 0.1, 'asr': 0.15, 'acd': 0.1, 'pdd': 0.05}
+report_routes = 50
 
-if openai.api_key is None:
-    raise ValueError('Please set the OPENAI_API_KEY environment variable.')
+# Log file and level of this script (None uses TCXC_LOG_LEVEL, see tcxc_logging.py)
+log_file = 'automate_cr.log'
+log_level = None
 
-# Start message
-logger.info('🚀 TelecomsXChange (TCXC) Routing Strategies Automation Script started')
 
-# Telecomsxchange Buyer Credentials
-username = os.environ.get('TCXC_USERNAME')
-password = os.environ.get('TCXC_PASSWORD')
+def main(argv=None):
+    global client
+    parser = argparse.ArgumentParser(description='Suggest a least cost routing strategy from the market view rates')
+    parser.add_argument('--prefix', default=search_data['prefix'], help='dial code to analyze')
+    parser.add_argument('--lcr-table', default=lcr_table_file, help='CSV file the LCR table is written to')
+    args = parser.parse_args(argv)
+    search_data['prefix'] = args.prefix
 
-if username is None or password is None:
-    raise ValueError('Please set the TCXC_USERNAME and TCXC_PASSWORD environment variables.')
+    # numpy and openai are only loaded when the strategy is generated
+    import numpy as np
+    import openai
+    from rate_index import RateIndex
+    from route_scoring import analyze_routes
 
-# TCXC API endpoints
-search_url = 'https://apiv2.telecomsxchange.com/marketview/search'
+    setup_logging('routing-strategy', log_file, log_level)
 
-# Neutrafix API endpoints
-# search_url = 'https://apiv2.neutrafix.telin.net/marketview/search'
+    # OpenAI API credentials
+    openai.api_key = os.environ.get('OPENAI_API_KEY')
 
-# Headers for the requests
-headers = {
-    'Content-Type': 'application/x-www-form-urlencoded',
-}
+    if openai.api_key is None:
+        raise ValueError('Please set the OPENAI_API_KEY environment variable.')
 
-# Data for the search API request
-search_data = {
-    'prefix': '2279',  # Replace with the dial code you're targeting
-    'searchform': '1',
-    'seller': '',
-    'type': 'CLI',  # Trunk Type - you can pass string values {cli, nocli, tdm, any}
-    'pager': '100',
-    'off': '0',
-}
+    # Start message
+    logger.info('🚀 TelecomsXChange (TCXC) Routing Strategies Automation Script started')
 
-# Make the POST request for search
-logger.info(f'🔍 Searching TCXC market view API for Dial Code: +{search_data["prefix"]} ...\n')
-search_response = requests.post(search_url, headers=headers, data=search_data,
-                                auth=HTTPDigestAuth(username, password))
+    # Telecomsxchange Buyer Credentials
+    username = os.environ.get('TCXC_USERNAME')
+    password = os.environ.get('TCXC_PASSWORD')
 
-# Check if the search request was successful
-if search_response.status_code == 200:
-    try:
-        search_info = search_response.json()
-        if search_info.get('status') == 'success':
-            rates = search_info.get('rates')
-            logger.info('✅ Found some routes \n')
-
-            if rates:
-                # Sort the rates from lowest to highest to form the routing strategy
-                sorted_rates = sorted(rates, key=lambda rate: float(rate.get('price_1', '0')))
-
-                # Print out the routing strategy
-                logger.info('📋 Routing Strategy based on Least Cost: \n')
-                for i, rate in enumerate(sorted_rates, start=1):
-                    logger.info(
-                        f"Route {i}: Vendor = {rate.get('vendor_name')}, Connection = {rate.get('connection_name')}, Price = {rate.get('price_1')}")
-
-                # Generate a paragraph summary of the rates
-                rates_summary = "\n".join(
-                    f"Route {i}: Vendor = {rate.get('vendor_name')}, Connection = {rate.get('connection_name')}, Price = {rate.get('price_1')}"
-                    for i, rate in enumerate(sorted_rates, start=1)
-                )
+    if username is None or password is None:
+        raise ValueError('Please set the TCXC_USERNAME and TCXC_PASSWORD environment variables.')
 
-                # Generate a prompt for OpenAI API
-                prompt = f"Based on the analysis of the current rates from Telecomsxchange, please suggest an optimal routing strategy:\n\n{rates_summary}"
+    client = get_client(username, password)
 
-                # Call OpenAI API to generate the routing strategy suggestion
+    # Search the market view API, reading every page
+    logger.info(f'🔍 Searching TCXC market view API for Dial Code: +{search_data["prefix"]} ...\n')
+    try:
+        with metrics.stage('fetch'):
+            rates = list(iter_market_rates(client, search_data, page_size))
+    except TCXCAPIError as e:
+        logging.error("Search request failed. Details: %s", e)
+    else:
+        logger.info(f'✅ Found {len(rates)} routes \n')
+
+        if rates:
+            # Build the longest-prefix-match index and write it as an LCR table
+            rate_index = RateIndex(rates, lcr_top_k, default_prefix=search_data['prefix'])
+            rate_index.write_lcr_table(args.lcr_table)
+            logger.info(f'📋 LCR table with {len(rate_index)} dial codes written to {args.lcr_table}')
+
+            # Score the routes on price, billing interval and quality fields, best first
+            with metrics.stage('score'):
+                analysis = analyze_routes(rates, score_weights)
+            stats = analysis['stats']
+            sorted_rates = [rates[i] for i in analysis['ranking'][:report_routes]]
+            scores = analysis['scores'][analysis['ranking'][:report_routes]]
+
+            # Print out the routing strategy
+            logger.info(f'📋 Routing Strategy based on weighted score (top {len(sorted_rates)} of {len(rates)} routes): \n')
+            for i, (rate, score) in enumerate(zip(sorted_rates, scores), start=1):
+                logger.info(
+                    f"Route {i}: Vendor = {rate.get('vendor_name')}, Connection = {rate.get('connection_name')}, Price = {rate.get('price_1')}, Score = {score:.3f}",
+                    extra={'i_connection': rate.get('i_connection'), 'i_vendor': rate.get('i_vendor'), 'price': rate.get('price_1')})
+
+            # Price statistics, outliers and clusters
+            clusters = sorted(stats['clusters'], key=lambda cluster: cluster[3], reverse=True)[:5]
+            statistics_summary = (
+                f"Routes: {stats['routes']}, price min/median/mean/max: {stats['min_price']}/{stats['median_price']}/"
+                f"{stats['mean_price']}/{stats['max_price']}, price outliers: {stats['outliers']}\n"
+                f"Largest price clusters: " + ", ".join(f"{low:.4f}-{high:.4f} ({size} routes)" for _, low, high, size in clusters))
+            logger.info(f'📊 {statistics_summary}')
+            for i in np.flatnonzero(analysis['outliers']):
+                logger.info(f"⚠️ Price outlier: Vendor = {rates[i].get('vendor_name')}, Connection = {rates[i].get('connection_name')}, Price = {rates[i].get('price_1')}",
+                            extra={'i_connection': rates[i].get('i_connection'), 'i_vendor': rates[i].get('i_vendor'), 'price': rates[i].get('price_1')})
+
+            # Generate a paragraph summary of the rates
+            rates_summary = "\n".join(
+                f"Route {i}: Vendor = {rate.get('vendor_name')}, Connection = {rate.get('connection_name')}, Price = {rate.get('price_1')}, Score = {score:.3f}"
+                for i, (rate, score) in enumerate(zip(sorted_rates, scores), start=1)
+            ) + "\n\n" + statistics_summary
+
+            # Generate a prompt for OpenAI API
+            prompt = f"Based on the analysis of the current rates from Telecomsxchange, please suggest an optimal routing strategy:\n\n{rates_summary}"
+
+            # Call OpenAI API to generate the routing strategy suggestion
+            with metrics.stage('llm'):
                 response = openai.Completion.create(
                     engine='text-davinci-003',
                     prompt=prompt,
@@ -117,19 +145,16 @@ if search_response.status_code == 200:
                     temperature=0.7
                 )
 
-                # Extract the generated suggestion from the OpenAI API response
-                suggestion = response.choices[0].text.strip()
-
-                # Print the generated routing strategy suggestion
-                logger.info('\nRouting Strategy Suggestion:')
-                logger.info(suggestion)
+            # Extract the generated suggestion from the OpenAI API response
+            suggestion = response.choices[0].text.strip()
 
-            else:
-                logger.info('No rates available.')
+            # Print the generated routing strategy suggestion
+            logger.info('\nRouting Strategy Suggestion:')
+            logger.info(suggestion)
 
         else:
-            logging.error("Search request returned an error. Details: %s", search_info)
-    except ValueError:
-        logging.error("Error decoding the search response as JSON")
-else:
-    logging.error("Search request failed")
+            logger.info('No rates available.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Interconnect Ledger
+
+Persistent record of the connections a buyer account is already interconnected with, so
+automate_carrier_relations.py only sends /buyers/interconnect for routes it has not provisioned
+in an earlier run.
+
+The file is read once per run into a dict keyed by (i_account, i_connection), so each check is
+O(1). Successful interconnects are appended in batches with their price and the time they were
+provisioned. Connections can also be removed or added on the platform outside these scripts. When an
+interconnections list endpoint is configured, reconcile() now and then replaces the entries of an
+account with the interconnections listed by the API, and rewrites the file.
+
+The file format is one "i_account<TAB>i_connection<TAB>price<TAB>unix_time" per line, plus one
+"#reconciled<TAB>i_account<TAB>unix_time" line per account that was refreshed from the API.
+"""
+
+import os
+import time
+
+from tcxc_client import paginate
+
+# Ledger file used by automate_carrier_relations.py
+default_path = 'interconnect_ledger.tsv'
+
+# Refresh an account from the API when its last reconcile is older than this
+reconcile_days = 7
+
+# Key of the items in the buyer's interconnections list read by reconcile()
+interconnections_key = 'interconnections'
+
+
+class InterconnectLedger:
+    """(i_account, i_connection) -> (price, provisioned time), backed by an append-only file."""
+
+    def __init__(self, path=default_path, flush_every=50):
+        self.path = path
+        self.flush_every = flush_every
+        self._entries = {}
+        self._reconciled = {}
+        self._pending = []
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] == '#reconciled' and len(fields) == 3:
+                    self._reconciled[fields[1]] = float(fields[2])
+                    continue
+                if len(fields) != 4:
+                    continue
+                lines += 1
+                i_account, i_connection, price, provisioned = fields
+                self._entries[(i_account, i_connection)] = (float(price) if price else None, float(provisioned))
+        # Rewrite when repeated lines dominate the file
+        if lines > 2 * len(self._entries) + 1000:
+            self.compact()
+
+    @staticmethod
+    def _key(i_account, i_connection):
+        return str(i_account), str(i_connection)
+
+    def __contains__(self, key):
+        return self._key(*key) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, i_account, i_connection):
+        """Return (price, provisioned unix time) of a provisioned connection, or None."""
+        return self._entries.get(self._key(i_account, i_connection))
+
+    def add(self, i_account, i_connection, price=None):
+        """Record a successful interconnect."""
+        key = self._key(i_account, i_connection)
+        provisioned = time.time()
+        self._entries[key] = (price, provisioned)
+        self._pending.append(self._line(key, price, provisioned))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def needs_reconcile(self, i_account, max_age_days=reconcile_days):
+        return time.time() - self._reconciled.get(str(i_account), 0) > max_age_days * 86400
+
+    def replace(self, i_account, connections):
+        """Make the (i_connection, price) pairs the only entries of an account, as listed by the API.
+
+        Connections already in the ledger keep their provisioned time, and their price when the API has none.
+        """
+        i_account = str(i_account)
+        now = time.time()
+        entries = {key: value for key, value in self._entries.items() if key[0] != i_account}
+        for i_connection, price in connections:
+            key = self._key(i_account, i_connection)
+            known_price, provisioned = self._entries.get(key, (None, now))
+            entries[key] = (price if price is not None else known_price, provisioned)
+        self._entries = entries
+        self._reconciled[i_account] = now
+        self.compact()
+
+    @staticmethod
+    def _line(key, price, provisioned):
+        return f"{key[0]}\t{key[1]}\t{'' if price is None else price}\t{provisioned:.0f}\n"
+
+    def flush(self):
+        """Append the interconnects added since the last flush to the file."""
+        if not self._pending:
+            return
+        with open(self.path, 'a') as f:
+            f.writelines(self._pending)
+        self._pending = []
+
+    def compact(self):
+        """Rewrite the file with one line per entry, replacing it atomically."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"#reconciled\t{i_account}\t{reconciled:.0f}\n" for i_account, reconciled in self._reconciled.items())
+            f.writelines(self._line(key, price, provisioned) for key, (price, provisioned) in self._entries.items())
+        os.replace(tmp_path, self.path)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def reconcile(client, ledger, i_account, endpoint, items_key=interconnections_key, page_size=100):
+    """Replace the ledger entries of i_account with its interconnections listed by endpoint; returns their number.
+
+    Raises TCXCAPIError when the list cannot be read, leaving the ledger unchanged.
+    """
+    connections = []
+    for item in paginate(client, endpoint, {'i_account': str(i_account)}, items_key, page_size=page_size):
+        price = item.get('price_1')
+        connections.append((item.get('i_connection'), float(price) if price not in (None, '') else None))
+    ledger.replace(i_account, connections)
+    return len(connections)
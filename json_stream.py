@@ -0,0 +1,130 @@
+"""
+Streaming JSON Array Decoder
+
+Decodes one array of a large JSON response while it downloads, e.g. the 'cdrs' array of
+/buyers/callhistory/, and yields its items one at a time. Only the item being decoded and the
+current chunk are held in memory, so a long call history window no longer needs the whole body
+and every CDR dict in memory before the first one is filtered.
+
+The other top-level members (such as 'status') are small; they are decoded whole and stored in
+the fields dict passed by the caller. They can come before or after the array, so check them once
+the iteration has finished:
+
+    fields = {}
+    response = client.post(call_history_endpoint, data=call_history_data, stream=True)
+    for cdr in iter_response_array(response, 'cdrs', fields):
+        ...
+    if fields.get('status') != 'success':
+        ...
+
+Only the standard library json decoder is used (JSONDecoder.raw_decode on the buffered text).
+Malformed input raises json.JSONDecodeError, a ValueError, like response.json(). Callers can catch
+it alone, so errors raised while handling an item are not mistaken for decoding errors.
+"""
+
+import codecs
+import json
+
+# Bytes read from the response per chunk
+chunk_size = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+_delimiters = _whitespace + ',]}'
+
+
+class _Buffer:
+    """Text read so far from the chunks, and the position of the next unread character."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        # JSON is UTF-8, and a multi-byte character can be split across chunks
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+
+    def fill(self):
+        """Append the next non-empty chunk, dropping the text already consumed. False at the end."""
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                try:
+                    chunk = self.utf8.decode(chunk)
+                except UnicodeDecodeError as e:
+                    raise json.JSONDecodeError(f"Invalid UTF-8 in the JSON stream ({e.reason})", self.text, len(self.text))
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        """Skip whitespace and return the next character, '' at the end of the input."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of chars, and return it."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r} in the JSON stream, got {char or 'the end of the input'!r}",
+                                       self.text, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value, reading more chunks until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Usually the value continues in the next chunk
+                if not self.fill():
+                    raise
+                continue
+            # A number is only complete once a delimiter follows, '12' may be '12.5' or '12e3' split across chunks
+            if isinstance(value, (int, float)) and (end == len(self.text) or self.text[end] not in _delimiters) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_array(chunks, key, fields=None):
+    """Yield the items of the array under key in a JSON object read from text or bytes chunks.
+
+    The other members of the object are stored in fields, when given.
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+    while True:
+        name = buffer.value()
+        if not isinstance(name, str):
+            raise json.JSONDecodeError(f"Expected a member name in the JSON stream, got {name!r}", buffer.text, buffer.pos)
+        buffer.expect(':')
+        if name == key and buffer.peek() == '[':
+            buffer.expect('[')
+            if buffer.peek() == ']':
+                buffer.expect(']')
+            else:
+                while True:
+                    yield buffer.value()
+                    if buffer.expect(',]') == ']':
+                        break
+        else:
+            value = buffer.value()
+            if fields is not None:
+                fields[name] = value
+        if buffer.expect(',}') == '}':
+            return
+
+
+def iter_response_array(response, key, fields=None, chunk_size=chunk_size):
+    """Yield the items of the array under key of a requests response sent with stream=True."""
+    return iter_array(response.iter_content(chunk_size), key, fields)
@@ -0,0 +1,130 @@
+"""
+Telecomsxchange Bulk Market Scan
+
+This script sweeps the Telecomsxchange/NeuTrafix market view API for a whole list of dial codes
+in one run. Prefixes are read from a file (one per line, '#' comments allowed) and searched in
+parallel under a concurrency budget. A prefix whose parent prefix is also in the list is not
+searched again: its routes are taken from the parent's results. All results are written to a
+single JSON lines file, one line per prefix.
+
+Usage:
+    python3 market_scan.py prefixes.txt market_scan.jsonl --type ANY --max-in-flight 8
+
+Credentials and the base URL are configured in tcxc_client.py.
+"""
+
+import argparse
+import json
+import logging
+
+from tcxc_client import fan_out, get_client, iter_market_rates
+
+logger = logging.getLogger(__name__)
+
+# Default data for the search API request, 'prefix' is set per dial code
+search_data = {
+    'searchform': '1',
+    'seller': '',
+    'type': 'ANY',  # Trunk Type - you can pass string values {cli, nocli, tdm, any}
+}
+
+
+def load_prefixes(path):
+    """Read dial codes from a file, ignoring blank lines, '#' comments, '+' signs and duplicates."""
+    prefixes = []
+    seen = set()
+    with open(path, 'r') as f:
+        for line in f:
+            prefix = line.split('#', 1)[0].strip().lstrip('+')
+            if prefix and prefix not in seen:
+                seen.add(prefix)
+                prefixes.append(prefix)
+    return prefixes
+
+
+def group_by_parent(prefixes):
+    """Map every prefix that has to be searched to the child prefixes its results cover.
+
+    A prefix is covered when a shorter prefix in the list is a leading part of it,
+    e.g. '22797' is covered by '2279'.
+    """
+    prefix_set = set(prefixes)
+    groups = {}
+    for prefix in prefixes:
+        parent = next((prefix[:k] for k in range(1, len(prefix)) if prefix[:k] in prefix_set), None)
+        if parent is None:
+            groups.setdefault(prefix, [])
+        else:
+            groups.setdefault(parent, []).append(prefix)
+    return groups
+
+
+def rates_for_child(rates, child):
+    """Return the parent's rates whose prefix overlaps the number range of the child prefix."""
+    matches = []
+    for rate in rates:
+        rate_prefix = str(rate.get('prefix') or '')
+        if rate_prefix.startswith(child) or child.startswith(rate_prefix):
+            matches.append(rate)
+    return matches
+
+
+def scan_prefixes(client, prefixes, data=None, max_in_flight=8, page_size=100):
+    """Search every prefix and yield (prefix, covered_by, rates, error) as searches complete.
+
+    covered_by is None for prefixes searched directly, otherwise the parent prefix the
+    rates were taken from. error is None on success.
+    """
+    data = dict(search_data if data is None else data)
+    groups = group_by_parent(prefixes)
+
+    def search(prefix):
+        return list(iter_market_rates(client, dict(data, prefix=prefix), page_size))
+
+    for prefix, rates, error in fan_out(search, groups, max_in_flight):
+        yield prefix, None, rates or [], error
+        for child in groups[prefix]:
+            yield child, prefix, [] if error else rates_for_child(rates, child), error
+
+
+def write_scan(client, prefixes, output_path, data=None, max_in_flight=8, page_size=100):
+    """Run scan_prefixes and write one JSON line per prefix. Returns (succeeded, failed) counts."""
+    succeeded = failed = 0
+    with open(output_path, 'w') as out:
+        for prefix, covered_by, rates, error in scan_prefixes(client, prefixes, data, max_in_flight, page_size):
+            record = {'prefix': prefix, 'covered_by': covered_by, 'rates': rates}
+            if error:
+                failed += 1
+                record['error'] = str(error)
+                logger.error(f"Search failed for prefix +{prefix}. Details: {error}")
+            else:
+                succeeded += 1
+            out.write(json.dumps(record) + '\n')
+    return succeeded, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk Telecomsxchange market view scan')
+    parser.add_argument('prefixes_file', help='file with one dial code per line')
+    parser.add_argument('output_file', help='JSON lines file with the merged per-prefix results')
+    parser.add_argument('--type', default=search_data['type'], help='trunk type: cli, nocli, tdm or any')
+    parser.add_argument('--seller', default=search_data['seller'], help='filter by seller name')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='concurrent search requests')
+    parser.add_argument('--page-size', type=int, default=100, help='routes per market view page')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    prefixes = load_prefixes(args.prefixes_file)
+    data = dict(search_data, type=args.type, seller=args.seller)
+    logger.info(f'🔍 Scanning TCXC market view API for {len(prefixes)} dial codes ...')
+    succeeded, failed = write_scan(get_client(), prefixes, args.output_file, data,
+                                   args.max_in_flight, args.page_size)
+    logger.info(f'✅ Market scan finished: {succeeded} prefixes scanned, {failed} failed. '
+                f'Results written to {args.output_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+"""
+TelecomsXChange Mock API Server
+
+Local stand-in for the TCXC/NeuTrafix API, used by benchmark.py to measure the automation
+scripts without calling the real API. It answers the endpoints the scripts use with generated,
+deterministic data behind HTTP Digest authentication (qop=auth, like the real API):
+
+    /marketview/search       rates for the searched prefix (paged with pager/off)
+    /buyers/interconnect     interconnect confirmation, the connection is remembered per i_account
+    /buyers/interconnections connections interconnected through the mock for an i_account (paged)
+    /buyers/callhistory/     CDRs with a mix of normal and failed disconnect reasons
+    /buyers/message/send     message confirmation (also /sellers/message/send)
+    /number/market           DIDs for the searched prefix (paged)
+    /number/purchase         purchase confirmation
+    /sellers/did/add         listing confirmation
+    /sellers/buyers/list     buyers (paged)
+    /sellers/list            seller routes (paged)
+    /sellers/payhistory      transactions between date_from and date_to (paged)
+    /buyers/tools/getnumbers test numbers
+    /buyers/routetest        test call confirmation
+    /v1/completions          canned OpenAI-style completion (also /v1/chat/completions), no auth
+
+Latency, latency jitter, error rate (503 responses), a concurrency limit above which requests
+get 429, and the dataset size (items per list) are configurable. GET /_stats returns request
+counts, status codes, bytes and p50/p99 handling latency per endpoint; POST /_reset clears them.
+
+Usage:
+    python3 mock_tcxc_server.py --port 8099 --latency 0.02 --error-rate 0.01 --size 5000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import parse_http_list, parse_keqv_list
+
+# Credentials accepted by the mock, the benchmark passes them to the scripts as TCXC_USERNAME/TCXC_PASSWORD
+mock_username = 'benchmark'
+mock_password = 'benchmark'
+realm = 'TCXC API'
+
+# Disconnect reasons of failed mock CDRs (the ones the low QoS scripts look for) and of normal calls
+failure_reasons = ["Service or option not available", "unspecified", "timeout", "Internetworking, unspecified",
+                   "Bearer capability not authorized"]
+normal_reason = "Normal call clearing"
+
+
+def _md5(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+class MockDataset:
+    """Deterministic generated data, size items per list endpoint."""
+
+    def __init__(self, size=1000, seed=42):
+        self.size = size
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def _cached(self, key, build):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        value = build()
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > 32:
+                self._cache.popitem(last=False)
+        return value
+
+    def _random(self, *key):
+        return random.Random(f"{self.seed}:{':'.join(map(str, key))}")
+
+    def rates(self, prefix):
+        def build():
+            rng = self._random('rates', prefix)
+            return [{
+                'i_connection': 1000 + i,
+                'vendor_name': f"Vendor {i % 50}",
+                'connection_name': f"Route {i}",
+                'prefix': prefix + (str(rng.randint(0, 9)) if rng.random() < 0.3 else ''),
+                'price_1': round(rng.uniform(0.01, 0.5), 4),
+                'interval_1': rng.choice([1, 6, 60]),
+                'asr': round(rng.uniform(20, 80), 1),
+                'acd': round(rng.uniform(1, 10), 2),
+                'pdd': round(rng.uniform(1, 8), 2),
+            } for i in range(self.size)]
+        return self._cached(('rates', prefix), build)
+
+    def cdrs(self, failed_only=False):
+        def build():
+            rng = self._random('cdrs')
+            start = datetime.utcnow() - timedelta(minutes=30)
+            cdrs = []
+            for i in range(self.size):
+                i_vendor = rng.randint(1, 20)
+                # Vendors 1-3 fail often on one route and destination, so with the default size each of those
+                # routes gets well over min_attempts calls and crosses the low QoS thresholds
+                low_qos = i_vendor <= 3
+                failed = rng.random() < (0.6 if low_qos else 0.1)
+                destination = '954240' if low_qos else rng.choice(['954240', '212555', '415555', '442071'])
+                cdrs.append({
+                    'call_id': f"mock-{i}",
+                    'CLD': f"1{destination}{rng.randint(0, 9999):04d}",
+                    'CLI': '15550000000',
+                    'connect_time': (start + timedelta(seconds=i * 1800 / max(self.size, 1))).strftime('%Y-%m-%d %H:%M:%S'),
+                    'disconnect_reason': rng.choice(failure_reasons) if failed else normal_reason,
+                    'duration': 0 if failed else rng.randint(5, 600),
+                    'i_vendor': i_vendor,
+                    'connection_name': f"Route {i_vendor}-{1 if low_qos else rng.randint(1, 3)}",
+                })
+            return cdrs
+        cdrs = self._cached(('cdrs',), build)
+        return [cdr for cdr in cdrs if cdr['disconnect_reason'] != normal_reason] if failed_only else cdrs
+
+    def dids(self, prefix):
+        def build():
+            rng = self._random('dids', prefix)
+            return [{
+                'i_did': 50000 + i,
+                'number': f"{prefix}{i:06d}",
+                'monthly_fee': f"{rng.uniform(0.5, 4):.2f}",
+                'setup_fee': f"{rng.uniform(0, 3):.2f}",
+                'price_1': f"{rng.uniform(0.001, 0.02):.4f}",
+                'did_type': 'local',
+                'seller': f"Seller {i % 10}",
+            } for i in range(self.size)]
+        return self._cached(('dids', prefix), build)
+
+    def buyers(self):
+        return self._cached(('buyers',), lambda: [{'i_customer': 7000 + i, 'login': f"buyer{i}"} for i in range(self.size)])
+
+    def sellers(self):
+        return self._cached(('sellers',), lambda: [{'seller_name': f"Seller {i % 50}", 'i_connection': 1000 + i,
+                                                    'route_name': f"Route {i}"} for i in range(self.size)])
+
+    def transactions(self):
+        def build():
+            rng = self._random('transactions')
+            start = datetime(2019, 1, 1)
+            step = (datetime(2023, 6, 1) - start) / max(self.size, 1)
+            return [{
+                'i_payment': 90000 + i,
+                'date': (start + step * i).strftime('%Y-%m-%d %H:%M:%S'),
+                'amount': f"{rng.lognormvariate(4, 0.8):.2f}",
+                'company_name': f"Buyer {rng.randint(0, 40)}",
+            } for i in range(self.size)]
+        return self._cached(('transactions',), build)
+
+    def test_numbers(self, country, description):
+        rng = self._random('numbers', country, description)
+        return [{'CLD': f"44{rng.randint(10 ** 8, 10 ** 9 - 1)}", 'description': description, 'country_name': country}
+                for _ in range(10)]
+
+
+class MockStats:
+    """Per-endpoint request counts, statuses, bytes and handling latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latencies = defaultdict(list)
+            self.statuses = defaultdict(Counter)
+            self.bytes_in = Counter()
+            self.bytes_out = Counter()
+            self.started = time.time()
+
+    def record(self, endpoint, status, seconds, bytes_in, bytes_out):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            self.bytes_in[endpoint] += bytes_in
+            self.bytes_out[endpoint] += bytes_out
+
+    def summary(self):
+        with self._lock:
+            endpoints = {}
+            all_latencies = []
+            for endpoint, latencies in self.latencies.items():
+                ordered = sorted(latencies)
+                all_latencies.extend(ordered)
+                endpoints[endpoint] = {
+                    'requests': len(ordered),
+                    'statuses': {str(status): count for status, count in self.statuses[endpoint].items()},
+                    'bytes_in': self.bytes_in[endpoint],
+                    'bytes_out': self.bytes_out[endpoint],
+                    'p50_ms': round(_percentile(ordered, 0.5) * 1000, 3),
+                    'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+                }
+            all_latencies.sort()
+            return {
+                'requests': len(all_latencies),
+                'errors': sum(count for statuses in self.statuses.values()
+                              for status, count in statuses.items() if status >= 400 and status != 401),
+                'p50_ms': round(_percentile(all_latencies, 0.5) * 1000, 3),
+                'p99_ms': round(_percentile(all_latencies, 0.99) * 1000, 3),
+                'seconds': round(time.time() - self.started, 3),
+                'endpoints': endpoints,
+            }
+
+
+def _paged(items, params):
+    pager = int(params.get('pager') or len(items) or 1)
+    off = int(params.get('off') or 0)
+    return items[off:off + pager]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'TCXCMock/1.0'
+    # Headers and body are separate writes, without this keep-alive responses wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self._bytes_in = len(body)
+        query = urlsplit(self.path).query
+        params = {key: values[-1] for key, values in parse_qs(query).items()}
+        if body:
+            params.update({key: values[-1] for key, values in parse_qs(body.decode('utf-8')).items()})
+        return params
+
+    def _send(self, status, payload, extra_headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return status, len(body)
+
+    def _authorized(self):
+        header = self.headers.get('Authorization', '')
+        if not header.startswith('Digest '):
+            return False
+        fields = parse_keqv_list(parse_http_list(header[len('Digest '):]))
+        nonce = fields.get('nonce')
+        if fields.get('username') != mock_username or nonce not in self.server.nonces:
+            return False
+        ha1 = _md5(f"{mock_username}:{realm}:{mock_password}")
+        ha2 = _md5(f"{self.command}:{fields.get('uri')}")
+        if fields.get('qop'):
+            expected = _md5(f"{ha1}:{nonce}:{fields.get('nc')}:{fields.get('cnonce')}:{fields.get('qop')}:{ha2}")
+        else:
+            expected = _md5(f"{ha1}:{nonce}:{ha2}")
+        return fields.get('response') == expected
+
+    def _challenge(self):
+        nonce = os.urandom(16).hex()
+        self.server.nonces.add(nonce)
+        return self._send(401, {'status': 'error', 'message': 'Unauthorized'}, {
+            'WWW-Authenticate': f'Digest realm="{realm}", qop="auth", nonce="{nonce}", algorithm=MD5'})
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        started = time.perf_counter()
+        endpoint = '/' + urlsplit(self.path).path.strip('/')
+        params = self._params()
+        server = self.server
+
+        if endpoint == '/_stats':
+            self._send(200, server.stats.summary())
+            return
+        if endpoint == '/_reset':
+            server.stats.reset()
+            self._send(200, {'status': 'success'})
+            return
+
+        with server.in_flight_lock:
+            server.in_flight += 1
+            over_limit = server.max_concurrency and server.in_flight > server.max_concurrency
+        try:
+            if endpoint.startswith('/v1/'):
+                status, size = self._openai(endpoint)
+            elif not self._authorized():
+                status, size = self._challenge()
+            elif over_limit:
+                status, size = self._send(429, {'status': 'error', 'message': 'Too many requests'})
+            elif server.error_rate and random.random() < server.error_rate:
+                time.sleep(server.delay())
+                status, size = self._send(503, {'status': 'error', 'message': 'Service unavailable'})
+            else:
+                time.sleep(server.delay())
+                status, size = self._api(endpoint, params)
+        finally:
+            with server.in_flight_lock:
+                server.in_flight -= 1
+        server.stats.record(endpoint, status, time.perf_counter() - started, self._bytes_in, size)
+
+    def _openai(self, endpoint):
+        time.sleep(self.server.llm_latency)
+        text = "Mock completion: the data shows stable volumes with a few outliers worth reviewing."
+        if endpoint.endswith('/chat/completions'):
+            choice = {'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}
+        else:
+            choice = {'index': 0, 'text': text, 'finish_reason': 'stop'}
+        return self._send(200, {'id': 'mock', 'object': 'text_completion', 'created': int(time.time()),
+                                'model': 'mock', 'choices': [choice],
+                                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}})
+
+    def _api(self, endpoint, params):
+        data = self.server.dataset
+        if endpoint == '/marketview/search':
+            return self._send(200, {'status': 'success', 'rates': _paged(data.rates(params.get('prefix', '1')), params)})
+        if endpoint == '/buyers/callhistory':
+            return self._send(200, {'status': 'success', 'cdrs': data.cdrs(failed_only=params.get('show') == 'bad')})
+        if endpoint == '/number/market':
+            return self._send(200, {'dids': _paged(data.dids(params.get('prefix', '1')), params)})
+        if endpoint == '/sellers/buyers/list':
+            return self._send(200, {'status': 'success', 'buyers': _paged(data.buyers(), params)})
+        if endpoint == '/sellers/list':
+            return self._send(200, {'status': 'success', 'routes': _paged(data.sellers(), params)})
+        if endpoint == '/sellers/payhistory':
+            date_from, date_to = params.get('date_from', ''), params.get('date_to', '9999')
+            transactions = [t for t in data.transactions() if date_from <= t['date'] <= date_to]
+            return self._send(200, {'status': 'success', 'transactions': _paged(transactions, params)})
+        if endpoint == '/buyers/tools/getnumbers':
+            return self._send(200, {'status': 'success',
+                                    'cdrs': data.test_numbers(params.get('country', ''), params.get('description', ''))})
+        if endpoint in ('/buyers/message/send', '/sellers/message/send'):
+            return self._send(200, {'status': 'success', 'i_message': random.randint(1, 10 ** 9)})
+        if endpoint == '/buyers/routetest':
+            return self._send(200, {'status': 'success', 'status_text': 'Test call initiated'})
+        if endpoint == '/number/purchase':
+            return self._send(200, {'status': 'success', 'message': 'Number purchased'})
+        if endpoint == '/buyers/interconnect':
+            with self.server.interconnections_lock:
+                self.server.interconnections[params.get('i_account', '')][params.get('id', '')] = None
+            return self._send(200, {'status': 'success'})
+        if endpoint == '/buyers/interconnections':
+            with self.server.interconnections_lock:
+                connections = list(self.server.interconnections[params.get('i_account', '')])
+            return self._send(200, {'status': 'success',
+                                    'interconnections': _paged([{'i_connection': i} for i in connections], params)})
+        if endpoint == '/sellers/did/add':
+            return self._send(200, {'status': 'success'})
+        return self._send(404, {'status': 'error', 'message': f"Unknown endpoint {endpoint}"})
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, size=1000, latency=0.0, jitter=0.5, error_rate=0.0, max_concurrency=0,
+                 llm_latency=0.0, seed=42):
+        super().__init__(address, MockHandler)
+        self.dataset = MockDataset(size, seed)
+        self.stats = MockStats()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.llm_latency = llm_latency
+        self.nonces = set()
+        self.in_flight = 0
+        self.in_flight_lock = threading.Lock()
+        # i_account -> i_connections interconnected, in order
+        self.interconnections = defaultdict(dict)
+        self.interconnections_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self):
+        return self.latency * random.uniform(1 - self.jitter, 1 + self.jitter) if self.latency else 0.0
+
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Start a MockServer on a background thread and return it (port 0 picks a free port)."""
+    server = MockServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local mock of the TCXC/NeuTrafix API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--size', type=int, default=1000, help='items per list endpoint')
+    parser.add_argument('--latency', type=float, default=0.02, help='mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.5, help='latency varies by +/- this fraction')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='answer 429 above this many requests in flight (0 = off)')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='latency of the mock OpenAI completions')
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), size=args.size, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, max_concurrency=args.max_concurrency, llm_latency=args.llm_latency)
+    print(f"Mock TCXC API listening on {server.url} (user {mock_username}, password {mock_password})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Pay History Statistics
+
+Running aggregates over a stream of /sellers/payhistory transactions for
+seller_payhistory_ai_summary.py. Transactions are consumed one at a time and only compact
+state is kept: totals, monthly totals, per-counterparty sums, a running mean/variance of the
+amounts (Welford) and the largest unusual transactions. Memory depends on the number of
+months and counterparties, not on the number of transactions.
+
+At the end, monthly moving averages and anomaly flags (months far from their trailing average,
+transactions far from the running mean) are derived, and the whole summary is rendered as a
+short text for the language model.
+"""
+
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime
+
+# Candidate field names, the first one present in a transaction is used
+date_fields = ('date', 'payment_time', 'time', 'created', 'issue_date')
+counterparty_fields = ('counterparty', 'company_name', 'login', 'customer', 'name', 'description')
+id_fields = ('i_payment', 'i_transaction', 'transaction_id', 'id')
+
+# Months in the moving average, and relative deviation from the trailing average flagged as a monthly anomaly
+moving_average_months = 3
+monthly_anomaly_ratio = 0.5
+
+# Deviation of a single transaction from the running mean, in standard deviations, flagged as an anomaly
+anomaly_z = 3.0
+
+# Transactions seen before single transactions are checked against the running mean, and how many are kept
+anomaly_warmup = 30
+max_anomalies = 10
+
+
+def first_field(transaction, fields, default=None):
+    for field in fields:
+        value = transaction.get(field)
+        if value not in (None, ''):
+            return value
+    return default
+
+
+def transaction_month(transaction):
+    """Return 'YYYY-MM' of a transaction, or 'unknown' if it has no readable date."""
+    value = str(first_field(transaction, date_fields, ''))
+    for date_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value[:19], date_format).strftime('%Y-%m')
+        except ValueError:
+            continue
+    return value[:7] if len(value) >= 7 and value[4] == '-' else 'unknown'
+
+
+class PayHistoryAggregator:
+    """Bounded-memory running statistics of pay history transactions."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min_amount = math.inf
+        self.max_amount = -math.inf
+        self.monthly = defaultdict(lambda: [0, 0.0])
+        self.counterparties = defaultdict(lambda: [0, 0.0])
+        self._anomalies = []
+
+    def add(self, transaction):
+        try:
+            amount = float(transaction['amount'])
+        except (KeyError, TypeError, ValueError):
+            return
+        # Check the transaction against the statistics before it is included in them
+        if self.count >= anomaly_warmup:
+            std = math.sqrt(self._m2 / (self.count - 1))
+            if std > 0 and abs(amount - self.mean) / std > anomaly_z:
+                entry = (abs(amount - self.mean) / std, self.count, transaction)
+                if len(self._anomalies) < max_anomalies:
+                    heapq.heappush(self._anomalies, entry)
+                else:
+                    heapq.heappushpop(self._anomalies, entry)
+
+        self.count += 1
+        self.total += amount
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (amount - self.mean)
+        self.min_amount = min(self.min_amount, amount)
+        self.max_amount = max(self.max_amount, amount)
+
+        month = self.monthly[transaction_month(transaction)]
+        month[0] += 1
+        month[1] += amount
+        counterparty = self.counterparties[str(first_field(transaction, counterparty_fields, 'unknown'))]
+        counterparty[0] += 1
+        counterparty[1] += amount
+
+    def consume(self, transactions):
+        for transaction in transactions:
+            self.add(transaction)
+        return self
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def monthly_report(self):
+        """Return [(month, count, total, moving average, anomaly flag)] in month order."""
+        months = sorted(month for month in self.monthly if month != 'unknown')
+        report = []
+        totals = []
+        for month in months:
+            count, total = self.monthly[month]
+            window = totals[-moving_average_months:]
+            moving_average = sum(window + [total]) / (len(window) + 1)
+            anomaly = False
+            if window:
+                trailing = sum(window) / len(window)
+                anomaly = abs(total - trailing) > monthly_anomaly_ratio * abs(trailing) if trailing else total != 0
+            report.append((month, count, total, moving_average, anomaly))
+            totals.append(total)
+        return report
+
+    def anomalies(self):
+        """Return the unusual transactions, largest deviation first."""
+        return [transaction for _, _, transaction in sorted(self._anomalies, reverse=True)]
+
+    def top_counterparties(self, limit=10):
+        return sorted(self.counterparties.items(), key=lambda item: abs(item[1][1]), reverse=True)[:limit]
+
+    def summary_text(self, max_months=24):
+        """Render the statistics as a compact text for the language model."""
+        if not self.count:
+            return "No transactions."
+        lines = [f"Transactions: {self.count}, total payout: {self.total:.2f} USD, "
+                 f"average: {self.mean:.2f}, std: {self.std:.2f}, min: {self.min_amount:.2f}, max: {self.max_amount:.2f}"]
+        report = self.monthly_report()
+        if len(report) > max_months:
+            lines.append(f"Monthly totals (last {max_months} of {len(report)} months):")
+        else:
+            lines.append("Monthly totals:")
+        for month, count, total, moving_average, anomaly in report[-max_months:]:
+            flag = " (ANOMALY)" if anomaly else ""
+            lines.append(f"- {month}: {count} transactions, {total:.2f} USD, {moving_average_months}-month moving average {moving_average:.2f}{flag}")
+        lines.append("Top counterparties:")
+        for name, (count, total) in self.top_counterparties():
+            lines.append(f"- {name}: {count} transactions, {total:.2f} USD")
+        anomalies = self.anomalies()
+        if anomalies:
+            lines.append("Unusual transactions:")
+            for transaction in anomalies:
+                lines.append(f"- {first_field(transaction, date_fields, '')}: {float(transaction['amount']):.2f} USD "
+                             f"({first_field(transaction, counterparty_fields, 'unknown')})")
+        return "\n".join(lines)
@@ -0,0 +1,233 @@
+"""
+Pay History Store
+
+Local append-only columnar store of /sellers/payhistory transactions, so reports no longer
+download years of unchanged history. Every column is a flat binary file in the store directory:
+
+    id.i8            64-bit hash of the transaction ID (dedupe key)
+    timestamp.i8     transaction time in UTC seconds (-1 when unknown)
+    amount.f8        amount in USD
+    counterparty.i4  index into the counterparty labels
+
+meta.json holds the number of committed rows, the counterparty labels and the date_to
+watermark of the last successful sync. Rows are appended to the column files first and only
+count once meta.json is replaced, so an interrupted sync leaves the store readable; the
+uncommitted tail is cut off on the next append.
+
+A sync fetches only date_from = watermark - overlap_days .. now, drops transactions whose ID is
+already stored and advances the watermark. Reports read the columns with numpy.memmap.
+"""
+
+import calendar
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from payhistory_stats import (PayHistoryAggregator, anomaly_z, counterparty_fields, date_fields, first_field,
+                              id_fields, max_anomalies)
+from tcxc_client import paginate
+
+# Directory of the store
+store_dir = 'payhistory_store'
+
+# Start of the history on the first sync, and days re-fetched before the watermark to catch late postings
+history_start = "2019-01-01 00:00:00"
+overlap_days = 1
+
+# Transactions written per append
+append_batch = 1000
+
+api_time_format = '%Y-%m-%d %H:%M:%S'
+
+columns = {
+    'id': np.int64,
+    'timestamp': np.int64,
+    'amount': np.float64,
+    'counterparty': np.int32,
+}
+
+
+def transaction_id(transaction):
+    """Return the 64-bit dedupe key of a transaction, from its ID or, without one, from its content."""
+    value = first_field(transaction, id_fields)
+    key = f"id:{value}" if value is not None else "row:" + json.dumps(transaction, sort_keys=True)
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def transaction_timestamp(transaction):
+    """Return the transaction time in UTC seconds, or -1 if it has no readable date."""
+    value = str(first_field(transaction, date_fields, ''))[:19]
+    for date_format in (api_time_format, '%Y-%m-%d', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return calendar.timegm(datetime.strptime(value, date_format).timetuple())
+        except ValueError:
+            continue
+    return -1
+
+
+class PayHistoryStore:
+    """Append-only column files of pay history transactions with a date_to watermark."""
+
+    def __init__(self, directory=store_dir):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta = {'rows': 0, 'counterparties': [], 'date_to': None}
+        try:
+            with open(self._meta_path(), 'r') as f:
+                self.meta.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        self._counterparty_codes = {name: code for code, name in enumerate(self.meta['counterparties'])}
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def _meta_path(self):
+        return os.path.join(self.directory, 'meta.json')
+
+    def _column_path(self, name):
+        return os.path.join(self.directory, f"{name}.{np.dtype(columns[name]).str[1:]}")
+
+    def _save_meta(self):
+        tmp_path = self._meta_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path())
+
+    @property
+    def watermark(self):
+        return self.meta['date_to']
+
+    def set_watermark(self, date_to):
+        self.meta['date_to'] = date_to
+        self._save_meta()
+
+    def column(self, name):
+        """Return a read-only memory map of a column's committed rows."""
+        if not self.meta['rows']:
+            return np.empty(0, dtype=columns[name])
+        return np.memmap(self._column_path(name), dtype=columns[name], mode='r', shape=(self.meta['rows'],))
+
+    def append(self, transactions, known_ids):
+        """Append the transactions whose ID is not in known_ids (updated in place); return the count added."""
+        ids, timestamps, amounts, counterparties = [], [], [], []
+        for transaction in transactions:
+            try:
+                amount = float(transaction['amount'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            key = transaction_id(transaction)
+            if key in known_ids:
+                continue
+            known_ids.add(key)
+            name = str(first_field(transaction, counterparty_fields, 'unknown'))
+            code = self._counterparty_codes.setdefault(name, len(self._counterparty_codes))
+            ids.append(key)
+            timestamps.append(transaction_timestamp(transaction))
+            amounts.append(amount)
+            counterparties.append(code)
+        if not ids:
+            return 0
+
+        values = {'id': ids, 'timestamp': timestamps, 'amount': amounts, 'counterparty': counterparties}
+        for name, dtype in columns.items():
+            path = self._column_path(name)
+            with open(path, 'ab') as f:
+                # Cut off rows left behind by an interrupted append before adding new ones
+                f.truncate(self.meta['rows'] * np.dtype(dtype).itemsize)
+                f.write(np.asarray(values[name], dtype=dtype).tobytes())
+        self.meta['rows'] += len(ids)
+        self.meta['counterparties'] = list(self._counterparty_codes)
+        self._save_meta()
+        return len(ids)
+
+    def statistics(self):
+        """Compute the report statistics from the memory-mapped columns."""
+        statistics = PayHistoryAggregator()
+        amounts = self.column('amount')
+        count = len(amounts)
+        if not count:
+            return statistics
+        timestamps = self.column('timestamp')
+        counterparty_codes = self.column('counterparty')
+
+        statistics.count = count
+        statistics.total = float(amounts.sum())
+        statistics.mean = statistics.total / count
+        statistics._m2 = float(((amounts - statistics.mean) ** 2).sum())
+        statistics.min_amount = float(amounts.min())
+        statistics.max_amount = float(amounts.max())
+
+        # Monthly totals, grouped on the month number of each timestamp
+        months = np.where(timestamps >= 0, timestamps, 0).astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+        months = np.where(timestamps >= 0, months, -1)
+        month_values, month_codes = np.unique(months, return_inverse=True)
+        month_codes = month_codes.reshape(-1)
+        month_counts = np.bincount(month_codes, minlength=len(month_values))
+        month_totals = np.bincount(month_codes, weights=amounts, minlength=len(month_values))
+        for value, month_count, month_total in zip(month_values, month_counts, month_totals):
+            label = 'unknown' if value < 0 else str(np.datetime64(int(value), 'M'))
+            statistics.monthly[label] = [int(month_count), float(month_total)]
+
+        labels = self.meta['counterparties']
+        counterparty_counts = np.bincount(counterparty_codes, minlength=len(labels))
+        counterparty_totals = np.bincount(counterparty_codes, weights=amounts, minlength=len(labels))
+        for name, counterparty_count, counterparty_total in zip(labels, counterparty_counts, counterparty_totals):
+            if counterparty_count:
+                statistics.counterparties[name] = [int(counterparty_count), float(counterparty_total)]
+
+        # Unusual transactions against the mean and deviation of the whole history
+        std = statistics.std
+        if std > 0:
+            z = np.abs(amounts - statistics.mean) / std
+            candidates = np.flatnonzero(z > anomaly_z)
+            for row in candidates[np.argsort(z[candidates])[::-1][:max_anomalies]]:
+                timestamp = int(timestamps[row])
+                transaction = {
+                    'date': time.strftime(api_time_format, time.gmtime(timestamp)) if timestamp >= 0 else '',
+                    'amount': float(amounts[row]),
+                    'counterparty': labels[counterparty_codes[row]],
+                }
+                statistics._anomalies.append((float(z[row]), int(row), transaction))
+        return statistics
+
+
+def sync_pay_history(client, store, endpoint='/sellers/payhistory', page_size=1000, now=None):
+    """Fetch the transactions since the store's watermark, append the new ones and advance the watermark.
+
+    Returns the number of transactions added. The watermark only moves once every page was
+    fetched, so a failed sync is retried from the same point on the next run.
+    """
+    # The API dates are in UTC, as the watermark taken from them
+    now = now or datetime.utcnow()
+    if store.watermark:
+        date_from = (datetime.strptime(store.watermark, api_time_format) - timedelta(days=overlap_days)).strftime(api_time_format)
+    else:
+        date_from = history_start
+    date_to = now.strftime(api_time_format)
+    logging.info(f"Syncing pay history from {date_from} to {date_to} ({len(store)} transactions stored)")
+
+    known_ids = set()
+    if len(store):
+        # Only the stored IDs inside the overlap window can come back from the API
+        stored_ids = store.column('id')
+        timestamps = store.column('timestamp')
+        overlap_start = transaction_timestamp({'date': date_from})
+        known_ids.update(stored_ids[(timestamps >= overlap_start) | (timestamps < 0)].tolist())
+
+    added = 0
+    batch = []
+    for transaction in paginate(client, endpoint, {'date_from': date_from, 'date_to': date_to}, 'transactions', page_size=page_size):
+        batch.append(transaction)
+        if len(batch) >= append_batch:
+            added += store.append(batch, known_ids)
+            batch = []
+    added += store.append(batch, known_ids)
+    store.set_watermark(date_to)
+    logging.info(f"Pay history sync added {added} transactions, watermark set to {date_to}")
+    return added
@@ -0,0 +1,179 @@
+"""
+CDR QoS Analytics
+
+Vectorized QoS statistics for the trouble ticket scripts. StreamingCDRSelector takes the CDRs
+of /buyers/callhistory/ one at a time as they are decoded (json_stream.py), and keeps only the
+grouping codes, failure flag and duration of each one in compact arrays, plus the failed CDR
+dicts. Attempts, failures, failure rate, ASR (answer seizure ratio) and ACD (average call
+duration) are then computed per vendor, route (connection_name) and destination prefix with
+array group-bys over those columns.
+
+A route is flagged only when it crosses the configured thresholds: enough attempts, and a
+failure rate whose Wilson lower confidence bound is above max_failure_rate, or an ASR below
+min_asr. A single failed call on a healthy route no longer raises a ticket.
+"""
+
+from array import array
+
+import numpy as np
+
+# Number of leading CLD digits used as destination prefix
+prefix_length = 6
+
+# Default thresholds for flagging a route
+thresholds = {
+    'min_attempts': 10,       # ignore routes with fewer calls in the window
+    'max_failure_rate': 0.3,  # flag when the failure rate is confidently above this value
+    'min_asr': 0.0,           # flag when the ASR is below this value (0 disables the check)
+    'z': 1.96,                # confidence level of the failure rate bound (1.96 = 95%)
+}
+
+
+def _duration(value):
+    """Duration of a CDR in seconds, 0 (unanswered) when it is missing or not a number."""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class CDRColumns:
+    """Column arrays of one CDR batch, with the grouping fields stored as integer codes and labels."""
+
+    def __init__(self, vendor, connection, prefix, failed, duration):
+        # vendor, connection and prefix are (codes, labels) pairs, with labels[codes] the value of each CDR
+        self.vendor, self.connection, self.prefix = vendor, connection, prefix
+        self.failed = np.asarray(failed, dtype=bool)
+        self.duration = np.asarray(duration, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.failed)
+
+class RouteStats:
+    """Per (vendor, connection, prefix) statistics of a CDR batch."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        fields = (columns.vendor, columns.connection, columns.prefix)
+        key = np.zeros(len(columns), dtype=np.int64)
+        space = 1
+        for codes, labels in fields:
+            key = key * max(len(labels), 1) + codes
+            space *= max(len(labels), 1)
+
+        # Dense key spaces are grouped with a counting pass, sparse ones with a sort
+        if space <= 4 * len(columns) + 1024:
+            present = np.flatnonzero(np.bincount(key, minlength=space))
+            lookup = np.empty(space, dtype=np.int64)
+            lookup[present] = np.arange(len(present))
+            groups, self.group_of_cdr = present, lookup[key]
+        else:
+            groups, self.group_of_cdr = np.unique(key, return_inverse=True)
+            self.group_of_cdr = self.group_of_cdr.reshape(-1)
+
+        # Decode each group key back into its vendor/connection/prefix labels
+        decoded = []
+        remainder = groups
+        for codes, labels in reversed(fields):
+            size = max(len(labels), 1)
+            decoded.append(labels[remainder % size] if len(labels) else labels)
+            remainder = remainder // size
+        self.prefix, self.connection, self.vendor = decoded
+
+        answered = columns.duration > 0
+        size = len(groups)
+        self.attempts = np.bincount(self.group_of_cdr, minlength=size).astype(np.float64)
+        self.failures = np.bincount(self.group_of_cdr, weights=columns.failed, minlength=size)
+        self.answered = np.bincount(self.group_of_cdr, weights=answered, minlength=size)
+        self.total_duration = np.bincount(self.group_of_cdr, weights=columns.duration, minlength=size)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.failure_rate = np.where(self.attempts > 0, self.failures / self.attempts, 0.0)
+            self.asr = np.where(self.attempts > 0, self.answered / self.attempts, 0.0)
+            self.acd = np.where(self.answered > 0, self.total_duration / self.answered, 0.0)
+
+    def __len__(self):
+        return len(self.attempts)
+
+    def failure_lower_bound(self, z=thresholds['z']):
+        """Wilson score lower bound of the failure rate of each route."""
+        n = np.maximum(self.attempts, 1)
+        p = self.failure_rate
+        centre = p + z * z / (2 * n)
+        margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        return np.where(self.attempts > 0, (centre - margin) / (1 + z * z / n), 0.0)
+
+    def flagged(self, **overrides):
+        """Boolean mask of the routes crossing the thresholds."""
+        limits = dict(thresholds, **overrides)
+        enough = self.attempts >= limits['min_attempts']
+        high_failures = self.failure_lower_bound(limits['z']) > limits['max_failure_rate']
+        low_asr = self.asr < limits['min_asr']
+        return enough & (high_failures | low_asr)
+
+    def flagged_cdr_indexes(self, **overrides):
+        """Indexes of the failed CDRs that belong to a flagged route."""
+        mask = self.flagged(**overrides)[self.group_of_cdr] & self.columns.failed
+        return np.flatnonzero(mask)
+
+    def rows(self, mask=None):
+        """Yield the statistics of each route (or of the routes in mask) as dicts."""
+        indexes = range(len(self)) if mask is None else np.flatnonzero(mask)
+        for i in indexes:
+            yield {
+                'i_vendor': str(self.vendor[i]),
+                'connection_name': str(self.connection[i]),
+                'prefix': str(self.prefix[i]),
+                'attempts': int(self.attempts[i]),
+                'failures': int(self.failures[i]),
+                'failure_rate': float(self.failure_rate[i]),
+                'asr': float(self.asr[i]),
+                'acd': float(self.acd[i]),
+            }
+
+
+class StreamingCDRSelector:
+    """Route statistics of CDRs that arrive one at a time, e.g. from a streamed call history.
+
+    Only the grouping codes, failure flag and duration of each CDR are kept, plus the failed CDRs
+    themselves, so memory grows with the failures rather than with every CDR dict.
+    """
+
+    def __init__(self, failure_reasons, prefix_length=prefix_length):
+        self.failure_reasons = set(failure_reasons)
+        self.prefix_length = prefix_length
+        # vendor, connection and prefix: label -> code, and the code of every CDR
+        self.labels = ({}, {}, {})
+        self.codes = (array('q'), array('q'), array('q'))
+        self.failed = array('b')
+        self.duration = array('d')
+        # CDR index -> failed CDR dict
+        self.failed_cdrs = {}
+
+    def __len__(self):
+        return len(self.failed)
+
+    def add(self, cdr, keep=None):
+        """Count one CDR and return whether it failed; a failed CDR is kept for select() unless keep(cdr) is false."""
+        keys = (str(cdr.get('i_vendor', '')), cdr.get('connection_name') or '', str(cdr.get('CLD', ''))[:self.prefix_length])
+        for key, labels, codes in zip(keys, self.labels, self.codes):
+            codes.append(labels.setdefault(key, len(labels)))
+        failed = cdr.get('disconnect_reason') in self.failure_reasons
+        if failed and (keep is None or keep(cdr)):
+            self.failed_cdrs[len(self.failed)] = cdr
+        self.failed.append(failed)
+        self.duration.append(_duration(cdr.get('duration')))
+        return failed
+
+    def columns(self):
+        fields = []
+        for labels, codes in zip(self.labels, self.codes):
+            values = np.empty(len(labels), dtype=object)
+            values[:] = list(labels)
+            fields.append((np.array(codes, dtype=np.int64), values))
+        return CDRColumns(*fields, np.array(self.failed, dtype=bool), np.array(self.duration, dtype=np.float64))
+
+    def select(self, **overrides):
+        """Return (kept failed CDRs on flagged routes, RouteStats) of the CDRs added so far."""
+        stats = RouteStats(self.columns())
+        return [self.failed_cdrs[i] for i in stats.flagged_cdr_indexes(**overrides).tolist() if i in self.failed_cdrs], stats
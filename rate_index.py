@@ -0,0 +1,162 @@
+"""
+Telecomsxchange Least Cost Routing Index
+
+Longest-prefix-match rate index built from market view results. For every dial code it keeps
+the top-K cheapest routes (by price_1). Prefixes are stored in sorted NumPy arrays, one per
+prefix length, so a whole list of E.164 numbers is resolved in one vectorized call: for each
+prefix length, longest first, the leading digits of all still unresolved numbers are looked up
+with a binary search.
+
+The index can be built from rates returned by iter_market_rates() or from the JSON lines file
+written by market_scan.py, and written out as an LCR table (CSV).
+
+Usage:
+    python3 rate_index.py market_scan.jsonl numbers.txt lcr_lookup.csv --top-k 3
+"""
+
+import argparse
+import csv
+import heapq
+import json
+from itertools import count
+
+import numpy as np
+
+
+# 10**0 .. 10**18, the digit count of a value is the number of these powers it is not below
+_powers_of_ten = 10 ** np.arange(19, dtype=np.int64)
+
+
+def parse_numbers(numbers):
+    """Return (values, digit counts) arrays for a list of numbers; invalid numbers get the value -1."""
+    if isinstance(numbers, np.ndarray) and np.issubdtype(numbers.dtype, np.integer):
+        values = numbers.astype(np.int64)
+        # Integer comparisons, float log10 rounds values such as 999999999999999 up to the next power of ten
+        lengths = np.searchsorted(_powers_of_ten, values, side='right').astype(np.int64)
+        return values, lengths
+    digits = np.char.lstrip(np.asarray(numbers, dtype=str), '+')
+    lengths = np.char.str_len(digits).astype(np.int64)
+    try:
+        values = digits.astype(np.int64)
+    except ValueError:
+        valid = np.array([d.isdigit() for d in digits.tolist()], dtype=bool)
+        values = np.full(len(digits), -1, dtype=np.int64)
+        values[valid] = digits[valid].astype(np.int64)
+    return values, lengths
+
+
+class RateIndex:
+    """Top-K cheapest routes per dial code with batch longest-prefix-match lookup."""
+
+    def __init__(self, rates, top_k=3, default_prefix=None):
+        """Build the index from rate dicts with 'prefix' and 'price_1' fields.
+
+        Rates without a prefix field are filed under default_prefix (e.g. the searched dial code).
+        """
+        self.top_k = top_k
+        tie_breaker = count()
+        cheapest = {}
+        for rate in rates:
+            prefix = str(rate.get('prefix') or default_prefix or '').lstrip('+')
+            if not prefix.isdigit():
+                continue
+            entry = (-float(rate.get('price_1', 0) or 0), next(tie_breaker), rate)
+            routes = cheapest.setdefault(prefix, [])
+            # Max-heap of the K cheapest routes, the most expensive one is replaced first
+            if len(routes) < top_k:
+                heapq.heappush(routes, entry)
+            elif entry[0] > routes[0][0]:
+                heapq.heapreplace(routes, entry)
+
+        self.prefixes = sorted(cheapest)
+        self.routes = [[rate for _, _, rate in sorted(cheapest[prefix], key=lambda e: (-e[0], e[1]))]
+                       for prefix in self.prefixes]
+        self.best_price = np.array([float(routes[0].get('price_1', 0) or 0) for routes in self.routes], dtype=np.float64)
+
+        # One sorted key array per prefix length, with the position of each key in self.prefixes
+        self._levels = []
+        lengths = np.array([len(prefix) for prefix in self.prefixes], dtype=np.int64)
+        for length in sorted(set(lengths.tolist()), reverse=True):
+            positions = np.flatnonzero(lengths == length)
+            keys = np.array([int(self.prefixes[i]) for i in positions], dtype=np.int64)
+            order = np.argsort(keys)
+            self._levels.append((length, keys[order], positions[order]))
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    @classmethod
+    def from_scan_file(cls, path, top_k=3):
+        """Build the index from a market_scan.py JSON lines file (prefixes searched directly only)."""
+        def rates():
+            with open(path, 'r') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record.get('covered_by') is None and not record.get('error'):
+                        for rate in record['rates']:
+                            yield rate if rate.get('prefix') else dict(rate, prefix=record['prefix'])
+        return cls(rates(), top_k)
+
+    def lookup_many(self, numbers):
+        """Return an array with, for each number, the index of its longest matching prefix (-1 if none)."""
+        values, lengths = parse_numbers(numbers)
+        result = np.full(len(values), -1, dtype=np.int64)
+        for length, keys, positions in self._levels:
+            candidates = np.flatnonzero((result < 0) & (lengths >= length) & (values >= 0))
+            if not len(candidates) or not len(keys):
+                continue
+            leading = values[candidates] // np.power(10, lengths[candidates] - length)
+            slots = np.searchsorted(keys, leading)
+            slots = np.minimum(slots, len(keys) - 1)
+            found = keys[slots] == leading
+            result[candidates[found]] = positions[slots[found]]
+        return result
+
+    def resolve(self, numbers):
+        """Return, for each number, (matched prefix, top-K routes), or (None, []) when no prefix matches."""
+        return [(self.prefixes[i], self.routes[i]) if i >= 0 else (None, []) for i in self.lookup_many(numbers)]
+
+    def lookup(self, number):
+        return self.resolve([number])[0]
+
+    def cheapest_prices(self, numbers):
+        """Return the best price_1 for each number as an array (NaN when no prefix matches)."""
+        indexes = self.lookup_many(numbers)
+        return np.where(indexes >= 0, self.best_price[np.maximum(indexes, 0)] if len(self) else np.nan, np.nan)
+
+    def write_lcr_table(self, path):
+        """Write the index as an LCR table: one row per prefix and rank."""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['prefix', 'rank', 'vendor_name', 'connection_name', 'i_connection', 'price_1'])
+            for prefix, routes in zip(self.prefixes, self.routes):
+                for rank, rate in enumerate(routes, start=1):
+                    writer.writerow([prefix, rank, rate.get('vendor_name'), rate.get('connection_name'),
+                                     rate.get('i_connection'), rate.get('price_1')])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve numbers to their cheapest routes')
+    parser.add_argument('scan_file', help='JSON lines file written by market_scan.py')
+    parser.add_argument('numbers_file', help='file with one E.164 number per line')
+    parser.add_argument('output_file', help='CSV file with the routes of each number')
+    parser.add_argument('--top-k', type=int, default=3, help='routes kept per prefix')
+    args = parser.parse_args()
+
+    index = RateIndex.from_scan_file(args.scan_file, args.top_k)
+    with open(args.numbers_file, 'r') as f:
+        numbers = [line.strip() for line in f if line.strip()]
+    with open(args.output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['number', 'prefix', 'rank', 'vendor_name', 'connection_name', 'i_connection', 'price_1'])
+        for number, (prefix, routes) in zip(numbers, index.resolve(numbers)):
+            if not routes:
+                writer.writerow([number, '', '', '', '', '', ''])
+            for rank, rate in enumerate(routes, start=1):
+                writer.writerow([number, prefix, rank, rate.get('vendor_name'), rate.get('connection_name'),
+                                 rate.get('i_connection'), rate.get('price_1')])
+    print(f"Resolved {len(numbers)} numbers against {len(index)} prefixes, results written to {args.output_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+TelecomsXChange Reference Data Cache
+
+Disk-backed TTL cache for reference datasets that rarely change, such as the sellers list
+(/sellers/list) and the test numbers (/buyers/tools/getnumbers). Each dataset is stored as a JSON
+file under cache_dir together with the time it was fetched and, when the API sends them, the
+ETag/Last-Modified headers.
+
+While an entry is younger than its TTL it is returned without any API call. Once it expires the
+request is repeated as a conditional request (If-None-Match/If-Modified-Since), so an unchanged
+dataset only costs a 304 response. If the refresh fails the stale entry is used. Entries can be
+invalidated one by one or all together.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+import requests
+
+from tcxc_client import TCXCAPIError
+
+# Directory holding the cached datasets
+cache_dir = os.environ.get('TCXC_CACHE_DIR', '.tcxc_cache')
+
+# Default time to live of the reference datasets, in seconds
+sellers_list_ttl = 24 * 3600
+test_numbers_ttl = 6 * 3600
+
+
+class ReferenceCache:
+    """JSON file cache of API datasets with TTL, conditional refresh and invalidation."""
+
+    def __init__(self, directory=cache_dir):
+        self.directory = directory
+
+    def _path(self, name, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}-{digest}.json")
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def fetch(self, client, name, method, endpoint, params, items_key, ttl, refresh=False):
+        """Return the items_key list of an API response, from the cache while it is fresh."""
+        key = [client.base_url, endpoint, params]
+        path = self._path(name, key)
+        entry = self._read(path)
+        if entry is not None and not refresh and time.time() - entry['fetched_at'] < ttl:
+            return entry['data']
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        request_args = {'params': params} if method == 'GET' else {'data': params}
+        try:
+            response = client.request(method, endpoint, headers=headers, **request_args)
+            if response.status_code == 304 and entry is not None:
+                entry['fetched_at'] = time.time()
+                self._write(path, entry)
+                return entry['data']
+            if response.status_code != 200:
+                raise TCXCAPIError(f"{endpoint} request failed with status code {response.status_code}", response)
+            try:
+                data = response.json()[items_key]
+            except (ValueError, KeyError):
+                raise TCXCAPIError(f"Unexpected {endpoint} response: {response.text[:200]}", response)
+        except (requests.RequestException, TCXCAPIError) as e:
+            if entry is None:
+                raise
+            logging.warning(f"Refreshing {name} failed, using the cached copy from "
+                            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['fetched_at']))}: {e}")
+            return entry['data']
+
+        self._write(path, {
+            'fetched_at': time.time(),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'data': data,
+        })
+        return data
+
+    def invalidate(self, name=None):
+        """Remove the cached entries of one dataset, or of all datasets when name is None."""
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json') and (name is None or filename.startswith(name + '-')):
+                os.remove(os.path.join(self.directory, filename))
+
+
+default_cache = ReferenceCache()
+
+
+def get_sellers_list(client, ttl=sellers_list_ttl, refresh=False, cache=default_cache):
+    """Return the routes of /sellers/list (seller_name, i_connection, route_name, ...)."""
+    return cache.fetch(client, 'sellers_list', 'POST', '/sellers/list', {"pager": 300, "off": 0}, 'routes', ttl, refresh)
+
+
+def get_test_numbers(client, country, description, ttl=test_numbers_ttl, refresh=False, cache=default_cache):
+    """Return the test numbers of /buyers/tools/getnumbers for a country and network description."""
+    return cache.fetch(client, 'test_numbers', 'GET', '/buyers/tools/getnumbers',
+                       {"country": country, "description": description}, 'cdrs', ttl, refresh)
+
+
+def seller_names(client, ttl=sellers_list_ttl, cache=default_cache):
+    """Return a dict resolving i_connection (as a string) to the seller name, empty if the list is unavailable."""
+    try:
+        sellers_list = get_sellers_list(client, ttl, cache=cache)
+    except (requests.RequestException, TCXCAPIError) as e:
+        logging.warning(f"Sellers list unavailable, i_connections will not be resolved to seller names: {e}")
+        return {}
+    return {str(seller['i_connection']): seller['seller_name'] for seller in sellers_list}
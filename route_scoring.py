@@ -0,0 +1,133 @@
+"""
+Route Scoring
+
+Vectorized multi-criteria scoring of market view routes for generate_ai_routing_strategy.py.
+The rate fields are parsed once into NumPy arrays: price (price_1), billing interval
+(interval_1) and, where the market view returns them, the quality fields ASR, ACD and PDD.
+Each criterion is scaled to 0..1 (1 = best) and combined into a weighted score; criteria that
+no route reports are left out and their weight is spread over the others.
+
+It also flags price outliers with a robust (median/MAD) z-score and groups prices into
+clusters separated by unusually large gaps, so the ranking and statistics need no per-row
+Python work once the arrays are built.
+"""
+
+import numpy as np
+
+# Criteria: (rate field, weight, True when a higher value is better)
+criteria = {
+    'price': ('price_1', 0.6, False),
+    'interval': ('interval_1', 0.1, False),
+    'asr': ('asr', 0.15, True),
+    'acd': ('acd', 0.1, True),
+    'pdd': ('pdd', 0.05, False),
+}
+
+# Modified z-score above which a price is an outlier
+outlier_threshold = 3.5
+
+# A gap between two sorted prices larger than gap_factor times the median gap starts a new cluster
+gap_factor = 5.0
+
+
+def _to_float(value):
+    try:
+        return float(str(value).rstrip('%'))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def parse_rates(rates):
+    """Return {criterion: float array} for the criteria fields, NaN where a rate has no value."""
+    return {name: np.fromiter((_to_float(rate.get(field)) for rate in rates), dtype=np.float64, count=len(rates))
+            for name, (field, _, _) in criteria.items()}
+
+
+def score_routes(columns, weights=None):
+    """Return the weighted score of each route (higher is better) and the weights actually used."""
+    weights = dict({name: weight for name, (_, weight, _) in criteria.items()}, **(weights or {}))
+    n = len(columns['price'])
+    score = np.zeros(n, dtype=np.float64)
+    used = {}
+    for name, (_, _, higher_is_better) in criteria.items():
+        values = columns[name]
+        present = ~np.isnan(values)
+        if not present.any() or not weights.get(name):
+            continue
+        low, high = values[present].min(), values[present].max()
+        scaled = np.full(n, 0.5) if high == low else (values - low) / (high - low)
+        if not higher_is_better:
+            scaled = 1.0 - scaled
+        # Routes that do not report a criterion get a neutral value for it
+        scaled = np.where(present, scaled, 0.5)
+        score += weights[name] * scaled
+        used[name] = weights[name]
+    total = sum(used.values())
+    if total:
+        score /= total
+        used = {name: weight / total for name, weight in used.items()}
+    return score, used
+
+
+def price_outliers(prices):
+    """Boolean mask of prices whose modified z-score exceeds outlier_threshold."""
+    present = ~np.isnan(prices)
+    if present.sum() < 3:
+        return np.zeros(len(prices), dtype=bool)
+    median = np.median(prices[present])
+    mad = np.median(np.abs(prices[present] - median))
+    if mad == 0:
+        return present & (prices != median) & (np.abs(prices - median) > 0.5 * abs(median))
+    modified_z = 0.6745 * (prices - median) / mad
+    return present & (np.abs(modified_z) > outlier_threshold)
+
+
+def price_clusters(prices):
+    """Return a cluster number for each price (-1 when missing), clusters numbered from the cheapest."""
+    labels = np.full(len(prices), -1, dtype=np.int64)
+    present = np.flatnonzero(~np.isnan(prices))
+    if not len(present):
+        return labels
+    order = present[np.argsort(prices[present])]
+    gaps = np.diff(prices[order])
+    median_gap = np.median(gaps) if len(gaps) else 0.0
+    threshold = gap_factor * median_gap if median_gap > 0 else (gaps[gaps > 0].min() if (gaps > 0).any() else np.inf)
+    breaks = np.concatenate(([0], (gaps > threshold).astype(np.int64)))
+    labels[order] = np.cumsum(breaks)
+    return labels
+
+
+def analyze_routes(rates, weights=None):
+    """Score, rank and summarize a list of market view rates.
+
+    Returns a dict with the ranking (indexes into rates, best first), scores, outlier mask,
+    cluster labels and summary statistics.
+    """
+    columns = parse_rates(rates)
+    scores, used_weights = score_routes(columns, weights)
+    prices = columns['price']
+    ranking = np.lexsort((np.nan_to_num(prices, nan=np.inf), -scores))
+    outliers = price_outliers(prices)
+    clusters = price_clusters(prices)
+
+    labelled = clusters >= 0
+    sizes = np.bincount(clusters[labelled])
+    lows = np.full(len(sizes), np.inf)
+    highs = np.full(len(sizes), -np.inf)
+    np.minimum.at(lows, clusters[labelled], prices[labelled])
+    np.maximum.at(highs, clusters[labelled], prices[labelled])
+    cluster_ranges = [(label, float(lows[label]), float(highs[label]), int(sizes[label])) for label in range(len(sizes))]
+
+    present = prices[~np.isnan(prices)]
+    stats = {
+        'routes': len(rates),
+        'min_price': float(present.min()) if len(present) else None,
+        'median_price': float(np.median(present)) if len(present) else None,
+        'mean_price': round(float(present.mean()), 6) if len(present) else None,
+        'max_price': float(present.max()) if len(present) else None,
+        'std_price': round(float(present.std()), 6) if len(present) else None,
+        'outliers': int(outliers.sum()),
+        'clusters': cluster_ranges,
+        'weights': used_weights,
+    }
+    return {'ranking': ranking, 'scores': scores, 'outliers': outliers, 'clusters': clusters, 'stats': stats}
@@ -5,8 +5,9 @@ Last Modified: 2023-06-12
 Author: Ameed Jamous
 
 Description:
-This script fetches payment history from Telecomsxchange's Seller Pay History API, 
-summarizes the total number of transactions and the total payout amount, 
+This script fetches payment history from Telecomsxchange's Seller Pay History API into a local
+transaction store (payhistory_store.py), only requesting what is newer than the last run, computes
+statistics from the store (monthly totals and moving averages, per-counterparty sums, anomalies),
 and then uses OpenAI to generate a textual summary and identify any patterns in the data.
 The script logs all its actions, both in the console and in a file named 'payhistory_summary.log'.
 
@@ -14,17 +15,11 @@ Credentials, API endpoints, and other configurations can be adjusted in the resp
 script.
 """
 
-import requests
-from requests.auth import HTTPDigestAuth
-import openai
-import json
+import argparse
 import logging
 import os
-from datetime import datetime
-
-# Set up logging
-logging.basicConfig(filename='payhistory_summary.log', level=logging.INFO, 
-                    format='%(asctime)s %(levelname)s:%(message)s')
+from tcxc_client import TCXCAPIError, get_client
+from tcxc_metrics import metrics
 
 # You'll need to set the environment variables TCXC_USERNAME, TCXC_PASSWORD, and OPENAI_KEY 
 # in your operating system or deployment environment for the script to run successfully.
@@ -33,48 +28,61 @@ logging.basicConfig(filename='payhistory_summary.log', level=logging.INFO,
 username = os.environ.get('TCXC_USERNAME')
 password = os.environ.get('TCXC_PASSWORD')
 
-# Set your OpenAI key
-openai.api_key = os.environ.get('OPENAI_KEY')
-
-# TCXC API Endpoint 
-pay_history_url = 'https://apiv2.telecomsxchange.com/sellers/payhistory'
-
-# Data for the pay history API request
-pay_history_data = {
-    'date_from': "2019-01-01 00:00:00",
-    'date_to': "2023-06-01 00:00:00",
-    'pager': "1000"
-}
-
-try:
-    # Send POST request for pay history
-    pay_history_response = requests.post(pay_history_url, data=pay_history_data, auth=HTTPDigestAuth(username, password))
-
-    # Check if the pay history request was successful
-    if pay_history_response.status_code == 200:
-        pay_history_info = pay_history_response.json()
-        if pay_history_info.get('status') == 'success':
-            transactions = pay_history_info.get('transactions')
-            # Create a summary of the transactions
-            total_transactions = len(transactions)
-            total_amount = sum([float(transaction['amount']) for transaction in transactions])
-            # Prepare prompt for OpenAI
-            prompt = f"We have a set of {total_transactions} financial transactions, with an accumulated payout of {total_amount} USD. The first few transactions are: {transactions[:5]}. Please generate a detailed summary of this data, emphasizing on any noticeable patterns or trends. Additionally, always provide the total sum of the payout values."
-            # Generate the summary using OpenAI
+# API Endpoint
+pay_history_endpoint = '/sellers/payhistory'
+
+# Transactions requested per page
+page_size = 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize the seller pay history with OpenAI')
+    parser.add_argument('--store-dir', help='directory of the local transaction store (default: payhistory_store)')
+    args = parser.parse_args(argv)
+
+    # openai, and numpy through the transaction store, are only loaded when the summary is generated
+    import openai
+    from payhistory_store import PayHistoryStore, store_dir, sync_pay_history
+
+    # Set up logging
+    logging.basicConfig(filename='payhistory_summary.log', level=logging.INFO, 
+                        format='%(asctime)s %(levelname)s:%(message)s')
+
+    # Set your OpenAI key
+    openai.api_key = os.environ.get('OPENAI_KEY')
+
+    # Shared TCXC/NeuTrafix client, base URL is configured in tcxc_client.py
+    client = get_client(username, password)
+
+    # Local transaction store, each run only fetches the transactions after its date_to watermark
+    store = PayHistoryStore(args.store_dir or store_dir)
+
+    try:
+        # Fetch the new transactions into the store, then compute the statistics from the stored columns
+        with metrics.stage('fetch'):
+            sync_pay_history(client, store, pay_history_endpoint, page_size=page_size)
+        with metrics.stage('report'):
+            statistics = store.statistics()
+        statistics_summary = statistics.summary_text()
+        logging.info(f"Pay history statistics:\n{statistics_summary}")
+        # Prepare prompt for OpenAI
+        prompt = f"Here are the statistics of our full seller pay history:\n{statistics_summary}\nPlease generate a detailed summary of this data, emphasizing on any noticeable patterns, trends or anomalies. Additionally, always provide the total sum of the payout values."
+        # Generate the summary using OpenAI
+        with metrics.stage('llm'):
             summary_completion = openai.Completion.create(model="text-davinci-003", prompt=prompt, max_tokens=200)
-            # Print and log the generated summary
-            summary = summary_completion.choices[0].text.strip()
-            print(summary)
-            logging.info(f"Generated summary: {summary}")
-        else:
-            error_message = f"Pay history request returned an error. Details: {pay_history_info}"
-            print(error_message)
-            logging.error(error_message)
-    else:
-        error_message = "Pay history request failed"
+        # Print and log the generated summary
+        summary = summary_completion.choices[0].text.strip()
+        print(summary)
+        logging.info(f"Generated summary: {summary}")
+    except TCXCAPIError as e:
+        error_message = f"Pay history request failed. Details: {e}"
         print(error_message)
         logging.error(error_message)
-except Exception as e:
-    error_message = f"An error occurred: {str(e)}"
-    print(error_message)
-    logging.error(error_message)
+    except Exception as e:
+        error_message = f"An error occurred: {str(e)}"
+        print(error_message)
+        logging.error(error_message)
+
+
+if __name__ == '__main__':
+    main()
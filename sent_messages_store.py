@@ -0,0 +1,118 @@
+"""
+Sent Trouble Ticket Store
+
+Persistent dedupe store for the trouble ticket scripts. It keeps the ids of messages already
+sent to vendors so a failed call is only reported once.
+
+The file is read once per run into a dict, so each lookup is O(1) instead of a scan of the
+whole history. New ids are appended in batches. Every line carries the time it was recorded,
+and entries older than the TTL are dropped when the file is compacted: on load, and in a
+long-running poller once a day or every compact_every appends, so neither the file nor the
+in-memory index grows forever.
+
+The file format is one "message_id<TAB>unix_time" per line. Files written by older versions of
+the scripts (one message_id per line) are imported as they are and rewritten on first load.
+"""
+
+import os
+import time
+
+# Keep sent message ids for 30 days, well above the call history window of the scripts
+default_ttl_days = 30
+
+# Compact on flush once this many ids were appended, or this many seconds passed, since the last compaction
+compact_every = 10000
+compact_interval = 86400
+
+
+def make_message_id(call_id, destination_number, vendor_id):
+    return f'{call_id}-{destination_number}-{vendor_id}'
+
+
+class SentMessageStore:
+    """Set of sent message ids backed by an append-only file with TTL-based compaction."""
+
+    def __init__(self, path='sent_messages.txt', ttl_days=default_ttl_days, flush_every=50):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.flush_every = flush_every
+        self._sent = {}
+        self._pending = []
+        self._appended = 0
+        self._compacted = time.time()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        now = time.time()
+        cutoff = now - self.ttl
+        lines = 0
+        needs_rewrite = False
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                lines += 1
+                message_id, sep, recorded = line.rpartition('\t')
+                if not sep:
+                    # Line from the old sent_messages.txt format, import it as recorded now
+                    message_id, recorded, needs_rewrite = line, now, True
+                else:
+                    try:
+                        recorded = float(recorded)
+                    except ValueError:
+                        message_id, recorded, needs_rewrite = line, now, True
+                if recorded >= cutoff:
+                    self._sent[message_id] = max(recorded, self._sent.get(message_id, 0))
+        # Rewrite when old-format lines were imported or expired/duplicate lines dominate the file
+        if needs_rewrite or lines > 2 * len(self._sent) + 1000:
+            self.compact()
+
+    def __contains__(self, message_id):
+        return message_id in self._sent
+
+    def __len__(self):
+        return len(self._sent)
+
+    def add(self, message_id):
+        if message_id in self._sent:
+            return
+        recorded = time.time()
+        self._sent[message_id] = recorded
+        self._pending.append(f'{message_id}\t{recorded:.0f}\n')
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Append the ids added since the last flush to the file, and drop expired ids now and then."""
+        if self._pending:
+            with open(self.path, 'a') as f:
+                f.writelines(self._pending)
+            self._appended += len(self._pending)
+            self._pending = []
+        # A long-running poller never reloads the file, so the expired ids are dropped here too
+        if self._appended >= compact_every or (self._sent and time.time() - self._compacted >= compact_interval):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the file with only the unexpired ids, replacing it atomically."""
+        cutoff = time.time() - self.ttl
+        self._sent = {message_id: recorded for message_id, recorded in self._sent.items() if recorded >= cutoff}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(f'{message_id}\t{recorded:.0f}\n' for message_id, recorded in self._sent.items())
+        os.replace(tmp_path, self.path)
+        self._pending = []
+        self._appended = 0
+        self._compacted = time.time()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,53 @@
+"""
+TelecomsXChange Automation Command
+
+One entry point for all the automation scripts, e.g. for cron:
+
+    python3 tcxc.py low-qos --window-minutes 30
+    python3 tcxc.py carrier-relations --target-rate 0.004
+    python3 tcxc.py route-test --batch matrix.csv --i-account 12345 --cli 15551234567
+
+Only the module of the chosen subcommand is imported, and the scripts import their heavy optional
+packages (openai, numpy, tabulate) only on the code paths that use them, so a run does not pay
+for what it does not need. Everything after the subcommand is passed to the script's main(),
+`python3 tcxc.py <command> --help` lists its options.
+"""
+
+import argparse
+import importlib
+import sys
+
+from tcxc_metrics import metrics
+
+# Subcommand -> (module with a main(argv) function, description)
+commands = {
+    'carrier-relations': ('automate_carrier_relations', 'interconnect with the market view routes under a target rate'),
+    'low-qos': ('automate_low_qos_tt', 'open trouble tickets for low QoS calls'),
+    'low-qos-ai': ('automate_low_qos_tt_openai', 'open trouble tickets for low QoS calls, written with OpenAI'),
+    'did-buy': ('automate_did_buying', 'search and purchase DID numbers'),
+    'did-sell': ('automate_numbers_selling', 'list DID numbers for sale and notify the buyers'),
+    'route-test': ('automate_routes_testing', 'test SIP trunks, interactively or from a CSV matrix'),
+    'routing-strategy': ('generate_ai_routing_strategy', 'suggest a least cost routing strategy with OpenAI'),
+    'payhistory-summary': ('seller_payhistory_ai_summary', 'summarize the seller pay history with OpenAI'),
+    'market-scan': ('market_scan', 'search the market view for a list of dial codes'),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tcxc', description='TelecomsXChange (TCXC) automation scripts',
+                                     epilog='\n'.join(f"  {name:<20}{description}" for name, (_, description) in commands.items()),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=commands, metavar='command', help='one of the commands below')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help='arguments of the command')
+    args = parser.parse_args(argv)
+
+    module_name, _ = commands[args.command]
+    # Label the metrics with the script name, as when the script is run directly
+    metrics.workflow = module_name
+    # Usage and error messages of the script show the command as the program name
+    sys.argv = [f"tcxc {args.command}"] + args.arguments
+    return importlib.import_module(module_name).main(args.arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+TelecomsXChange Shared API Client
+
+Shared HTTP client used by every automation script in this repository. It keeps one
+keep-alive connection pool per base URL (TCXC or NeuTrafix) and reuses the Digest
+nonce and nonce-count between calls, so only the very first request of a run has to
+go through the 401 challenge round trip.
+
+Every request goes through the client's AdaptiveGovernor: an optional token bucket per
+endpoint, an AIMD concurrency limit that is cut on 429/5xx/connection errors and grows back
+on success, and jittered exponential backoff retries for read-only endpoints (writes are only
+retried on 429, which the API rejects before processing). Fan-out paths therefore run at the
+highest concurrency the API accepts without each script having to handle throttling. Latency,
+status, retries and bytes of every call are recorded in tcxc_metrics.
+
+Credentials and API endpoints are configured in one place: the section below, or the
+TCXC_USERNAME, TCXC_PASSWORD and TCXC_BASE_URL environment variables.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+
+from tcxc_metrics import metrics
+
+# TCXC Base API URL
+TCXC_BASE_URL = 'https://apiv2.telecomsxchange.com'
+
+# NeuTrafix (NTX) Base API URL
+NEUTRAFIX_BASE_URL = 'https://apiv2.neutrafix.telin.net'
+
+# Telecomsxchange/NeuTrafix Credentials
+username = os.environ.get('TCXC_USERNAME', '{Enter API login}')
+password = os.environ.get('TCXC_PASSWORD', '{Enter API key}')
+
+# Base URL used by all scripts, set TCXC_BASE_URL to NEUTRAFIX_BASE_URL for NeuTrafix
+base_url = os.environ.get('TCXC_BASE_URL', TCXC_BASE_URL)
+
+# Connection pool size and request timeout (seconds)
+pool_size = int(os.environ.get('TCXC_POOL_SIZE', '20'))
+timeout = float(os.environ.get('TCXC_TIMEOUT', '60'))
+
+# Adaptive governor: concurrency limit bounds, and the starting limit
+max_concurrency = int(os.environ.get('TCXC_MAX_CONCURRENCY', '32'))
+min_concurrency = 1
+initial_concurrency = int(os.environ.get('TCXC_INITIAL_CONCURRENCY', '8'))
+
+# Default requests per second of each endpoint (0 = no rate limit), and per-endpoint overrides
+requests_per_second = float(os.environ.get('TCXC_RATE', '0'))
+endpoint_rates = {}
+
+# Retries of throttled or failed requests, with backoff of backoff_base * 2^attempt seconds (capped, jittered)
+max_retries = 3
+backoff_base = 0.5
+backoff_cap = 30.0
+
+# Network failures that count as throttling and are retried for read-only endpoints
+retryable_errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+# Read-only endpoints that are safe to retry on 5xx and connection errors (GET requests always are)
+idempotent_endpoints = {
+    '/marketview/search',
+    '/buyers/callhistory',
+    '/sellers/payhistory',
+    '/sellers/list',
+    '/sellers/buyers/list',
+    '/buyers/interconnections',
+    '/number/market',
+    '/buyers/tools/getnumbers',
+}
+
+# Headers for the requests
+headers = {
+    'Content-Type': 'application/x-www-form-urlencoded',
+}
+
+
+class TCXCAPIError(Exception):
+    """Raised when a TCXC/NeuTrafix API call fails or does not return status 'success'."""
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class SharedDigestAuth(HTTPDigestAuth):
+    """HTTPDigestAuth that shares the server nonce and nonce-count across threads.
+
+    requests keeps Digest state per thread, so every worker of a thread pool would
+    pay its own 401 challenge. Here the last challenge is shared, and each thread
+    starts from it and takes the next nonce-count under a lock.
+    """
+
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        self._shared_lock = threading.Lock()
+        self._shared_chal = {}
+        self._shared_nonce = ''
+        self._shared_count = 0
+
+    def __call__(self, r):
+        self.init_per_thread_state()
+        with self._shared_lock:
+            if self._shared_nonce and not self._thread_local.last_nonce:
+                self._thread_local.chal = dict(self._shared_chal)
+                self._thread_local.last_nonce = self._shared_nonce
+        return super().__call__(r)
+
+    def build_digest_header(self, method, url):
+        with self._shared_lock:
+            nonce = self._thread_local.chal.get('nonce')
+            if nonce and nonce == self._shared_nonce:
+                self._thread_local.last_nonce = nonce
+                self._thread_local.nonce_count = self._shared_count
+            header = super().build_digest_header(method, url)
+            if header:
+                self._shared_chal = dict(self._thread_local.chal)
+                self._shared_nonce = self._thread_local.last_nonce
+                self._shared_count = self._thread_local.nonce_count
+        return header
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing rate requests per second with bursts of up to burst requests."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class AdaptiveGovernor:
+    """Per-endpoint rate limits, an AIMD concurrency limit and retry policy shared by all calls of a client.
+
+    The concurrency limit grows by one for every limit successful calls (additive increase) and is
+    halved when the API throttles or fails (multiplicative decrease), at most once per cooldown so a
+    burst of errors from the same overload only counts once.
+    """
+
+    def __init__(self, initial=initial_concurrency, minimum=min_concurrency, maximum=max_concurrency,
+                 rate=requests_per_second, rates=None, decrease=0.5, cooldown=1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.rate = rate
+        self.rates = {self.endpoint_key(endpoint): rate for endpoint, rate in dict(endpoint_rates, **(rates or {})).items()}
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._buckets = {}
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def endpoint_key(endpoint):
+        """Normalize '/buyers/callhistory/' or a full URL to '/buyers/callhistory'."""
+        return '/' + urlsplit(endpoint).path.strip('/')
+
+    def set_rate(self, endpoint, rate):
+        """Limit an endpoint to rate requests per second (0 removes the limit)."""
+        key = self.endpoint_key(endpoint)
+        with self._condition:
+            self.rates[key] = rate
+            self._buckets.pop(key, None)
+
+    def _bucket(self, key):
+        with self._condition:
+            if key not in self._buckets:
+                rate = self.rates.get(key, self.rate)
+                self._buckets[key] = TokenBucket(rate) if rate else None
+            return self._buckets[key]
+
+    def acquire(self, endpoint):
+        """Wait for the endpoint's rate budget and a free concurrency slot."""
+        bucket = self._bucket(self.endpoint_key(endpoint))
+        if bucket is not None:
+            bucket.acquire()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        """Free a slot and adapt the limit to the outcome of the call."""
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def is_idempotent(self, method, endpoint):
+        return method.upper() in ('GET', 'HEAD', 'OPTIONS') or self.endpoint_key(endpoint) in idempotent_endpoints
+
+    @staticmethod
+    def backoff(attempt, response=None):
+        """Seconds to wait before retry number attempt: the Retry-After header, or full-jitter exponential backoff."""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(backoff_cap, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    return len(body.encode('utf-8') if isinstance(body, str) else body) if isinstance(body, (str, bytes)) else 0
+
+
+def _response_size(response, stream=False):
+    # A streamed body has not been downloaded yet, so only its announced length is known
+    if stream:
+        return int(response.headers.get('Content-Length') or 0)
+    return len(response.content)
+
+
+class TCXCClient:
+    """Pooled, Digest-authenticated client for one TCXC/NeuTrafix base URL."""
+
+    def __init__(self, username, password, base_url=TCXC_BASE_URL, pool_size=pool_size, timeout=timeout, governor=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.governor = governor or AdaptiveGovernor()
+        self.session = requests.Session()
+        self.session.auth = SharedDigestAuth(username, password)
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def url(self, endpoint):
+        """Return the full URL for an endpoint such as '/marketview/search'."""
+        if endpoint.startswith('http://') or endpoint.startswith('https://'):
+            return endpoint
+        return self.base_url + '/' + endpoint.lstrip('/')
+
+    def request(self, method, endpoint, **kwargs):
+        """Send a request through the governor, retrying throttled and (for reads) failed calls."""
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = self.governor.is_idempotent(method, endpoint)
+        metrics_key = self.governor.endpoint_key(endpoint)
+        attempt = 0
+        while True:
+            self.governor.acquire(endpoint)
+            started = time.perf_counter()
+            response = None
+            throttled = False
+            # Exactly one release per acquire, whatever the request or the metrics raise
+            try:
+                response = self.session.request(method, self.url(endpoint), **kwargs)
+                throttled = response.status_code == 429 or response.status_code >= 500
+                metrics.observe_request(metrics_key, time.perf_counter() - started, response.status_code,
+                                        _body_size(response.request.body), _response_size(response, kwargs.get('stream')))
+            except requests.RequestException as e:
+                # Network failures count as throttling, other errors (invalid URL, too many redirects) are not retried
+                throttled = isinstance(e, retryable_errors)
+                metrics.observe_request(metrics_key, time.perf_counter() - started)
+                if response is not None:
+                    response.close()
+                if not throttled or not idempotent or attempt >= max_retries:
+                    raise
+                response = None
+            finally:
+                self.governor.release(throttled)
+            if response is not None:
+                retry = response.status_code == 429 or (throttled and idempotent)
+                if not retry or attempt >= max_retries:
+                    return response
+            metrics.retry(metrics_key)
+            delay = self.governor.backoff(attempt, response)
+            if response is not None:
+                # Return the connection to the pool, a stream=True response would otherwise hold it until collected
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def post(self, endpoint, data=None, **kwargs):
+        return self.request('POST', endpoint, data=data, **kwargs)
+
+    def get(self, endpoint, params=None, **kwargs):
+        return self.request('GET', endpoint, params=params, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(username=None, password=None, base_url=None):
+    """Return the shared client for a base URL, creating its connection pool on first use.
+
+    Missing arguments fall back to the module configuration above.
+    """
+    username = username if username is not None else globals()['username']
+    password = password if password is not None else globals()['password']
+    base_url = (base_url or globals()['base_url']).rstrip('/')
+    key = (base_url, username)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None or client.session.auth.password != password:
+            client = TCXCClient(username, password, base_url)
+            _clients[key] = client
+        return client
+
+
+def fetch_items(client, endpoint, data, items_key):
+    """POST to an endpoint and return the list under items_key of a 'success' response."""
+    response = client.post(endpoint, data=data)
+    if response.status_code != 200:
+        raise TCXCAPIError(f"{endpoint} request failed with status code {response.status_code}", response)
+    try:
+        info = response.json()
+    except ValueError:
+        raise TCXCAPIError(f"Error decoding the {endpoint} response as JSON", response)
+    # Some list endpoints (e.g. /number/market) return the items without a 'status' field
+    if info.get('status', 'success') != 'success':
+        raise TCXCAPIError(f"{endpoint} request returned an error. Details: {info}", response)
+    return info.get(items_key) or []
+
+
+def paginate(client, endpoint, data, items_key, page_size=100, start=0, prefetch=True):
+    """Yield every item of a paged ('pager'/'off') endpoint, one page at a time.
+
+    With prefetch the next page is requested in the background while the caller
+    consumes the current one, so at most two pages are held in memory.
+    """
+    page_data = dict(data, pager=str(page_size))
+
+    def fetch(off):
+        return fetch_items(client, endpoint, dict(page_data, off=str(off)), items_key)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        off = start
+        future = executor.submit(fetch, off) if prefetch else None
+        previous = None
+        while True:
+            page = future.result() if prefetch else fetch(off)
+            # Stop on a short page, or if the API ignores 'off' and repeats the last page
+            if page == previous:
+                return
+            off += page_size
+            more = len(page) >= page_size
+            if prefetch and more:
+                future = executor.submit(fetch, off)
+            yield from page
+            if not more:
+                return
+            previous = page
+
+
+def iter_market_rates(client, search_data, page_size=100):
+    """Stream every rate of a /marketview/search query, moving 'off' forward page by page."""
+    return paginate(client, '/marketview/search', search_data, 'rates', page_size=page_size)
+
+
+def fan_out(func, items, max_in_flight=8):
+    """Call func(item) for every item on a thread pool with at most max_in_flight calls pending.
+
+    Items are consumed lazily, so a large iterable is never materialized. Yields
+    (item, result, error) tuples in completion order; error is None on success.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = {}
+        for item in items:
+            pending[executor.submit(func, item)] = item
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, (None if error else future.result()), error
+            for item in items:
+                pending[executor.submit(func, item)] = item
+                if len(pending) >= max_in_flight:
+                    break
@@ -0,0 +1,126 @@
+"""
+TelecomsXChange Logging
+
+Shared logging setup of the automation scripts. Log calls only put the record on a queue; a
+background thread writes it to the log file and the console, so slow disk or terminal I/O never
+holds up the loops that search routes or send interconnect requests.
+
+The log file is written as JSON lines, one record per line with the time, level, workflow and
+message, plus the structured fields passed with `extra` (i_connection, i_vendor, call_id, ...):
+
+    logger.info("Interconnect succeeded", extra={'i_connection': 1234, 'status': 200})
+
+    {"time": "2026-10-18T09:30:00.123Z", "level": "INFO", "workflow": "carrier-relations",
+     "message": "Interconnect succeeded", "i_connection": 1234, "status": 200}
+
+Response bodies go through log_body(), which logs only a sample of them and truncates each one.
+
+The level is configurable per workflow with environment variables, the workflow variable wins:
+
+    TCXC_LOG_LEVEL=WARNING                       all scripts
+    TCXC_LOG_LEVEL_CARRIER_RELATIONS=DEBUG       only carrier-relations
+    TCXC_LOG_FORMAT=text                         classic text lines in the log file instead of JSON
+    TCXC_LOG_BODY_SAMPLE=1.0                     log every response body (default 0.1)
+    TCXC_LOG_BODY_CHARS=2000                     characters kept of each logged body (default 500)
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Level used when neither the script nor TCXC_LOG_LEVEL_<WORKFLOW> sets one
+default_level = os.environ.get('TCXC_LOG_LEVEL', 'INFO')
+
+# Log file format, 'json' (JSON lines) or 'text'
+file_format = os.environ.get('TCXC_LOG_FORMAT', 'json')
+
+# Fraction of response bodies logged by log_body(), and characters kept of each
+body_sample_rate = float(os.environ.get('TCXC_LOG_BODY_SAMPLE', 0.1))
+body_max_chars = int(os.environ.get('TCXC_LOG_BODY_CHARS', 500))
+
+# Structured fields copied from the record into the JSON line when set with `extra`
+context_fields = ('i_connection', 'i_vendor', 'i_account', 'call_id', 'prefix', 'price', 'endpoint', 'status')
+
+# Console and text file format, as used by the scripts before
+text_format = logging.Formatter('%(asctime)s %(levelname)-8s %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+# Background writer of the running script, stopped (and the queue flushed) at exit
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Format a record as one JSON line."""
+
+    def __init__(self, workflow):
+        super().__init__()
+        self.workflow = workflow
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'workflow': self.workflow,
+            'message': record.getMessage(),
+        }
+        for field in context_fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def workflow_level(workflow, level=None):
+    """Return the log level of a workflow: TCXC_LOG_LEVEL_<WORKFLOW>, then level, then TCXC_LOG_LEVEL."""
+    variable = 'TCXC_LOG_LEVEL_' + workflow.upper().replace('-', '_')
+    level = os.environ.get(variable) or level or default_level
+    return logging.getLevelName(level.upper()) if isinstance(level, str) else level
+
+
+def setup_logging(workflow, log_file=None, level=None, console=True):
+    """Send the root logger's records through a queue to a background writer for log_file and the console.
+
+    Calling it again (e.g. from a second script in the same process) keeps the running setup.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(workflow_level(workflow, level))
+    if _listener is not None:
+        return root
+
+    handlers = []
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(JSONFormatter(workflow) if file_format == 'json' else text_format)
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(text_format)
+        handlers.append(console_handler)
+
+    records = queue.SimpleQueue()
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    root.addHandler(QueueHandler(records))
+    return root
+
+
+def truncate(text, limit=None):
+    """Cut text to limit characters (default body_max_chars), noting how much was left out."""
+    limit = body_max_chars if limit is None else limit
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more characters]"
+
+
+def log_body(logger, message, body, level=logging.INFO, **fields):
+    """Log a sample of response bodies, truncated; body may be a requests response or a string."""
+    if not logger.isEnabledFor(level) or random.random() >= body_sample_rate:
+        return
+    text = body.text if hasattr(body, 'text') else str(body)
+    logger.log(level, f"{message}: {truncate(text)}", extra=fields)
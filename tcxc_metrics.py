@@ -0,0 +1,207 @@
+"""
+TelecomsXChange Metrics
+
+Run metrics for the automation scripts. tcxc_client records every API call here (latency per
+endpoint, status codes, retries, errors, bytes sent and received), and the scripts time their
+stages (e.g. fetch, filter, llm and send in the low QoS pipeline) with metrics.stage().
+
+At the end of a run the metrics are written when configured with environment variables:
+
+    TCXC_METRICS_FILE   Prometheus text format (e.g. for the node_exporter textfile collector)
+    TCXC_METRICS_JSON   JSON summary with p50/p99 latency per endpoint and stage
+    TCXC_PROFILE        cProfile output of the whole run, for `python3 -m pstats` or snakeviz
+
+Latency histograms use fixed buckets for Prometheus; the JSON percentiles come from a bounded
+random sample of each series, so memory stays constant however long the run is.
+"""
+
+import atexit
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Export targets, written at exit when set
+metrics_file = os.environ.get('TCXC_METRICS_FILE')
+metrics_json = os.environ.get('TCXC_METRICS_JSON')
+profile_file = os.environ.get('TCXC_PROFILE')
+
+# Histogram bucket upper bounds in seconds, and samples kept per series for the JSON percentiles
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+sample_size = 10000
+
+
+class _Series:
+    """Histogram plus a reservoir sample of one latency series."""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * len(buckets)
+        self.sample = []
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(buckets):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        if len(self.sample) < sample_size:
+            self.sample.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < sample_size:
+                self.sample[slot] = seconds
+
+    def summary(self):
+        ordered = sorted(self.sample)
+
+        def percentile(fraction):
+            return round(ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] * 1000, 3) if ordered else 0.0
+
+        return {
+            'count': self.count,
+            'total_seconds': round(self.sum, 3),
+            'mean_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Thread-safe registry of API call and stage metrics for one run."""
+
+    def __init__(self, workflow=None):
+        self.workflow = workflow or os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.requests = defaultdict(_Series)
+        self.statuses = defaultdict(Counter)
+        self.retries = Counter()
+        self.errors = Counter()
+        self.bytes_sent = Counter()
+        self.bytes_received = Counter()
+        self.stages = defaultdict(_Series)
+
+    def observe_request(self, endpoint, seconds, status=None, bytes_sent=0, bytes_received=0):
+        """Record one API call; status None means the call raised (connection error, timeout)."""
+        with self._lock:
+            self.requests[endpoint].observe(seconds)
+            self.statuses[endpoint][status if status is not None else 'exception'] += 1
+            if status is None or status >= 400:
+                self.errors[endpoint] += 1
+            self.bytes_sent[endpoint] += bytes_sent
+            self.bytes_received[endpoint] += bytes_received
+
+    def retry(self, endpoint):
+        with self._lock:
+            self.retries[endpoint] += 1
+
+    def observe_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name].observe(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work as one occurrence of a stage: `with metrics.stage('fetch'): ...`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - started)
+
+    def summary(self):
+        """Return the metrics as a JSON-serializable dict."""
+        with self._lock:
+            endpoints = {}
+            for endpoint, series in self.requests.items():
+                endpoints[endpoint] = dict(series.summary(),
+                                           statuses={str(status): count for status, count in self.statuses[endpoint].items()},
+                                           errors=self.errors[endpoint],
+                                           retries=self.retries[endpoint],
+                                           bytes_sent=self.bytes_sent[endpoint],
+                                           bytes_received=self.bytes_received[endpoint])
+            return {
+                'workflow': self.workflow,
+                'started': self.started,
+                'duration_seconds': round(time.time() - self.started, 3),
+                'endpoints': endpoints,
+                'stages': {name: series.summary() for name, series in self.stages.items()},
+            }
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        workflow = _escape(self.workflow)
+        lines = []
+
+        def histogram(name, help_text, label, series_by_key):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, series in sorted(series_by_key.items()):
+                labels = f'workflow="{workflow}",{label}="{_escape(key)}"'
+                cumulative = 0
+                for bound, count in zip(buckets, series.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {series.count}')
+                lines.append(f"{name}_sum{{{labels}}} {series.sum:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {series.count}")
+
+        def counter(name, help_text, values):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for endpoint, value in sorted(values.items()):
+                lines.append(f'{name}{{workflow="{workflow}",endpoint="{_escape(endpoint)}"}} {value}')
+
+        with self._lock:
+            histogram('tcxc_request_duration_seconds', 'TCXC API call latency.', 'endpoint', self.requests)
+            lines.append("# HELP tcxc_requests_total TCXC API calls by final status code.")
+            lines.append("# TYPE tcxc_requests_total counter")
+            for endpoint, statuses in sorted(self.statuses.items()):
+                for status, count in sorted(statuses.items(), key=lambda item: str(item[0])):
+                    lines.append(f'tcxc_requests_total{{workflow="{workflow}",endpoint="{_escape(endpoint)}",status="{status}"}} {count}')
+            counter('tcxc_request_errors_total', 'TCXC API calls that failed or returned 4xx/5xx.', self.errors)
+            counter('tcxc_request_retries_total', 'TCXC API calls retried after throttling or errors.', self.retries)
+            counter('tcxc_request_bytes_sent_total', 'Request body bytes sent to the TCXC API.', self.bytes_sent)
+            counter('tcxc_response_bytes_received_total', 'Response body bytes received from the TCXC API.', self.bytes_received)
+            histogram('tcxc_stage_duration_seconds', 'Duration of script stages.', 'stage', self.stages)
+        return "\n".join(lines) + "\n"
+
+    def export(self, prometheus_path=None, json_path=None):
+        """Write the Prometheus text and/or JSON summary, atomically so collectors never read half a file."""
+        for path, render in ((prometheus_path, self.prometheus), (json_path, lambda: json.dumps(self.summary(), indent=2))):
+            if path:
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(render())
+                os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+def _start_profiler(path):
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(path)
+    atexit.register(dump)
+
+
+if profile_file:
+    _start_profiler(profile_file)
+
+if metrics_file or metrics_json:
+    atexit.register(metrics.export, metrics_file, metrics_json)
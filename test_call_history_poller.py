@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from call_history_poller import Watermark, next_window, run_incremental
+
+now = datetime(2026, 10, 18, 12, 0, 0)
+
+
+def test_first_window_covers_the_initial_minutes(tmp_path):
+    watermark = Watermark(str(tmp_path / 'watermark.txt'))
+    assert next_window(watermark, 30, now=now) == (now - timedelta(minutes=30), now)
+
+
+def test_next_window_starts_at_the_watermark_minus_the_overlap(tmp_path):
+    watermark = Watermark(str(tmp_path / 'watermark.txt'))
+    watermark.save(now - timedelta(minutes=10))
+    assert next_window(watermark, 30, overlap_minutes=5, now=now) == (now - timedelta(minutes=15), now)
+
+
+def test_a_watermark_in_the_future_is_capped_at_now(tmp_path):
+    watermark = Watermark(str(tmp_path / 'watermark.txt'))
+    watermark.save(now + timedelta(hours=1))
+    assert next_window(watermark, 30, overlap_minutes=5, now=now)[0] == now - timedelta(minutes=5)
+
+
+def test_an_unreadable_watermark_is_ignored(tmp_path):
+    path = tmp_path / 'watermark.txt'
+    path.write_text('yesterday\n')
+    assert Watermark(str(path)).load() is None
+
+
+def test_watermark_advances_only_when_the_window_was_processed(tmp_path):
+    watermark = Watermark(str(tmp_path / 'watermark.txt'))
+    windows = []
+
+    def failing(start_time, end_time):
+        windows.append((start_time, end_time))
+        return False
+
+    assert not run_incremental(failing, watermark, 30)
+    assert watermark.load() is None
+
+    def succeeding(start_time, end_time):
+        windows.append((start_time, end_time))
+        return True
+
+    assert run_incremental(succeeding, watermark, 30)
+    # Saved to the second, the format of the call history API
+    assert watermark.load() == windows[-1][1].replace(microsecond=0)
+    assert run_incremental(succeeding, watermark, 30, overlap_minutes=5)
+    assert windows[-1][0] == windows[-2][1].replace(microsecond=0) - timedelta(minutes=5)
@@ -0,0 +1,128 @@
+import pytest
+
+import automate_carrier_relations
+from interconnect_ledger import InterconnectLedger, reconcile
+
+
+def test_entries_survive_a_reload(tmp_path):
+    path = str(tmp_path / 'ledger.tsv')
+    with InterconnectLedger(path) as ledger:
+        ledger.add(100, 1, 0.01)
+        ledger.add('100', '2')
+    ledger = InterconnectLedger(path)
+    assert (100, 1) in ledger
+    assert ('100', 2) in ledger
+    assert (200, 1) not in ledger
+    assert ledger.get(100, 1)[0] == 0.01
+    assert ledger.get(100, 2)[0] is None
+
+
+def test_pending_entries_are_flushed_in_batches(tmp_path):
+    path = str(tmp_path / 'ledger.tsv')
+    ledger = InterconnectLedger(path, flush_every=2)
+    ledger.add(100, 1)
+    assert len(InterconnectLedger(path)) == 0
+    ledger.add(100, 2)
+    assert len(InterconnectLedger(path)) == 2
+
+
+def test_replace_keeps_other_accounts_and_known_times(tmp_path):
+    path = str(tmp_path / 'ledger.tsv')
+    ledger = InterconnectLedger(path)
+    ledger.add(100, 1, 0.01)
+    ledger.add(100, 2, 0.02)
+    ledger.add(200, 1, 0.03)
+    ledger.flush()
+    provisioned = ledger.get(100, 1)[1]
+    ledger.replace(100, [(1, None), (3, 0.04)])
+
+    ledger = InterconnectLedger(path)
+    assert ledger.get(100, 1) == (0.01, round(provisioned))
+    assert (100, 2) not in ledger
+    assert ledger.get(100, 3)[0] == 0.04
+    assert (200, 1) in ledger
+    assert not ledger.needs_reconcile(100, 7)
+    assert ledger.needs_reconcile(200, 7)
+
+
+def test_reconcile_reads_every_page(tmp_path):
+    class Response:
+        status_code = 200
+
+        def __init__(self, items):
+            self.items = items
+
+        def json(self):
+            return {'status': 'success', 'interconnections': self.items}
+
+    class Client:
+        def post(self, endpoint, data=None):
+            off = int(data['off'])
+            return Response([{'i_connection': str(i), 'price_1': '0.1'} for i in range(off, min(off + 2, 5))])
+
+    ledger = InterconnectLedger(str(tmp_path / 'ledger.tsv'))
+    assert reconcile(Client(), ledger, 100, '/buyers/list-of-interconnections', page_size=2) == 5
+    assert all((100, i) in ledger for i in range(5))
+
+
+@pytest.fixture
+def carrier_relations(tmp_path, monkeypatch):
+    ledger = InterconnectLedger(str(tmp_path / 'ledger.tsv'))
+    monkeypatch.setattr(automate_carrier_relations, 'ledger', ledger)
+    monkeypatch.setattr(automate_carrier_relations, 'i_account', '100')
+    return automate_carrier_relations
+
+
+def test_interrupted_serial_provisioning_keeps_the_successes(carrier_relations, monkeypatch):
+    def interconnect(i_connection):
+        if i_connection == 3:
+            raise KeyboardInterrupt
+        return True, {'status': 'success'}
+
+    monkeypatch.setattr(carrier_relations, 'provisioning_mode', 'serial')
+    monkeypatch.setattr(carrier_relations, 'interconnect', interconnect)
+    with pytest.raises(KeyboardInterrupt):
+        carrier_relations.provision({1: 0.01, 2: 0.02, 3: 0.03, 4: 0.04})
+
+    resumed = InterconnectLedger(carrier_relations.ledger.path)
+    assert ('100', 1) in resumed and ('100', 2) in resumed
+    assert ('100', 3) not in resumed and ('100', 4) not in resumed
+
+
+def test_interrupted_concurrent_provisioning_keeps_the_successes(carrier_relations, monkeypatch):
+    def fan_out(func, items, max_in_flight):
+        yield 1, (True, {'status': 'success'}), None
+        yield 2, (False, 'HTTP 500'), None
+        yield 3, None, ValueError('broken')
+        yield 4, (True, {'status': 'success'}), None
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(carrier_relations, 'provisioning_mode', 'concurrent')
+    monkeypatch.setattr(carrier_relations, 'fan_out', fan_out)
+    with pytest.raises(KeyboardInterrupt):
+        carrier_relations.provision({1: 0.01, 2: 0.02, 3: 0.03, 4: 0.04, 5: 0.05})
+
+    resumed = InterconnectLedger(carrier_relations.ledger.path)
+    assert sorted(key[1] for key in resumed._entries) == ['1', '4']
+    assert resumed.get('100', 4)[0] == 0.04
+
+
+def test_concurrent_provisioning_sends_each_connection_once(carrier_relations, monkeypatch):
+    sent = []
+
+    def interconnect(i_connection):
+        sent.append(i_connection)
+        if i_connection % 5 == 0:
+            raise ConnectionError('reset')
+        return i_connection % 3 != 0, {'status': 'success'}
+
+    monkeypatch.setattr(carrier_relations, 'provisioning_mode', 'concurrent')
+    monkeypatch.setattr(carrier_relations, 'max_in_flight', 4)
+    monkeypatch.setattr(carrier_relations, 'interconnect', interconnect)
+    results = carrier_relations.provision({i: 0.01 for i in range(1, 31)})
+
+    assert sorted(sent) == list(range(1, 31))
+    assert results[5] == (False, 'Exception: reset')
+    assert [i for i, (success, _) in sorted(results.items()) if success] == \
+        [i for i in range(1, 31) if i % 3 and i % 5]
+    assert len(carrier_relations.ledger) == len([i for i in range(1, 31) if i % 3 and i % 5])
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from json_stream import iter_array, iter_response_array
+
+document = {
+    'status': 'success',
+    'cdrs': [
+        {'call_id': 'a1', 'CLD': '441234', 'duration': 12, 'cost': 0.125, 'note': 'café – \U0001F4DE'},
+        {'call_id': 'a2', 'CLD': '441235', 'duration': 12345678901234, 'cost': -1.5e-3, 'tags': [1, [2, {}]]},
+        {'call_id': 'a3', 'escaped': 'quote \" backslash \\\\ brace } bracket ]', 'ok': True, 'none': None},
+        7,
+        -0.0,
+    ],
+    'total': 5,
+}
+body = json.dumps(document, ensure_ascii=False).encode('utf-8')
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 7, 64, len(body)])
+def test_items_match_json_loads_at_every_chunk_size(size):
+    fields = {}
+    assert list(iter_array(chunked(body, size), 'cdrs', fields)) == document['cdrs']
+    assert fields == {'status': 'success', 'total': 5}
+
+
+def test_every_split_point():
+    # Each split point cuts a number, string, escape or multi-byte character somewhere
+    for split in range(1, len(body)):
+        assert list(iter_array([body[:split], body[split:]], 'cdrs')) == document['cdrs']
+
+
+@pytest.mark.parametrize('text, value', [('12', 12), ('12.5', 12.5), ('12e3', 12e3), ('-0.25', -0.25), ('1E-2', 0.01)])
+def test_numbers_split_before_their_end(text, value):
+    data = ('{"cdrs": [' + text + ']}').encode()
+    for split in range(1, len(data)):
+        assert list(iter_array([data[:split], b'', data[split:]], 'cdrs')) == [value]
+
+
+def test_text_chunks_and_members_after_the_array():
+    fields = {}
+    chunks = ['{"cdrs": [{"a": 1}, ', '{"a": 2}], "status"', ': "success"}']
+    assert list(iter_array(chunks, 'cdrs', fields)) == [{'a': 1}, {'a': 2}]
+    assert fields == {'status': 'success'}
+
+
+@pytest.mark.parametrize('data', [b'{}', b'{"cdrs": []}', b' { "cdrs" : [ ] , "status" : "success" } '])
+def test_empty_objects_and_arrays(data):
+    assert list(iter_array(chunked(data, 3), 'cdrs')) == []
+
+
+def test_a_key_that_is_not_an_array_is_stored_as_a_field():
+    fields = {}
+    assert list(iter_array([b'{"cdrs": null, "status": "error"}'], 'cdrs', fields)) == []
+    assert fields == {'cdrs': None, 'status': 'error'}
+
+
+@pytest.mark.parametrize('data', [
+    b'[1, 2]',
+    b'{"cdrs": [1 2]}',
+    b'{"cdrs": [1, 2',
+    b'{"cdrs": [{"a": }]}',
+    b'{1: 2}',
+    b'{"cdrs": ["\xff"]}',
+    b'',
+])
+def test_malformed_input_raises_json_decode_error(data):
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_array(chunked(data, 4), 'cdrs'))
+
+
+def test_items_are_yielded_before_the_body_is_read():
+    read = []
+
+    def chunks():
+        for chunk in chunked(body, 16):
+            read.append(chunk)
+            yield chunk
+
+    items = iter_array(chunks(), 'cdrs')
+    next(items)
+    assert sum(map(len, read)) < len(body)
+
+
+def test_response_iteration_uses_the_chunk_size():
+    class Response:
+        def iter_content(self, chunk_size):
+            self.chunk_size = chunk_size
+            return iter(chunked(body, chunk_size))
+
+    response = Response()
+    assert list(iter_response_array(response, 'cdrs', chunk_size=8)) == document['cdrs']
+    assert response.chunk_size == 8
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import market_scan
+from market_scan import group_by_parent, load_prefixes, rates_for_child, scan_prefixes, write_scan
+
+
+def test_load_prefixes_skips_comments_signs_and_duplicates(tmp_path):
+    path = tmp_path / 'prefixes.txt'
+    path.write_text('# Niger\n+227\n22797  # mobile\n\n227\n44\n')
+    assert load_prefixes(str(path)) == ['227', '22797', '44']
+
+
+def test_children_are_grouped_under_their_shortest_listed_parent():
+    assert group_by_parent(['2279', '22797', '227', '44', '4420', '1']) == {
+        '227': ['2279', '22797'],
+        '44': ['4420'],
+        '1': [],
+    }
+
+
+def test_rates_for_child_keep_overlapping_prefixes():
+    rates = [{'prefix': '227'}, {'prefix': '22797'}, {'prefix': '22798'}, {'prefix': '2279712'}, {}]
+    assert [rate.get('prefix') for rate in rates_for_child(rates, '22797')] == ['227', '22797', '2279712', None]
+
+
+class SearchClient:
+    """Market view search answering every prefix with two routes, or failing for failing_prefix."""
+
+    def __init__(self, failing_prefix=None):
+        self.failing_prefix = failing_prefix
+        self.searched = []
+
+    def post(self, endpoint, data=None):
+        prefix = data['prefix']
+        self.searched.append(prefix)
+
+        class Response:
+            status_code = 500 if prefix == self.failing_prefix else 200
+
+            @staticmethod
+            def json():
+                return {'status': 'success', 'rates': [{'prefix': prefix, 'price_1': '0.1'},
+                                                       {'prefix': prefix + '7', 'price_1': '0.2'}]}
+        return Response()
+
+
+def test_children_are_not_searched_again():
+    client = SearchClient()
+    results = {prefix: (covered_by, rates, error) for prefix, covered_by, rates, error
+               in scan_prefixes(client, ['227', '2277', '2278', '44'], max_in_flight=2)}
+    assert sorted(client.searched) == ['227', '44']
+    assert results['2277'][0] == '227'
+    assert [rate['prefix'] for rate in results['2277'][1]] == ['227', '2277']
+    assert [rate['prefix'] for rate in results['2278'][1]] == ['227']
+    assert results['44'][0] is None
+
+
+def test_a_failed_search_fails_its_children(tmp_path):
+    output = tmp_path / 'scan.jsonl'
+    succeeded, failed = write_scan(SearchClient(failing_prefix='227'), ['227', '2277', '44'], str(output))
+    assert (succeeded, failed) == (1, 2)
+    records = {record['prefix']: record for record in map(json.loads, output.read_text().splitlines())}
+    assert records['2277']['covered_by'] == '227' and records['2277']['rates'] == []
+    assert 'error' in records['227'] and 'error' not in records['44']
+
+
+@pytest.mark.parametrize('max_in_flight', [1, 4])
+def test_search_data_is_merged_per_prefix(max_in_flight, monkeypatch):
+    seen = []
+
+    def iter_market_rates(client, data, page_size):
+        seen.append(data)
+        return iter([])
+
+    monkeypatch.setattr(market_scan, 'iter_market_rates', iter_market_rates)
+    list(scan_prefixes(None, ['1', '44'], {'type': 'CLI', 'searchform': '1'}, max_in_flight))
+    assert sorted(data['prefix'] for data in seen) == ['1', '44']
+    assert all(data['type'] == 'CLI' for data in seen)
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+import payhistory_store
+from payhistory_store import PayHistoryStore, sync_pay_history
+from tcxc_client import TCXCAPIError
+
+
+class PayHistoryClient:
+    """Serves the transactions dated inside date_from..date_to, in pages by 'pager' and 'off'."""
+
+    def __init__(self, transactions, fail=False):
+        self.transactions = transactions
+        self.fail = fail
+        self.windows = []
+
+    def post(self, endpoint, data=None):
+        if data['off'] == '0':
+            self.windows.append((data['date_from'], data['date_to']))
+        items = [t for t in self.transactions if data['date_from'] <= t['date'] <= data['date_to']]
+        off = int(data['off'])
+        page = items[off:off + int(data['pager'])]
+
+        class Response:
+            status_code = 500 if self.fail else 200
+
+            @staticmethod
+            def json():
+                return {'status': 'success', 'transactions': page}
+        return Response()
+
+
+def transaction(i_payment, date, amount=10.0, counterparty='carrier'):
+    return {'i_payment': i_payment, 'date': date, 'amount': str(amount), 'counterparty': counterparty}
+
+
+def test_first_sync_starts_at_the_history_start(tmp_path):
+    store = PayHistoryStore(str(tmp_path))
+    client = PayHistoryClient([transaction(1, '2026-10-01 10:00:00'), transaction(2, '2026-10-02 10:00:00')])
+    assert sync_pay_history(client, store, now=datetime(2026, 10, 18, 12, 0, 0)) == 2
+    assert client.windows == [(payhistory_store.history_start, '2026-10-18 12:00:00')]
+    assert store.watermark == '2026-10-18 12:00:00'
+
+
+def test_next_sync_overlaps_the_watermark_without_duplicates(tmp_path):
+    store = PayHistoryStore(str(tmp_path))
+    transactions = [transaction(1, '2026-10-18 11:00:00', 5.0), transaction(2, '2026-10-18 11:30:00', 7.0)]
+    client = PayHistoryClient(transactions)
+    sync_pay_history(client, store, now=datetime(2026, 10, 18, 12, 0, 0))
+
+    # A late posting dated before the watermark, and a new one after it
+    transactions += [transaction(3, '2026-10-18 11:45:00', 1.0), transaction(4, '2026-10-19 09:00:00', 2.0)]
+    assert sync_pay_history(client, store, now=datetime(2026, 10, 19, 12, 0, 0)) == 2
+    assert client.windows[-1] == ('2026-10-17 12:00:00', '2026-10-19 12:00:00')
+
+    store = PayHistoryStore(str(tmp_path))
+    assert len(store) == 4
+    assert sorted(store.column('amount').tolist()) == [1.0, 2.0, 5.0, 7.0]
+    assert store.watermark == '2026-10-19 12:00:00'
+
+
+def test_failed_sync_keeps_the_watermark(tmp_path):
+    store = PayHistoryStore(str(tmp_path))
+    sync_pay_history(PayHistoryClient([]), store, now=datetime(2026, 10, 18, 12, 0, 0))
+    with pytest.raises(TCXCAPIError):
+        sync_pay_history(PayHistoryClient([], fail=True), store, now=datetime(2026, 10, 19, 12, 0, 0))
+    assert PayHistoryStore(str(tmp_path)).watermark == '2026-10-18 12:00:00'
+
+
+def test_interrupted_append_is_cut_off(tmp_path):
+    store = PayHistoryStore(str(tmp_path))
+    store.append([transaction(1, '2026-10-01 10:00:00', 3.0)], set())
+    # Rows written to the columns without a committed meta.json
+    with open(store._column_path('amount'), 'ab') as f:
+        f.write(b'\0' * 8)
+
+    store = PayHistoryStore(str(tmp_path))
+    assert len(store.column('amount')) == 1
+    store.append([transaction(2, '2026-10-02 10:00:00', 4.0)], set())
+    assert store.column('amount').tolist() == [3.0, 4.0]
+    assert store.statistics().total == 7.0
@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+import pytest
+
+from qos_analytics import RouteStats, StreamingCDRSelector
+
+reasons = ['timeout', 'unspecified']
+
+
+def wilson_lower_bound(failures, attempts, z=1.96):
+    p = failures / attempts
+    centre = p + z * z / (2 * attempts)
+    margin = z * math.sqrt(p * (1 - p) / attempts + z * z / (4 * attempts * attempts))
+    return (centre - margin) / (1 + z * z / attempts)
+
+
+def cdrs(i_vendor, connection_name, cld, calls, failures, duration=60):
+    for i in range(calls):
+        failed = i < failures
+        yield {'call_id': f'{i_vendor}-{connection_name}-{cld}-{i}', 'i_vendor': i_vendor, 'connection_name': connection_name,
+               'CLD': cld, 'disconnect_reason': 'timeout' if failed else 'Normal call clearing',
+               'duration': 0 if failed else duration}
+
+
+def selector_with(*routes):
+    selector = StreamingCDRSelector(reasons)
+    for route in routes:
+        for cdr in route:
+            selector.add(cdr)
+    return selector
+
+
+def stats_by_route(stats):
+    return {(row['i_vendor'], row['connection_name'], row['prefix']): row for row in stats.rows()}
+
+
+@pytest.mark.parametrize('failures, attempts', [(0, 1), (1, 1), (3, 10), (30, 100), (99, 100), (100, 100)])
+def test_failure_lower_bound_is_the_wilson_bound(failures, attempts):
+    stats = RouteStats(selector_with(cdrs(1, 'r', '441234', attempts, failures)).columns())
+    assert stats.failure_lower_bound()[0] == pytest.approx(wilson_lower_bound(failures, attempts))
+
+
+def test_route_statistics():
+    stats = RouteStats(selector_with(cdrs(1, 'r1', '4412345678', 10, 4, duration=30),
+                                     cdrs('1', 'r1', '4412349999', 5, 0, duration=90),
+                                     cdrs(2, 'r1', '4412345678', 3, 3)).columns())
+    routes = stats_by_route(stats)
+    # Vendor ids 1 and '1' are the same vendor, and CLDs are grouped on their first 6 digits
+    assert set(routes) == {('1', 'r1', '441234'), ('2', 'r1', '441234')}
+    route = routes[('1', 'r1', '441234')]
+    assert (route['attempts'], route['failures']) == (15, 4)
+    assert route['asr'] == pytest.approx(11 / 15)
+    assert route['acd'] == pytest.approx((6 * 30 + 5 * 90) / 11)
+    assert routes[('2', 'r1', '441234')]['acd'] == 0
+
+
+def test_only_failures_on_flagged_routes_are_selected():
+    selector = selector_with(cdrs(1, 'bad', '441234', 40, 30),
+                             cdrs(2, 'healthy', '441234', 40, 2),
+                             cdrs(3, 'few', '441234', 5, 5))
+    failed, stats = selector.select(min_attempts=10, max_failure_rate=0.3)
+    assert len(failed) == 30
+    assert {cdr['connection_name'] for cdr in failed} == {'bad'}
+    assert stats.flagged(min_attempts=10, max_failure_rate=0.3).sum() == 1
+
+
+def test_low_asr_flags_a_route():
+    stats = RouteStats(selector_with(cdrs(1, 'r', '441234', 20, 5)).columns())
+    assert not stats.flagged(min_attempts=10, max_failure_rate=0.5).any()
+    assert stats.flagged(min_attempts=10, max_failure_rate=0.5, min_asr=0.8).all()
+
+
+def test_failed_cdrs_not_kept_still_count():
+    selector = StreamingCDRSelector(reasons)
+    for cdr in cdrs(1, 'bad', '441234', 20, 15):
+        selector.add(cdr, keep=lambda cdr: not cdr['call_id'].endswith(('-0', '-1')))
+    failed, stats = selector.select(min_attempts=10, max_failure_rate=0.3)
+    assert len(failed) == 13
+    assert next(stats.rows())['failures'] == 15
+
+
+@pytest.mark.parametrize('duration', [None, '', 'n/a', [1]])
+def test_bad_durations_count_as_unanswered(duration):
+    selector = StreamingCDRSelector(reasons)
+    selector.add({'i_vendor': 1, 'CLD': '441234', 'disconnect_reason': 'Normal call clearing', 'duration': duration})
+    assert next(RouteStats(selector.columns()).rows())['asr'] == 0
+
+
+def test_sparse_and_dense_key_spaces_group_the_same():
+    rng = np.random.default_rng(1)
+    selector = StreamingCDRSelector(reasons)
+    # Many distinct prefixes make the key space sparse, which is grouped with a sort
+    for i in range(3000):
+        selector.add({'i_vendor': int(rng.integers(1, 40)), 'connection_name': f'r{rng.integers(1, 30)}',
+                      'CLD': str(rng.integers(100000, 999999)), 'disconnect_reason': 'timeout' if i % 3 else 'x',
+                      'duration': 0})
+    stats = RouteStats(selector.columns())
+    assert stats.attempts.sum() == 3000
+    assert stats.failures.sum() == 2000
+    assert len(stats) == len(set(zip(*selector.codes)))
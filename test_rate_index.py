@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from rate_index import RateIndex, parse_numbers
+
+
+def rate(prefix, price, name):
+    return {'prefix': prefix, 'price_1': str(price), 'connection_name': name}
+
+
+@pytest.fixture
+def index():
+    return RateIndex([
+        rate('44', 0.02, 'uk-a'),
+        rate('44', 0.01, 'uk-b'),
+        rate('44', 0.03, 'uk-c'),
+        rate('44', 0.015, 'uk-d'),
+        rate('447', 0.05, 'uk-mobile'),
+        rate('4479', 0.04, 'uk-mobile-79'),
+        rate('1', 0.005, 'nanp'),
+        rate('+33', 0.02, 'fr'),
+        rate('bad', 0.01, 'ignored'),
+    ], top_k=3)
+
+
+def test_longest_prefix_wins(index):
+    assert index.lookup('447912345678')[0] == '4479'
+    assert index.lookup('447812345678')[0] == '447'
+    assert index.lookup('442012345678')[0] == '44'
+    assert index.lookup('+33123456789')[0] == '33'
+    assert index.lookup('4')[0] is None
+    assert index.lookup('861234')[0] is None
+
+
+def test_top_k_cheapest_routes_in_price_order(index):
+    _, routes = index.lookup('442012345678')
+    assert [route['connection_name'] for route in routes] == ['uk-b', 'uk-d', 'uk-a']
+    assert 'bad' not in index.prefixes
+
+
+def test_invalid_numbers_do_not_match(index):
+    assert index.lookup_many(['44abc', '', '+4420']).tolist()[:2] == [-1, -1]
+    assert np.isnan(index.cheapest_prices(['abc'])[0])
+    assert index.cheapest_prices(['12125550000'])[0] == 0.005
+
+
+def test_integer_and_string_numbers_resolve_the_same(index):
+    numbers = ['447912345678', '12125550000', '33123456789', '999999999999999', '100000000000000']
+    assert (index.lookup_many(np.array([int(n) for n in numbers], dtype=np.int64)) == index.lookup_many(numbers)).all()
+
+
+@pytest.mark.parametrize('value', [1, 9, 10, 99, 100, 999999999999999, 10 ** 15, 10 ** 15 - 1, 10 ** 18 - 1, 10 ** 18])
+def test_digit_counts_near_powers_of_ten(value):
+    values, lengths = parse_numbers(np.array([value], dtype=np.int64))
+    assert lengths[0] == len(str(value))
+
+
+def test_prefix_near_a_power_of_ten_is_matched():
+    index = RateIndex([rate('999999999999999', 0.1, 'long'), rate('9', 0.2, 'short')])
+    assert index.lookup_many(np.array([999999999999999], dtype=np.int64))[0] == index.prefixes.index('999999999999999')
+
+
+def test_lcr_table_has_one_row_per_prefix_and_rank(index, tmp_path):
+    path = tmp_path / 'lcr.csv'
+    index.write_lcr_table(str(path))
+    rows = path.read_text().splitlines()
+    assert rows[0].startswith('prefix,rank')
+    assert len(rows) == 1 + 3 + 1 + 1 + 1 + 1
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from route_scoring import analyze_routes, parse_rates, price_clusters, price_outliers, score_routes
+
+
+def test_parse_rates_reads_numbers_and_percentages():
+    columns = parse_rates([{'price_1': '0.01', 'asr': '45%'}, {'price_1': 'n/a', 'acd': 3}])
+    assert columns['price'][0] == 0.01 and np.isnan(columns['price'][1])
+    assert columns['asr'][0] == 45 and np.isnan(columns['asr'][1])
+    assert columns['acd'][1] == 3
+
+
+def test_cheaper_route_scores_higher_on_price_alone():
+    columns = parse_rates([{'price_1': '0.03'}, {'price_1': '0.01'}, {'price_1': '0.02'}])
+    scores, used = score_routes(columns)
+    assert used == {'price': 1.0}
+    assert scores == pytest.approx([0.0, 1.0, 0.5])
+
+
+def test_weights_of_missing_criteria_are_spread_over_the_others():
+    columns = parse_rates([{'price_1': '0.01', 'asr': '20'}, {'price_1': '0.02', 'asr': '80'}])
+    scores, used = score_routes(columns)
+    assert set(used) == {'price', 'asr'}
+    assert sum(used.values()) == pytest.approx(1.0)
+    assert used['price'] == pytest.approx(0.6 / 0.75)
+    # Quality can outrank price with custom weights
+    scores, _ = score_routes(columns, {'price': 0.1, 'asr': 0.9})
+    assert scores[1] > scores[0]
+
+
+def test_routes_without_a_criterion_get_a_neutral_value():
+    columns = parse_rates([{'price_1': '0.01', 'asr': '20'}, {'price_1': '0.01', 'asr': '80'}, {'price_1': '0.01'}])
+    scores, _ = score_routes(columns, {'price': 0, 'interval': 0, 'acd': 0, 'pdd': 0})
+    assert scores.tolist() == [0.0, 1.0, 0.5]
+
+
+def test_price_outliers_use_the_median_absolute_deviation():
+    prices = np.array([0.010, 0.011, 0.012, 0.011, 0.010, 0.5, np.nan])
+    assert price_outliers(prices).tolist() == [False] * 5 + [True, False]
+    assert not price_outliers(np.array([0.01, 5.0])).any()
+    # With most prices equal the MAD is 0, only prices far from the median are flagged
+    assert price_outliers(np.array([0.01, 0.01, 0.01, 0.0101, 0.05])).tolist() == [False, False, False, False, True]
+
+
+def test_price_clusters_split_on_large_gaps():
+    prices = np.array([0.300, 0.010, 0.011, np.nan, 0.012, 0.301, 0.013])
+    assert price_clusters(prices).tolist() == [1, 0, 0, -1, 0, 1, 0]
+    assert price_clusters(np.array([np.nan])).tolist() == [-1]
+    assert price_clusters(np.array([0.02, 0.02])).tolist() == [0, 0]
+
+
+def test_analyze_routes_ranks_and_summarizes():
+    rates = [{'price_1': '0.012'}, {'price_1': '0.010'}, {'price_1': '0.30'}, {'price_1': ''}, {'price_1': '0.011'}]
+    result = analyze_routes(rates)
+    assert result['ranking'].tolist()[:3] == [1, 4, 0]
+    stats = result['stats']
+    assert (stats['routes'], stats['min_price'], stats['max_price']) == (5, 0.01, 0.30)
+    assert stats['clusters'] == [(0, 0.01, 0.012, 3), (1, 0.3, 0.3, 1)]
+
+
+def test_analyze_routes_without_rates():
+    stats = analyze_routes([])['stats']
+    assert stats['routes'] == 0 and stats['min_price'] is None and stats['clusters'] == []
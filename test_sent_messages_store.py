@@ -0,0 +1,89 @@
+import pytest
+
+import sent_messages_store
+from sent_messages_store import SentMessageStore, make_message_id
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sent_messages_store.time, 'time', clock)
+    return clock
+
+
+def read_ids(path):
+    with open(path) as f:
+        return [line.split('\t')[0] for line in f]
+
+
+def test_ids_survive_a_reload(tmp_path, clock):
+    path = str(tmp_path / 'sent.txt')
+    with SentMessageStore(path) as store:
+        store.add(make_message_id('c1', '4412', 'v1'))
+        store.add(make_message_id('c1', '4412', 'v1'))
+    store = SentMessageStore(path)
+    assert 'c1-4412-v1' in store
+    assert len(store) == 1
+
+
+def test_expired_ids_are_dropped_on_load(tmp_path, clock):
+    path = str(tmp_path / 'sent.txt')
+    with SentMessageStore(path, ttl_days=1) as store:
+        store.add('old')
+    clock.now += 3600
+    with SentMessageStore(path, ttl_days=1) as store:
+        store.add('new')
+    clock.now += 86400 - 1800
+    store = SentMessageStore(path, ttl_days=1)
+    assert 'old' not in store
+    assert 'new' in store
+
+
+def test_old_format_is_imported_and_rewritten(tmp_path, clock):
+    path = tmp_path / 'sent.txt'
+    path.write_text('c1-4412-v1\nc2-4413-v2\n')
+    store = SentMessageStore(str(path))
+    assert 'c1-4412-v1' in store and 'c2-4413-v2' in store
+    assert all('\t' in line for line in path.read_text().splitlines())
+
+
+def test_long_running_store_evicts_once_a_day(tmp_path, clock):
+    path = str(tmp_path / 'sent.txt')
+    store = SentMessageStore(path, ttl_days=1)
+    store.add('first')
+    store.flush()
+    clock.now += 3600
+    store.add('second')
+    store.flush()
+    assert read_ids(path) == ['first', 'second']
+
+    # The poller only flushes, the store is never reloaded
+    clock.now += sent_messages_store.compact_interval - 1800
+    store.add('third')
+    store.flush()
+    assert 'first' not in store
+    assert len(store) == 2
+    assert read_ids(path) == ['second', 'third']
+
+
+def test_long_running_store_compacts_every_n_appends(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(sent_messages_store, 'compact_every', 4)
+    path = str(tmp_path / 'sent.txt')
+    store = SentMessageStore(path, ttl_days=0.01, flush_every=2)
+    store.add('expired')
+    store.flush()
+    clock.now += 1000
+    for message_id in ('a', 'b', 'c'):
+        store.add(message_id)
+    assert read_ids(path) == ['expired', 'a', 'b']
+    store.flush()
+    assert 'expired' not in store
+    assert read_ids(path) == ['a', 'b', 'c']
@@ -0,0 +1,227 @@
+import threading
+
+import pytest
+import requests
+
+import tcxc_client
+from tcxc_client import AdaptiveGovernor, TCXCClient, fan_out
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b'{}'
+        self.request = requests.Request('POST', 'http://tcxc.test/x', data='a=1').prepare()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """Returns or raises the queued outcomes in order."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(tcxc_client.time, 'sleep', lambda seconds: None)
+
+
+def make_client(*outcomes, initial=2):
+    client = TCXCClient('user', 'key', 'http://tcxc.test', governor=AdaptiveGovernor(initial=initial, cooldown=0))
+    client.session = FakeSession(*outcomes)
+    return client
+
+
+def test_release_decreases_limit_on_throttle_and_grows_on_success():
+    governor = AdaptiveGovernor(initial=8, minimum=1, maximum=10, cooldown=0)
+    governor.acquire('/x')
+    governor.release(throttled=True)
+    assert governor.limit == 4
+    assert governor.in_flight == 0
+    for _ in range(4):
+        governor.acquire('/x')
+        governor.release()
+    assert 4.9 < governor.limit < 5.1
+
+
+def test_limit_stays_within_bounds():
+    governor = AdaptiveGovernor(initial=2, minimum=1, maximum=3, cooldown=0)
+    for _ in range(5):
+        governor.acquire('/x')
+        governor.release(throttled=True)
+    assert governor.limit == 1
+    for _ in range(50):
+        governor.acquire('/x')
+        governor.release()
+    assert governor.limit == 3
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ContentDecodingError('bad gzip'),
+    requests.exceptions.TooManyRedirects('loop'),
+    requests.exceptions.InvalidURL('bad url'),
+])
+def test_non_network_errors_release_the_slot_and_are_not_retried(error):
+    client = make_client(error, error, error)
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            client.post('/buyers/interconnect')
+    assert client.governor.in_flight == 0
+    assert client.session.calls == 3
+
+
+def test_chunked_encoding_errors_do_not_leak_slots():
+    error = requests.exceptions.ChunkedEncodingError('connection broken')
+    client = make_client(*[error] * 2, FakeResponse(200))
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            client.post('/buyers/interconnect')
+    assert client.governor.in_flight == 0
+    # With the slots back, the third request does not block
+    assert client.post('/buyers/interconnect').status_code == 200
+
+
+def test_metrics_error_releases_the_slot(monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('metrics failed')
+
+    monkeypatch.setattr(tcxc_client.metrics, 'observe_request', broken)
+    client = make_client(FakeResponse(200))
+    with pytest.raises(RuntimeError):
+        client.post('/buyers/interconnect')
+    assert client.governor.in_flight == 0
+
+
+def test_reads_are_retried_on_connection_errors():
+    client = make_client(requests.ConnectionError('reset'), FakeResponse(503), FakeResponse(200))
+    assert client.post('/marketview/search').status_code == 200
+    assert client.session.calls == 3
+    assert client.governor.in_flight == 0
+
+
+def test_writes_are_retried_only_on_429():
+    throttled = FakeResponse(429)
+    client = make_client(throttled, FakeResponse(503))
+    assert client.post('/buyers/interconnect').status_code == 503
+    assert client.session.calls == 2
+    assert throttled.closed
+
+    client = make_client(requests.ConnectionError('reset'))
+    with pytest.raises(requests.ConnectionError):
+        client.post('/buyers/interconnect')
+    assert client.governor.in_flight == 0
+
+
+def test_retries_stop_after_max_retries():
+    client = make_client(*[FakeResponse(503) for _ in range(tcxc_client.max_retries + 1)])
+    assert client.post('/marketview/search').status_code == 503
+    assert client.session.calls == tcxc_client.max_retries + 1
+
+
+def test_fan_out_keeps_max_in_flight():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        # time.sleep is patched out by no_backoff
+        threading.Event().wait(0.005)
+        with lock:
+            running.remove(item)
+        if item == 3:
+            raise ValueError(item)
+        return item * 2
+
+    results = {item: (result, error) for item, result, error in fan_out(call, range(20), max_in_flight=4)}
+    assert len(results) == 20
+    assert 1 < max(peak) <= 4
+    assert results[5] == (10, None)
+    assert isinstance(results[3][1], ValueError)
+
+
+def test_fan_out_consumes_items_lazily():
+    consumed = []
+
+    def items():
+        for item in range(1000):
+            consumed.append(item)
+            yield item
+
+    results = fan_out(lambda item: item, items(), max_in_flight=3)
+    next(results)
+    assert len(consumed) <= 4
+    results.close()
+
+
+class PagedClient:
+    """Serves items 0..total-1 in pages by 'pager' and 'off', like the list endpoints."""
+
+    def __init__(self, total, ignore_off=False, fail_at=None):
+        self.total = total
+        self.ignore_off = ignore_off
+        self.fail_at = fail_at
+        self.offsets = []
+
+    def post(self, endpoint, data=None):
+        off = 0 if self.ignore_off else int(data['off'])
+        self.offsets.append(off)
+        response = FakeResponse(500 if off == self.fail_at else 200)
+        items = list(range(off, min(off + int(data['pager']), self.total)))
+        response.json = lambda: {'status': 'success', 'rates': items}
+        return response
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+@pytest.mark.parametrize('total', [0, 1, 99, 100, 101, 250])
+def test_paginate_yields_every_item_once(total, prefetch):
+    client = PagedClient(total)
+    items = list(tcxc_client.paginate(client, '/marketview/search', {'prefix': '44'}, 'rates', page_size=100, prefetch=prefetch))
+    assert items == list(range(total))
+    # One request per page, plus one that comes back empty when the last page is full
+    assert sorted(client.offsets) == list(range(0, total // 100 * 100 + 1, 100))
+
+
+def test_paginate_stops_when_the_api_ignores_off():
+    client = PagedClient(500, ignore_off=True)
+    items = list(tcxc_client.paginate(client, '/marketview/search', {}, 'rates', page_size=100))
+    assert items == list(range(100))
+
+
+def test_paginate_raises_on_a_failed_page():
+    client = PagedClient(500, fail_at=200)
+    items = []
+    with pytest.raises(tcxc_client.TCXCAPIError):
+        for item in tcxc_client.paginate(client, '/marketview/search', {}, 'rates', page_size=100):
+            items.append(item)
+    assert items == list(range(200))
+
+
+def test_paginate_requests_the_next_page_while_the_current_one_is_consumed():
+    requested = threading.Event()
+
+    class SlowConsumerClient(PagedClient):
+        def post(self, endpoint, data=None):
+            if data['off'] == '100':
+                requested.set()
+            return super().post(endpoint, data)
+
+    pages = tcxc_client.paginate(SlowConsumerClient(300), '/marketview/search', {}, 'rates', page_size=100)
+    assert next(pages) == 0
+    assert requested.wait(5)
+    pages.close()
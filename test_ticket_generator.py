@@ -0,0 +1,68 @@
+from ticket_generator import LocalGenerator, TicketTemplateCache, fill_summary, summary_key
+from trouble_tickets import aggregate_failures, describe_groups
+
+
+class CountingGenerator(LocalGenerator):
+    def __init__(self):
+        super().__init__()
+        self.summaries = 0
+        self.templates = 0
+
+    def summary(self, routes):
+        self.summaries += 1
+        return super().summary(routes)
+
+    def template(self, connection_name, disconnect_reason):
+        self.templates += 1
+        return super().template(connection_name, disconnect_reason)
+
+
+def cdr(call_id, i_vendor, connection_name, disconnect_reason, cld='441234567890'):
+    return {'call_id': call_id, 'i_vendor': i_vendor, 'connection_name': connection_name,
+            'disconnect_reason': disconnect_reason, 'CLD': cld, 'connect_time': f'2026-10-18 10:00:{call_id:02d}'}
+
+
+def test_summary_key_ignores_counts_order_and_spacing():
+    first = aggregate_failures([cdr(1, 7, 'UK Mobile', 'timeout'), cdr(2, 7, 'FR Fixed', 'unspecified')])
+    second = aggregate_failures([cdr(3, 7, 'fr  fixed', 'Unspecified'), cdr(4, 7, 'UK Mobile', 'timeout'),
+                                 cdr(5, 7, 'UK Mobile', 'timeout')])
+    assert summary_key(7, first[7]) == summary_key(7, second[7])
+    assert summary_key(7, first[7]) != summary_key(8, first[7])
+
+
+def test_aggregated_summaries_are_cached_across_windows(tmp_path):
+    path = str(tmp_path / 'templates.json')
+    generator = CountingGenerator()
+    window = aggregate_failures([cdr(1, 7, 'UK Mobile', 'timeout'), cdr(2, 8, 'FR Fixed', 'unspecified')])
+    messages = TicketTemplateCache(generator, path).render_summaries(window, describe_groups)
+    assert generator.summaries == 2
+    assert 'Failed Calls: 1' in messages[7]
+
+    # A later run with more failures on the same routes reuses the saved summaries with the new details
+    window = aggregate_failures([cdr(i, 7, 'UK Mobile', 'timeout') for i in range(3)] + [cdr(9, 9, 'DE Fixed', 'timeout')])
+    messages = TicketTemplateCache(generator, path).render_summaries(window, describe_groups)
+    assert generator.summaries == 3
+    assert 'Failed Calls: 3' in messages[7]
+    assert '{details}' not in messages[9]
+
+
+def test_failed_generation_returns_none():
+    class BrokenGenerator(LocalGenerator):
+        def summary(self, routes):
+            raise RuntimeError('LLM unavailable')
+
+    window = aggregate_failures([cdr(1, 7, 'UK Mobile', 'timeout')])
+    assert TicketTemplateCache(BrokenGenerator(), None).render_summaries(window, describe_groups) == {7: None}
+
+
+def test_summary_without_placeholder_still_carries_details():
+    assert fill_summary('Dear Vendor,', '- Route: UK') == 'Dear Vendor,\n\nError Details:\n- Route: UK'
+
+
+def test_per_call_templates_are_generated_once_per_route_and_reason(tmp_path):
+    generator = CountingGenerator()
+    cache = TicketTemplateCache(generator, str(tmp_path / 'templates.json'))
+    cdrs = [cdr(1, 7, 'UK Mobile', 'timeout', '4411'), cdr(2, 7, 'UK  mobile', 'Timeout', '4422')]
+    messages = cache.render_many(cdrs)
+    assert generator.templates == 1
+    assert '4411' in messages[0] and '4422' in messages[1]
@@ -0,0 +1,189 @@
+"""
+Trouble Ticket Message Generator
+
+Cached and concurrent message generation for automate_low_qos_tt_openai.py.
+
+Most trouble tickets differ only in the destination number and the timestamp, so the language
+model is asked once per normalized (connection_name, disconnect_reason) pair for a template with
+{CLD} and {connect_time} placeholders. Templates are cached in memory and in a JSON file, and
+the CDR details are filled in locally. Cache misses are generated on a bounded worker pool.
+
+Aggregated tickets are cached the same way. The summary of a vendor is a template with a
+{details} placeholder, keyed on the vendor and its normalized set of (route, disconnect reason)
+pairs. The counts, prefixes and time range of the window are filled in locally, so a vendor
+failing again on the same routes for the same reasons reuses the summary of an earlier window.
+
+Generators are pluggable: OpenAIGenerator calls the completion API, LocalGenerator is an
+offline stand-in with optional simulated latency for tests and benchmarks.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from tcxc_client import fan_out
+from tcxc_metrics import metrics
+
+PLACEHOLDERS = ('{CLD}', '{connect_time}')
+DETAILS_PLACEHOLDER = '{details}'
+
+
+class OpenAIGenerator:
+    """Generate ticket texts with the OpenAI completion API."""
+
+    def __init__(self, model="text-davinci-002", max_tokens=500):
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def complete(self, prompt):
+        from openai.api_resources.completion import Completion
+        with metrics.stage('llm'):
+            message_completion = Completion.create(model=self.model, prompt=prompt, max_tokens=self.max_tokens)
+        return message_completion.choices[0].text.strip()
+
+    def template(self, connection_name, disconnect_reason):
+        prompt = (f"We need to inform a vendor/seller about a call failure in professional written way. "
+                  f"A call on route {connection_name} failed. The disconnect reason was: {disconnect_reason}. "
+                  f"Write the literal placeholder {{CLD}} where the destination number goes and the literal placeholder "
+                  f"{{connect_time}} where the timestamp of occurrence goes. Ask them to confirm when the issue has been "
+                  f"fixed and do NOT end the message with Best Regards, name etc..")
+        return self.complete(prompt)
+
+    def summary(self, routes):
+        failures = '\n'.join(f"- Route: {connection_name}, Disconnect Reason: {disconnect_reason}"
+                             for connection_name, disconnect_reason in routes)
+        prompt = (f"We need to inform a vendor/seller about call failures on their routes in professional written way. "
+                  f"Calls failed on these routes with these disconnect reasons:\n{failures}\nSummarize the impact. Write the "
+                  f"literal placeholder {{details}} where the list of failed calls per route goes. Ask them to confirm when "
+                  f"the issues have been fixed and do NOT end the message with Best Regards, name etc..")
+        return self.complete(prompt)
+
+
+class LocalGenerator:
+    """Offline stand-in for OpenAIGenerator, latency seconds are slept per call to mimic the API."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def template(self, connection_name, disconnect_reason):
+        time.sleep(self.latency)
+        return (f"Dear Vendor,\n\nThe call to destination number {{CLD}} on your route {connection_name} failed "
+                f"with disconnect reason '{disconnect_reason}' at {{connect_time}}. "
+                f"Please confirm once the issue has been fixed.")
+
+    def summary(self, routes):
+        time.sleep(self.latency)
+        return ("Dear Vendor,\n\nWe detected the following call failures on your routes:\n{details}\n\n"
+                "Please confirm once the issues have been fixed.")
+
+
+def template_key(connection_name, disconnect_reason):
+    """Normalize the (connection_name, disconnect_reason) pair used as cache key."""
+    return f"{' '.join(str(connection_name).split()).lower()}|{' '.join(str(disconnect_reason).split()).lower()}"
+
+
+def summary_key(i_vendor, groups):
+    """Normalize a vendor and the (connection_name, disconnect_reason) pairs of its failure groups into a cache key."""
+    pairs = sorted({template_key(group.connection_name, group.disconnect_reason) for group in groups.values()})
+    return f"summary|{i_vendor}|" + '||'.join(pairs)
+
+
+def fill_summary(template, details):
+    # Summaries missing the placeholder still carry the failure details
+    if DETAILS_PLACEHOLDER not in template:
+        template += "\n\nError Details:\n" + DETAILS_PLACEHOLDER
+    return template.replace(DETAILS_PLACEHOLDER, details)
+
+
+def fill_template(template, cdr):
+    # Templates missing a placeholder still carry the call details
+    if not all(placeholder in template for placeholder in PLACEHOLDERS):
+        template += "\n\nDestination Number: {CLD}\nTimestamp of Occurrence: {connect_time}"
+    return template.replace('{CLD}', str(cdr['CLD'])).replace('{connect_time}', str(cdr['connect_time']))
+
+
+class TicketTemplateCache:
+    """Template cache keyed on the normalized (connection_name, disconnect_reason) pair, and on summary_key()."""
+
+    def __init__(self, generator, path='ticket_templates.json', max_workers=4):
+        self.generator = generator
+        self.path = path
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._templates = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self._templates = json.load(f)
+            except ValueError:
+                logging.warning(f"Ignoring unreadable ticket template cache {path}")
+
+    def _generate(self, cdr):
+        template = self.generator.template(cdr['connection_name'], cdr['disconnect_reason'])
+        with self._lock:
+            self._templates[template_key(cdr['connection_name'], cdr['disconnect_reason'])] = template
+        return template
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._templates, f)
+            os.replace(tmp_path, self.path)
+
+    def render_many(self, cdrs):
+        """Return the message for every CDR, generating missing templates concurrently.
+
+        Returns a list aligned with cdrs; the entry is None when generation failed for that pair.
+        """
+        misses = {}
+        for cdr in cdrs:
+            key = template_key(cdr['connection_name'], cdr['disconnect_reason'])
+            if key not in self._templates and key not in misses:
+                misses[key] = cdr
+        if misses:
+            logging.info(f"Generating {len(misses)} ticket templates ({len(cdrs)} tickets).")
+            for cdr, _, error in fan_out(self._generate, misses.values(), self.max_workers):
+                if error:
+                    logging.error(f"Ticket template generation failed for route {cdr['connection_name']}: {error}")
+            self.save()
+        messages = []
+        for cdr in cdrs:
+            template = self._templates.get(template_key(cdr['connection_name'], cdr['disconnect_reason']))
+            messages.append(None if template is None else fill_template(template, cdr))
+        return messages
+
+    def render(self, cdr):
+        return self.render_many([cdr])[0]
+
+    def _generate_summary(self, item):
+        key, groups = item
+        template = self.generator.summary(sorted({(group.connection_name, group.disconnect_reason) for group in groups.values()},
+                                                 key=str))
+        with self._lock:
+            self._templates[key] = template
+        return template
+
+    def render_summaries(self, vendors, describe):
+        """Return {i_vendor: message} for {i_vendor: failure groups}, generating missing summaries concurrently.
+
+        describe(groups) returns the failure details filled into the summary. The message is None when
+        generation failed for that vendor.
+        """
+        keys = {i_vendor: summary_key(i_vendor, groups) for i_vendor, groups in vendors.items()}
+        misses = {key: vendors[i_vendor] for i_vendor, key in keys.items() if key not in self._templates}
+        if misses:
+            logging.info(f"Generating {len(misses)} ticket summaries ({len(vendors)} vendors).")
+            for (key, _), _, error in fan_out(self._generate_summary, misses.items(), self.max_workers):
+                if error:
+                    logging.error(f"Ticket summary generation failed for {key}: {error}")
+            self.save()
+        messages = {}
+        for i_vendor, key in keys.items():
+            template = self._templates.get(key)
+            messages[i_vendor] = None if template is None else fill_summary(template, describe(vendors[i_vendor]))
+        return messages
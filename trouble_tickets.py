@@ -0,0 +1,95 @@
+"""
+Aggregated Trouble Tickets
+
+Aggregation stage for the trouble ticket scripts. Instead of one /buyers/message/send call per
+failed CDR, failures in a window are grouped by vendor (i_vendor), and inside each vendor by
+route (connection_name) and disconnect reason. Each vendor then gets a single ticket listing,
+per route and reason, the number of failed calls, the affected destination prefixes and the
+time range. The call ids of every grouped CDR are kept so they can all be marked as handled.
+"""
+
+from collections import Counter
+
+# Number of leading CLD digits reported as the affected destination prefix
+cld_prefix_length = 6
+
+# Maximum number of affected prefixes listed per route and reason
+max_prefixes_listed = 10
+
+
+class FailureGroup:
+    """Failed calls of one vendor on one route with the same disconnect reason."""
+
+    def __init__(self, connection_name, disconnect_reason):
+        self.connection_name = connection_name
+        self.disconnect_reason = disconnect_reason
+        self.count = 0
+        self.prefixes = Counter()
+        self.first_time = None
+        self.last_time = None
+        self.cdrs = []
+
+    def add(self, cdr):
+        self.count += 1
+        self.prefixes[str(cdr.get('CLD', ''))[:cld_prefix_length]] += 1
+        connect_time = cdr.get('connect_time')
+        if connect_time:
+            if self.first_time is None or connect_time < self.first_time:
+                self.first_time = connect_time
+            if self.last_time is None or connect_time > self.last_time:
+                self.last_time = connect_time
+        self.cdrs.append(cdr)
+
+
+def aggregate_failures(cdrs):
+    """Group CDRs into {i_vendor: {(connection_name, disconnect_reason): FailureGroup}}."""
+    vendors = {}
+    for cdr in cdrs:
+        key = (cdr.get('connection_name'), cdr.get('disconnect_reason'))
+        groups = vendors.setdefault(cdr['i_vendor'], {})
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = FailureGroup(*key)
+        group.add(cdr)
+    return vendors
+
+
+def describe_groups(groups):
+    """Return the per-route failure details of one vendor as plain text."""
+    lines = []
+    for group in sorted(groups.values(), key=lambda g: g.count, reverse=True):
+        prefixes = ', '.join(f"{prefix} ({count})" for prefix, count in group.prefixes.most_common(max_prefixes_listed))
+        if len(group.prefixes) > max_prefixes_listed:
+            prefixes += f", and {len(group.prefixes) - max_prefixes_listed} more"
+        lines.append(f"- Route: {group.connection_name}\n"
+                     f"  Disconnect Reason: {group.disconnect_reason}\n"
+                     f"  Failed Calls: {group.count}\n"
+                     f"  Affected Destination Prefixes: {prefixes}\n"
+                     f"  Time Range: {group.first_time} to {group.last_time}")
+    return "\n".join(lines)
+
+
+def format_ticket(ticket_id, groups):
+    """Return the (subject, message) of the aggregated ticket for one vendor."""
+    total = sum(group.count for group in groups.values())
+    routes = len({group.connection_name for group in groups.values()})
+    subject = f"Trouble Ticket #{ticket_id}: {total} Call Failures on {routes} Route(s)"
+    message = (f"Dear Vendor,\n\nWe are writing to inform you of a detected issue concerning the quality of service on your routes. "
+               f"Our monitoring systems have identified {total} failed calls in the last monitoring window.\n\n"
+               f"Error Details:\n{describe_groups(groups)}\n\n"
+               f"We request your immediate attention and action to resolve this issue as it is affecting our service delivery. "
+               f"We appreciate your prompt response and solution to this matter.\n\nThank you for your cooperation.")
+    return subject, message
+
+
+def send_error(message_response):
+    """Return why a /buyers/message/send response failed, or None when the ticket was sent."""
+    if message_response.status_code != 200:
+        return f"HTTP {message_response.status_code}"
+    try:
+        message_result = message_response.json()
+    except ValueError:
+        return "Error decoding the message send response as JSON"
+    if message_result.get('status') != 'success':
+        return f"Message send returned an error. Details: {message_result}"
+    return None